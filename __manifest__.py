@@ -5,9 +5,10 @@
     "summary": "Generate charts and visualizations using natural language prompts.",
     "description": "This module provides functionalities to generate charts and visualizations based on user input and natural language prompts.",
     "author": "Ahmad Mustapha, Ali Sahili",
-    "depends": ["base", "web", "account"],
+    "depends": ["base", "web", "bus", "account"],
     "data": [
         "security/ir.model.access.csv",
+        "data/chartly_cron.xml",
         "views/chat.xml",
         "views/res_config_settings_view.xml",
         "views/menus.xml",
@@ -1,21 +1,64 @@
-from odoo import http
-from odoo.http import request
+from odoo import http, api
+from odoo.http import request, Response
+from odoo.tools import date_utils
 import logging
-import os
+import json
+import queue
+import threading
 from odoo.addons.chartly.core.openai import get_openai_client
-from odoo.addons.chartly.core.tools import get_tools
+from odoo.addons.chartly.core.tools import get_tools, tools_context, run_tool_calls, get_max_tool_iterations
+from odoo.addons.chartly.core.utils import get_script_cache_stats
+from odoo.addons.chartly.core.model_index import get_model_index
+from odoo.addons.chartly.core.field_pruning import get_pruning_stats
+from odoo.addons.chartly.core.prompt_prefix import get_prompt_cache_stats
 
 _logger = logging.getLogger(__name__)
 
-PROMPT_FILENAME = "main_prompt.txt"
+# Chart images never change once stored, so browsers may keep them for a long time
+IMAGE_CACHE_MAX_AGE = 7 * 24 * 3600
+
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+# Fields returned to the chat widget; the image itself is fetched through its URL
+MESSAGE_FIELDS = ['id', 'content', 'sender', 'created_at', 'cost', 'has_image', 'state']
 
 class ChartlyController(http.Controller):
 
-    def _get_system_message(self):
-        filepath = os.path.join(os.path.dirname(__file__), PROMPT_FILENAME)
-        with open(filepath, "r") as f:
-            system_prompt = f.read()
-        return system_prompt
+    def _message_to_dict(self, message):
+        return self._message_values_to_dict(message.read(MESSAGE_FIELDS)[0])
+
+    def _message_values_to_dict(self, values):
+        message_dict = {
+            'id': values['id'],
+            'content': values['content'],
+            'sender': values['sender'],
+            'created_at': values['created_at'].isoformat() if values['created_at'] else None,
+            'cost': values['cost'] or 0,
+            'state': values['state'],
+        }
+        if values['has_image']:
+            message_dict.update({"image_url": self._image_url(values['id'])})
+        return message_dict
+
+    def _image_url(self, message_id):
+        return f"/chartly/image/{message_id}"
+
+    def _create_user_message(self, chat, message_content):
+        """Store the user message, naming the chat after it if this is the first message"""
+        # Update title if this is the first message
+        if not chat.title and not chat.messages and len(message_content.strip()) > 3:
+            title = message_content.strip()[:50] + "..." if len(message_content.strip()) > 50 else message_content.strip()
+            chat.title = title
+        
+        return chat.env['chartly.chat.message'].create({
+            'chat_id': chat.id,
+            'content': message_content,
+            'sender': 'user'
+        })
+
+    def _create_ai_message(self, env, chat_id, ai_result):
+        Message = env['chartly.chat.message']
+        return Message.create(dict(Message._ai_result_values(ai_result), chat_id=chat_id))
 
     @http.route('/chartly/send_message', type='json', auth='user', methods=['POST'], csrf=False)
     def send_message(self, chat_id, message_content):
@@ -28,104 +71,209 @@ class ChartlyController(http.Controller):
             if not chat.exists():
                 return {'error': 'Chat not found'}
             
-            # Update title if this is the first message
-            if not chat.title and not chat.messages and len(message_content.strip()) > 3:
-                title = message_content.strip()[:50] + "..." if len(message_content.strip()) > 50 else message_content.strip()
-                chat.title = title
-            
             # Create user message
-            user_message = request.env['chartly.chat.message'].create({
-                'chat_id': chat_id,
-                'content': message_content,
-                'sender': 'user'
-            })
+            user_message = self._create_user_message(chat, message_content)
             
             # Get AI response via OpenAIClient
             openai_client = get_openai_client(request.env)
-            chat_history = openai_client.prepare_chat_history(chat.messages)
-            chat_history = openai_client.add_system_message(chat_history, self._get_system_message())
-            chat_history = openai_client.add_user_message(chat_history, message_content)
+            chat_history = chat.prepare_messages(openai_client, user_message)
             tools_map, tools_descriptions = get_tools()
             
-            ai_result = openai_client.chat_completion_with_tools(chat_history, tools_descriptions, tools_map)
-            
-            # Extract cost from AI result
-            ai_cost = ai_result.get('cost', 0)
-            
-            if ai_result.get('success'):
-                ai_content = ai_result.get('content', 'No response from AI.')
-            else:
-                ai_content = f"Error: {ai_result.get('error', 'Unknown error')}"
+            ai_result = openai_client.chat_completion_with_tools(
+                chat_history, tools_descriptions, tools_map,
+                max_iterations=get_max_tool_iterations(request.env), run_tool_calls=run_tool_calls
+            )
             
-            ai_message_dict = {
-                'chat_id': chat_id,
-                'content': ai_content,
-                'sender': 'ai',
-                'cost': ai_cost,
+            # Create AI message
+            ai_message = self._create_ai_message(request.env, chat.id, ai_result)
+
+            return {
+                'success': True,
+                'user_message': self._message_to_dict(user_message),
+                'ai_message': self._message_to_dict(ai_message),
+                'total_cost': chat.total_cost or 0,
             }
+            
+        except Exception as e:
+            _logger.error(f"Error in send_message: {str(e)}")
+            return {'success': False, 'error': str(e)}
 
-            if "image" in ai_result:
-                ai_message_dict.update({
-                'has_image': True,
-                'image': ai_result["image"]
-            })
+    @http.route('/chartly/send_message_async', type='json', auth='user', methods=['POST'], csrf=False)
+    def send_message_async(self, chat_id, message_content):
+        """Store the message and queue the AI answer as a background job.
 
-            # Create AI message
-            ai_message = request.env['chartly.chat.message'].create(ai_message_dict)
+        Returns right away with a pending AI message; its result is announced on the bus
+        and can be polled from `/chartly/job_status`.
+        """
+        try:
+            if not chat_id or not message_content:
+                return {'error': 'Missing required parameters'}
 
-            returned_ai_message = {
-                    'id': ai_message.id,
-                    'content': ai_message.content,
-                    'sender': ai_message.sender,
-                    'created_at': ai_message.created_at.isoformat() if ai_message.created_at else None,
-                    'cost': ai_message.cost or 0,
-                }
-            if ai_message.has_image:
-                returned_ai_message.update({"image": ai_message.image})
+            chat = request.env['chartly.chat'].browse(int(chat_id))
+            if not chat.exists():
+                return {'error': 'Chat not found'}
 
-            # Refresh total_cost
-            chat.invalidate_recordset(['total_cost'])
+            user_message = self._create_user_message(chat, message_content)
+            job = request.env['chartly.job'].enqueue(chat, user_message)
 
             return {
                 'success': True,
-                'user_message': {
-                    'id': user_message.id,
-                    'content': user_message.content,
-                    'sender': user_message.sender,
-                    'created_at': user_message.created_at.isoformat() if user_message.created_at else None,
-                    'cost': 0,
-                },
-                'ai_message': returned_ai_message,
+                'job_id': job.id,
+                'user_message': self._message_to_dict(user_message),
+                'ai_message': self._message_to_dict(job.message_id),
                 'total_cost': chat.total_cost or 0,
             }
-            
+
         except Exception as e:
-            _logger.error(f"Error in send_message: {str(e)}")
+            _logger.error(f"Error in send_message_async: {str(e)}")
             return {'success': False, 'error': str(e)}
 
+    @http.route('/chartly/job_status', type='json', auth='user', methods=['POST'], csrf=False)
+    def job_status(self, job_id=None, message_id=None):
+        """State of a background AI turn, given by its id or its pending message, with the message once it is over"""
+        try:
+            if not job_id and not message_id:
+                return {'success': False, 'error': 'Missing job_id or message_id parameter'}
+
+            domain = [('id', '=', int(job_id))] if job_id else [('message_id', '=', int(message_id))]
+            job = request.env['chartly.job'].search(domain + [('user_id', '=', request.env.uid)], limit=1)
+            if not job:
+                return {'success': False, 'error': 'Job not found'}
+
+            result = {'success': True, 'state': job.state}
+            if job.state in ('done', 'failed'):
+                result.update({
+                    'ai_message': self._message_to_dict(job.message_id),
+                    'total_cost': job.chat_id.total_cost or 0,
+                })
+            return result
+
+        except Exception as e:
+            _logger.error(f"Error in job_status: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+    @http.route('/chartly/send_message_stream', type='http', auth='user', methods=['POST'], csrf=False)
+    def send_message_stream(self, **kwargs):
+        """Send a message to the chat and stream the AI response as server-sent events.
+
+        Emits `progress` events for the pipeline stages, `token` events for the answer text,
+        then a final `done` event carrying the same payload as `/chartly/send_message`.
+        The route skips the CSRF token, so it only accepts JSON bodies, which a cross-site
+        form can't send.
+        """
+        if request.httprequest.mimetype != 'application/json':
+            return Response("Expected a JSON body", status=415, mimetype='text/plain')
+        try:
+            params = json.loads(request.httprequest.get_data(as_text=True) or '{}')
+            chat_id = params.get('chat_id')
+            message_content = params.get('message_content')
+            if not chat_id or not message_content:
+                return self._sse_response([self._sse_event('error', {'success': False, 'error': 'Missing required parameters'})])
+            
+            chat = request.env['chartly.chat'].browse(int(chat_id))
+            if not chat.exists():
+                return self._sse_response([self._sse_event('error', {'success': False, 'error': 'Chat not found'})])
+            
+            user_message = self._create_user_message(chat, message_content)
+            openai_client = get_openai_client(request.env)
+            chat_history = chat.prepare_messages(openai_client, user_message)
+
+            # The request cursor is committed and closed before the body is streamed,
+            # so the AI turn runs on its own cursor.
+            events = self._stream_ai_response(
+                request.env.registry, request.env.uid, dict(request.env.context),
+                chat.id, openai_client, chat_history, self._message_to_dict(user_message)
+            )
+            return self._sse_response(events)
+            
+        except Exception as e:
+            _logger.error(f"Error in send_message_stream: {str(e)}")
+            return self._sse_response([self._sse_event('error', {'success': False, 'error': str(e)})])
+
+    def _sse_event(self, event, data):
+        return f"event: {event}\ndata: {json.dumps(data, default=date_utils.json_default)}\n\n"
+
+    def _sse_response(self, events):
+        return Response(events, mimetype='text/event-stream', headers=[
+            ('Cache-Control', 'no-cache'),
+            ('X-Accel-Buffering', 'no'),
+        ])
+
+    def _stream_ai_response(self, registry, uid, context, chat_id, openai_client, chat_history, user_message):
+        events = queue.Queue()
+
+        def run():
+            result = None
+            try:
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, uid, context)
+                    tools_map, tools_descriptions = get_tools()
+                    progress = lambda message: events.put(('progress', {'message': message}))
+                    ai_result = None
+
+                    with tools_context(env=env, openai_client=openai_client, progress=progress):
+                        events_stream = openai_client.chat_completion_with_tools_stream(
+                            chat_history, tools_descriptions, tools_map,
+                            max_iterations=get_max_tool_iterations(env), run_tool_calls=run_tool_calls
+                        )
+                        for event in events_stream:
+                            if event['type'] == 'token':
+                                events.put(('token', {'content': event['content']}))
+                            elif event['type'] == 'done':
+                                ai_result = event['response']
+
+                    ai_message = self._create_ai_message(env, chat_id, ai_result)
+                    result = ('done', {
+                        'success': True,
+                        'user_message': user_message,
+                        'ai_message': self._message_to_dict(ai_message),
+                        'total_cost': env['chartly.chat'].browse(chat_id).total_cost or 0,
+                    })
+            except Exception as e:
+                _logger.error(f"Error in send_message_stream: {str(e)}")
+                result = ('error', {'success': False, 'error': str(e)})
+            finally:
+                events.put(result)
+                events.put(None)
+
+        threading.Thread(target=run, name='chartly-stream', daemon=True).start()
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            if item:
+                yield self._sse_event(*item)
+
     @http.route('/chartly/get_messages', type='json', auth='user', methods=['POST'], csrf=False)
-    def get_messages(self, chat_id):
-        """Get all messages for a chat"""
+    def get_messages(self, chat_id, before_id=None, after_id=None, limit=None):
+        """Get a page of messages for a chat, oldest first.
+
+        Without cursor the newest page is returned; `before_id` pages towards older messages
+        and `after_id` returns the messages created since the last one the client has seen.
+        `has_more` tells whether another page exists in the same direction.
+        """
         try:
             if not chat_id:
                 return {'success': False, 'error': 'Missing chat_id parameter'}
-            
-            messages = request.env['chartly.chat.message'].search([
-                ('chat_id', '=', int(chat_id))
-            ], order='created_at asc')
-
-            returned_messages = []
-            for msg in messages:
-                msg_dict = {
-                    'id': msg.id,
-                    'content': msg.content,
-                    'sender': msg.sender,
-                    'created_at': msg.created_at.isoformat() if msg.created_at else None,
-                    'cost': msg.cost or 0,
-                }
-                if msg.has_image:
-                    msg_dict.update({"image": msg.image})
-                returned_messages.append(msg_dict)
+
+            limit = min(int(limit or MESSAGES_PAGE_SIZE), MESSAGES_MAX_PAGE_SIZE)
+            domain = [('chat_id', '=', int(chat_id))]
+            if after_id:
+                domain.append(('id', '>', int(after_id)))
+                order = 'id asc'
+            else:
+                if before_id:
+                    domain.append(('id', '<', int(before_id)))
+                order = 'id desc'
+
+            # One extra row tells whether there is another page
+            rows = request.env['chartly.chat.message'].search_read(
+                domain, MESSAGE_FIELDS, order=order, limit=limit + 1
+            )
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if not after_id:
+                rows.reverse()
 
             # Get total cost for the chat
             chat = request.env['chartly.chat'].browse(int(chat_id))
@@ -133,7 +281,8 @@ class ChartlyController(http.Controller):
             
             return {
                 'success': True,
-                'messages': returned_messages,
+                'messages': [self._message_values_to_dict(row) for row in rows],
+                'has_more': has_more,
                 'total_cost': total_cost,
             }
             
@@ -141,6 +290,32 @@ class ChartlyController(http.Controller):
             _logger.error(f"Error in get_messages: {str(e)}")
             return {'success': False, 'error': str(e)}
 
+    @http.route('/chartly/image/<int:message_id>', type='http', auth='user', methods=['GET'])
+    def message_image(self, message_id, **kwargs):
+        """Serve the chart of a message from its attachment, with ETag revalidation"""
+        message = request.env['chartly.chat.message'].browse(message_id).exists()
+        if not message:
+            return request.not_found()
+        message.check_access_rights('read')
+        message.check_access_rule('read')
+
+        attachment = message._get_image_attachment()
+        if not message.has_image or not attachment:
+            return request.not_found()
+
+        etag = attachment.checksum
+        headers = [
+            ('ETag', f'"{etag}"'),
+            ('Cache-Control', f'private, max-age={IMAGE_CACHE_MAX_AGE}, immutable'),
+        ]
+        if request.httprequest.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+
+        return Response(attachment.raw, headers=headers + [
+            ('Content-Type', attachment.mimetype or 'image/png'),
+            ('Content-Length', str(attachment.file_size)),
+        ])
+
     @http.route('/chartly/create_chat', type='json', auth='user', methods=['POST'], csrf=False)
     def create_chat(self, title=None):
         """Create a new chat"""
@@ -197,6 +372,7 @@ class ChartlyController(http.Controller):
                 'title': chat.title,
                 'created_at': chat.created_at.strftime('%Y-%m-%d %H:%M') if chat.created_at else '',
                 'total_cost': chat.total_cost or 0,
+                'response_mode': request.env['ir.config_parameter'].sudo().get_param('chartly.response_mode', 'stream'),
             }
             
         except Exception as e:
@@ -257,3 +433,20 @@ class ChartlyController(http.Controller):
         except Exception as e:
             _logger.error(f"Error in delete_all_chats: {str(e)}")
             return {'success': False, 'error': str(e)}
+
+    @http.route('/chartly/cache_stats', type='json', auth='user', methods=['POST'], csrf=False)
+    def cache_stats(self):
+        """Get translation cache statistics"""
+        try:
+            stats = request.env['chartly.translation.cache'].sudo().get_stats()
+            stats['scripts'] = get_script_cache_stats()
+            stats['model_index'] = get_model_index().stats()
+            stats['schema_pruning'] = get_pruning_stats()
+            stats['schema_snapshot'] = request.env['chartly.schema.model'].sudo().get_stats()
+            stats['prompt_cache'] = get_prompt_cache_stats()
+            
+            return {'success': True, 'stats': stats}
+            
+        except Exception as e:
+            _logger.error(f"Error in cache_stats: {str(e)}")
+            return {'success': False, 'error': str(e)}
@@ -1,6 +1,15 @@
+from . import resources
+from . import http_pool
 from . import openai
+from . import result_set
+from . import sql_projection
+from . import sql_validator
 from . import execute_query
 from . import nl_to_sql
 from . import nl_to_model
+from . import nl_to_query
 from . import filter_model_attributes
-from . import query_to_plot
\ No newline at end of file
+from . import query_to_plot
+from . import chart_spec
+from . import plot_renderer
+from . import translation_cache
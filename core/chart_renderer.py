@@ -0,0 +1,177 @@
+"""Built-in renderer for declarative chart specs.
+
+Has no Odoo dependency so that renderer workers can load it by path. Values are
+grouped and aggregated column-wise with numpy, then drawn with matplotlib.
+"""
+import base64
+import datetime
+from decimal import Decimal
+from io import BytesIO
+from numbers import Number
+
+import numpy as np
+
+CHART_TYPES = ("bar", "line", "pie", "scatter")
+AGGREGATIONS = ("none", "sum", "avg", "count", "min", "max")
+SORTS = ("none", "x_asc", "x_desc", "y_asc", "y_desc")
+
+MISSING_LABEL = "N/A"
+
+
+def check_spec(spec: dict, columns) -> str:
+    """Reason why `spec` can't be drawn from `columns`, or None when it can"""
+    if spec.get("type") not in CHART_TYPES:
+        return f"Unsupported chart type {spec.get('type')}"
+    if spec.get("aggregation", "none") not in AGGREGATIONS:
+        return f"Unsupported aggregation {spec.get('aggregation')}"
+    if spec.get("sort", "none") not in SORTS:
+        return f"Unsupported sort {spec.get('sort')}"
+    y = spec.get("y") or []
+    if not spec.get("x"):
+        return "A chart needs an x column"
+    if not y and spec.get("aggregation") != "count":
+        return "A chart needs at least one y column unless it counts rows"
+    referenced = [spec["x"], *y] + ([spec["series"]] if spec.get("series") else [])
+    missing = [c for c in referenced if c not in columns]
+    if missing:
+        return f"Unknown columns {', '.join(missing)}"
+    if spec["type"] == "pie" and (len(y) > 1 or spec.get("series")):
+        return "A pie chart takes a single y column and no series"
+    if spec.get("series") and len(y) > 1:
+        return "A chart with series takes a single y column"
+    return None
+
+
+def _to_floats(values) -> np.ndarray:
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+
+def _encode(keys):
+    """Integer code per value, in order of first appearance, and the distinct values"""
+    index = {}
+    codes = np.fromiter((index.setdefault(k, len(index)) for k in keys), dtype=np.intp, count=len(keys))
+    return codes, list(index)
+
+
+def _aggregate(codes, size, values, aggregation) -> np.ndarray:
+    present = ~np.isnan(values)
+    if aggregation == "count":
+        return np.bincount(codes, minlength=size).astype(float)
+    sums = np.bincount(codes[present], weights=values[present], minlength=size)
+    if aggregation in ("sum", "none"):
+        return sums
+    if aggregation == "avg":
+        counts = np.bincount(codes[present], minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+    result = np.full(size, np.inf if aggregation == "min" else -np.inf)
+    (np.minimum if aggregation == "min" else np.maximum).at(result, codes[present], values[present])
+    result[np.isinf(result)] = np.nan
+    return result
+
+
+def _tabulate(spec, data):
+    """Categories on the x axis and a {label: values} mapping with one array per plotted series"""
+    x = data.column(spec["x"])
+    y = spec.get("y") or []
+    aggregation = spec.get("aggregation") or "none"
+    ones = np.ones(len(x))
+
+    if spec.get("series"):
+        x_codes, categories = _encode(x)
+        s_codes, series = _encode(data.column(spec["series"]))
+        values = _to_floats(data.column(y[0])) if y else ones
+        # Without an aggregation, series values of the same x are added up
+        cells = _aggregate(x_codes * len(series) + s_codes, len(categories) * len(series), values, aggregation)
+        cells = cells.reshape(len(categories), len(series))
+        return categories, {_label(s): cells[:, i] for i, s in enumerate(series)}
+
+    if aggregation == "none":
+        return list(x), {name: _to_floats(data.column(name)) for name in y}
+
+    codes, categories = _encode(x)
+    columns = y or ["count"]
+    return categories, {
+        name: _aggregate(codes, len(categories), _to_floats(data.column(name)) if y else ones, aggregation)
+        for name in columns
+    }
+
+
+def _sort(spec, categories, series):
+    sort = spec.get("sort") or "none"
+    if sort == "none" or not categories:
+        return categories, series
+    if sort.startswith("x"):
+        order = sorted(range(len(categories)), key=lambda i: _sort_key(categories[i]))
+    else:
+        totals = np.nansum(np.vstack(list(series.values())), axis=0)
+        order = list(np.argsort(totals, kind="stable"))
+    if sort.endswith("desc"):
+        order = order[::-1]
+    return [categories[i] for i in order], {name: values[order] for name, values in series.items()}
+
+
+def _sort_key(value):
+    # None last, numbers and dates by value, anything else by its text
+    if value is None:
+        return (2, "")
+    if isinstance(value, (Number, Decimal, datetime.date)):
+        return (0, value)
+    return (1, str(value))
+
+
+def _label(value) -> str:
+    return MISSING_LABEL if value is None else str(value)
+
+
+def render_chart(spec: dict, data) -> str:
+    """Draw `spec` from the columns of `data` and return the PNG as a base64 string"""
+    reason = check_spec(spec, data.columns)
+    if reason:
+        raise ValueError(reason)
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    categories, series = _tabulate(spec, data)
+    categories, series = _sort(spec, categories, series)
+    chart_type = spec["type"]
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    try:
+        if chart_type == "pie":
+            (values,) = series.values()
+            ax.pie(np.nan_to_num(values), labels=[_label(c) for c in categories],
+                   autopct="%1.1f%%", pctdistance=0.8, labeldistance=1.1)
+            ax.axis("equal")
+        elif chart_type == "bar":
+            labels = [_label(c) for c in categories]
+            positions = np.arange(len(labels))
+            width = 0.8 / max(len(series), 1)
+            for i, (name, values) in enumerate(series.items()):
+                ax.bar(positions + (i - (len(series) - 1) / 2) * width, values, width, label=name)
+            ax.set_xticks(positions)
+            ax.set_xticklabels(labels, rotation=45 if len(labels) > 6 else 0, ha="right" if len(labels) > 6 else "center")
+        else:
+            draw = ax.plot if chart_type == "line" else ax.scatter
+            numeric = all(isinstance(c, (Number, Decimal, datetime.date)) for c in categories)
+            x = [float(c) if isinstance(c, Decimal) else c for c in categories] if numeric else [_label(c) for c in categories]
+            for name, values in series.items():
+                draw(x, values, label=name, **({"marker": "o"} if chart_type == "line" and len(x) < 30 else {}))
+
+        if chart_type != "pie":
+            ax.set_xlabel(spec["x"])
+            if len(series) == 1:
+                ax.set_ylabel(next(iter(series)))
+            else:
+                ax.legend()
+        if spec.get("title"):
+            ax.set_title(spec["title"])
+
+        plt.tight_layout()
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png")
+    finally:
+        plt.close(fig)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
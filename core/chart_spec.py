@@ -0,0 +1,54 @@
+import json, os
+from logging import getLogger
+from odoo.addons.chartly.core.resources import get_text
+from odoo.addons.chartly.core.nl_to_query import matches_schema
+from odoo.addons.chartly.core.prompt_prefix import assemble_messages
+from odoo.addons.chartly.core.chart_renderer import CHART_TYPES, AGGREGATIONS, SORTS
+
+logger = getLogger(__name__)
+
+CHART_SPEC_PROMPT_FILENAME = "chart_spec_prompt.txt"
+
+CHART_SPEC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": [*CHART_TYPES, "none"]},
+        "x": {"type": ["string", "null"]},
+        "y": {"type": "array", "items": {"type": "string"}},
+        "series": {"type": ["string", "null"]},
+        "aggregation": {"type": "string", "enum": list(AGGREGATIONS)},
+        "sort": {"type": "string", "enum": list(SORTS)},
+        "title": {"type": "string"},
+    },
+    "required": ["type", "x", "y", "series", "aggregation", "sort", "title"],
+    "additionalProperties": False,
+}
+
+
+def get_chart_spec_prompt():
+    filepath = os.path.join(os.path.dirname(__file__), CHART_SPEC_PROMPT_FILENAME)
+    return get_text(filepath)
+
+
+def query_to_chart_spec(client, query, sql_query: str, columns) -> dict:
+    """Ask for a declarative chart spec; `spec` is None when the chart can't be described by one"""
+    prompt = get_chart_spec_prompt()
+    messages = assemble_messages(prompt, variable=f"Query: {query} \n SQL Query: {sql_query} \n Columns: {', '.join(columns)}")
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {"name": "chart_spec", "strict": True, "schema": CHART_SPEC_SCHEMA},
+    }
+    response = client.chat_completion(messages, temperature=0.3, response_format=response_format, stage="chart_spec")
+    request_cost = response.get("cost", 0)
+    logger.info(f"Query to Chart Spec response content:\n{response.get('content')}")
+
+    try:
+        spec = json.loads(response.get("content") or "")
+    except json.JSONDecodeError:
+        logger.warning(f"Query to Chart Spec returned invalid JSON: {response.get('content')}")
+        spec = None
+
+    if not matches_schema(spec, CHART_SPEC_SCHEMA) or spec["type"] == "none":
+        return {"spec": None, "cost": request_cost}
+
+    return {"spec": spec, "cost": request_cost}
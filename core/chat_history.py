@@ -0,0 +1,98 @@
+import os
+import re
+from logging import getLogger
+from odoo.addons.chartly.core.resources import get_text
+from odoo.addons.chartly.core.prompt_prefix import assemble_messages
+
+logger = getLogger(__name__)
+
+MAIN_PROMPT_FILENAME = "main_prompt.txt"
+CHAT_SUMMARY_PROMPT_FILENAME = "chat_summary_prompt.txt"
+
+DEFAULT_HISTORY_TOKEN_BUDGET = 4000
+# The newest messages are kept verbatim, older ones are cut to a short excerpt
+VERBATIM_MESSAGES = 4
+TRUNCATED_MESSAGE_TOKENS = 150
+SUMMARY_MAX_TOKENS = 300
+# Share of the budget the history is cut down to when it outgrows it, so that it is not
+# summarized again, and its prompt prefix changed, on every turn
+COMPACTED_HISTORY_SHARE = 0.75
+# Role, separators and other per-message framing added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TRUNCATION_MARKER = " [...]"
+
+# Words, numbers and single punctuation marks, roughly how BPE tokenizers split text
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+ROLES = {"user": "user", "ai": "assistant"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Local estimate of the number of tokens of `text`, without calling any API.
+
+    Long words count as several tokens, about one per 4 characters.
+    """
+    if not text:
+        return 0
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN_PIECES.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens` tokens, marking the cut"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    used = estimate_tokens(TRUNCATION_MARKER)
+    for match in _TOKEN_PIECES.finditer(text):
+        used += (len(match.group()) + 3) // 4
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + TRUNCATION_MARKER
+    return text
+
+
+def build_history(rows, budget: int):
+    """Fit chat messages into `budget` tokens, newest first.
+
+    `rows` are dicts with `sender` and `content`, oldest first. The newest messages are kept
+    verbatim, older ones truncated, and the ones that don't fit anymore are dropped.
+    Returns `(messages, dropped_rows)` with messages in chat completion format.
+    """
+    kept = []
+    used = 0
+    for position, row in enumerate(reversed(rows)):
+        limit = budget - used - MESSAGE_OVERHEAD_TOKENS
+        if position >= VERBATIM_MESSAGES:
+            limit = min(limit, TRUNCATED_MESSAGE_TOKENS)
+        # The newest message is always kept, even if only partly
+        if limit <= 0 or (kept and limit < TRUNCATED_MESSAGE_TOKENS and estimate_tokens(row["content"]) > limit):
+            return kept[::-1], rows[:len(rows) - position]
+        content = truncate_to_tokens(row["content"] or "", limit)
+        used += estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        kept.append({"role": ROLES[row["sender"]], "content": content})
+    return kept[::-1], []
+
+
+def get_main_prompt():
+    filepath = os.path.join(os.path.dirname(__file__), MAIN_PROMPT_FILENAME)
+    return get_text(filepath)
+
+
+def get_chat_summary_prompt():
+    filepath = os.path.join(os.path.dirname(__file__), CHAT_SUMMARY_PROMPT_FILENAME)
+    return get_text(filepath)
+
+
+def summarize_messages(client, summary: str, rows) -> dict:
+    """Fold `rows` into the running `summary` with one LLM call"""
+    transcript = "\n".join(
+        f"{ROLES[row['sender']]}: {truncate_to_tokens(row['content'] or '', TRUNCATED_MESSAGE_TOKENS * 2)}"
+        for row in rows
+    )
+    messages = assemble_messages(
+        get_chat_summary_prompt(), variable=f"Current summary: {summary or '(none)'}\n\nNext messages:\n{transcript}"
+    )
+    response = client.chat_completion(messages, max_tokens=SUMMARY_MAX_TOKENS, temperature=0.2, stage="chat_summary")
+    if not response.get("success", True) or not response.get("content"):
+        logger.warning(f"Chat summary failed: {response.get('error')}")
+        return {"summary": None, "cost": response.get("cost", 0)}
+    return {"summary": response["content"].strip(), "cost": response.get("cost", 0)}
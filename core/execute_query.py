@@ -1,72 +1,114 @@
-import re
-import sqlvalidator
+import uuid
+from odoo.addons.chartly.core.sql_projection import limit_zero, limit_rows
+from odoo.addons.chartly.core.sql_validator import validate_query
+from odoo.addons.chartly.core.result_set import ResultSet
 from logging import getLogger
 logger = getLogger(__name__)
 
-def is_formatted(query: str) -> bool:
-    try:
-        validation = sqlvalidator.parse(query)
-        return validation.is_valid()
-    except Exception as e:
-        logger.error(f"Error during SQL validation: {e}")
-        return False
-
-def is_safe(query: str) -> bool:
-    sql = query.strip().lower()
+DEFAULT_BATCH_SIZE = 500
 
-    if not sql.startswith("select"):
-        return False
+def _fetch_bounded(env, sql_query: str, timeout=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Run `sql_query` through a named server-side cursor, fetching rows in batches.
 
-    forbidden_commands = [
-        r"\binsert\b", r"\bupdate\b", r"\bdelete\b",
-        r"\bdrop\b", r"\bcreate\b", r"\balter\b",
-        r"\btruncate\b", r"\bgrant\b", r"\brevoke\b",
-        r"\breplace\b", r"\bcommit\b", r"\brollback\b"
-    ]
+    `timeout` is a statement timeout in milliseconds applied to this query only.
+    """
+    with env.cr.savepoint():
+        if timeout:
+            env.cr.execute("SELECT current_setting('statement_timeout')")
+            previous_timeout = env.cr.fetchone()[0]
+            env.cr.execute("SELECT set_config('statement_timeout', %s, true)", [str(int(timeout))])
 
-    forbidden_code = [
-        "__import__", "eval", "exec", "sudo", "env[", ".env"
-    ]
+        cursor = env.cr._cnx.cursor(f"chartly_{uuid.uuid4().hex}")
+        try:
+            cursor.itersize = batch_size
+            cursor.execute(sql_query)
+            data = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if data is None:
+                    data = ResultSet([desc[0] for desc in cursor.description])
+                if not rows:
+                    break
+                data.extend(rows)
+        finally:
+            cursor.close()
 
-    for pattern in forbidden_commands:
-        if re.search(pattern, sql):
-            return False
+        if timeout:
+            env.cr.execute("SELECT set_config('statement_timeout', %s, true)", [previous_timeout])
+    return data
 
-    for keyword in forbidden_code:
-        if keyword in sql:
-            return False
 
-    return True
+def execute_query(env, sql_query: str, limit=None, timeout=None, batch_size=None) -> dict:
+    """Validate and run `sql_query`.
 
+    When `limit`, `timeout` (ms) or `batch_size` is given the query runs in bounded mode:
+    it is capped to `limit` rows, cancelled after `timeout` and streamed through a
+    server-side cursor so memory stays bounded.
 
-def execute_query(env, sql_query: str) -> dict:
+    On success `data` is a ResultSet, otherwise an empty list.
+    """
     resutls = {}
     
     logger.info("Validating SQL query safety.")
+    verdict = validate_query(sql_query)
     
-    if not is_safe(sql_query):
-        logger.warning(f"Unsafe SQL query detected: {sql_query}")
-        resutls["not_safe"] = True
+    if not verdict.formatted:
+        logger.warning(f"Malformed SQL query detected: {sql_query}")
+        resutls["not_formatted"] = True
         resutls["data"] = []
         return resutls
     
-    if not is_formatted(sql_query):
-        logger.warning(f"Malformed SQL query detected: {sql_query}")
-        resutls["not_formatted"] = True
+    if not verdict.safe:
+        logger.warning(f"Unsafe SQL query detected: {sql_query}")
+        resutls["not_safe"] = True
         resutls["data"] = []
         return resutls
         
     try:
+        if limit or timeout or batch_size:
+            bounded_sql_query = limit_rows(sql_query, limit)
+            if not bounded_sql_query:
+                # Never fall back to an unbounded run when bounds were asked for
+                logger.warning(f"Could not bound SQL query: {sql_query}")
+                resutls["error"] = "The query could not be limited safely"
+                resutls["data"] = []
+                return resutls
+
+            logger.info(f"Executing bounded SQL query: {bounded_sql_query}")
+            resutls["data"] = _fetch_bounded(env, bounded_sql_query, timeout, batch_size or DEFAULT_BATCH_SIZE)
+            logger.info(f"Query returned {len(resutls['data'])} records.")
+            return resutls
+
         logger.info(f"Executing SQL query: {sql_query}")
         env.cr.execute(sql_query)
-        columns = [desc[0] for desc in env.cr.description]
-        rows = env.cr.fetchall()
-        logger.info(f"Query returned {len(rows)} records.")
-        resutls["data"] = [dict(zip(columns, row)) for row in rows]
+        resutls["data"] = ResultSet([desc[0] for desc in env.cr.description])
+        resutls["data"].extend(env.cr.fetchall())
+        logger.info(f"Query returned {len(resutls['data'])} records.")
         return resutls
     
     except Exception as e:
         logger.error(f"Error executing query: {sql_query} - Error: {e}")
         resutls["error"] = str(e)
         resutls["data"] = []
-        return resutls
\ No newline at end of file
+        return resutls
+
+def describe_query(env, sql_query: str) -> dict:
+    """Return the output column names of `sql_query` without fetching any row"""
+    resutls = {"columns": []}
+
+    if not validate_query(sql_query).safe:
+        logger.warning(f"Not describing unsafe or malformed SQL query: {sql_query}")
+        return resutls
+
+    describe_sql = limit_zero(sql_query)
+    if not describe_sql:
+        return resutls
+
+    try:
+        with env.cr.savepoint():
+            env.cr.execute(describe_sql)
+            resutls["columns"] = [desc[0] for desc in env.cr.description]
+    except Exception as e:
+        logger.error(f"Error describing query: {sql_query} - Error: {e}")
+        resutls["error"] = str(e)
+    return resutls
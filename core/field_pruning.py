@@ -0,0 +1,218 @@
+import threading
+from logging import getLogger
+from odoo.addons.chartly.core.chat_history import estimate_tokens
+from odoo.addons.chartly.core.model_index import get_model_index, tokenize
+
+logger = getLogger(__name__)
+
+# Bump when the ranking changes, cached translations made with another ranking are not reused
+PRUNING_VERSION = 1
+
+# Tables with at most this many columns are sent whole; larger ones keep at least this many
+MIN_FIELDS = 12
+
+KEY_SCORE = 100
+QUESTION_SCORE = 10
+CONCEPT_SCORE = 5
+
+# Question words and the column words they usually stand for
+CONCEPTS = {
+    "revenue": ("amount", "total", "balance", "price", "subtotal", "credit"),
+    "sale": ("amount", "total", "price", "subtotal", "quantity"),
+    "sold": ("quantity", "price", "subtotal"),
+    "spend": ("amount", "total", "debit"),
+    "expense": ("amount", "total", "debit"),
+    "cost": ("amount", "total", "price", "debit"),
+    "income": ("amount", "total", "credit", "balance"),
+    "profit": ("balance", "credit", "debit"),
+    "value": ("amount", "total", "balance"),
+    "sum": ("amount", "total", "balance"),
+    "owe": ("residual", "amount"),
+    "outstanding": ("residual", "state"),
+    "unpaid": ("state", "residual"),
+    "paid": ("state", "residual"),
+    "overdue": ("due", "maturity", "state", "residual"),
+    "due": ("due", "maturity"),
+    "posted": ("state",),
+    "draft": ("state",),
+    "cancelled": ("state",),
+    "status": ("state",),
+    "customer": ("partner", "type"),
+    "client": ("partner",),
+    "vendor": ("partner", "type"),
+    "supplier": ("partner", "type"),
+    "bill": ("type", "partner"),
+    "refund": ("type", "reversed"),
+    "credit": ("type", "credit"),
+    "invoice": ("type",),
+    "when": ("date",),
+    "day": ("date",),
+    "week": ("date",),
+    "month": ("date",),
+    "monthly": ("date",),
+    "quarter": ("date",),
+    "year": ("date",),
+    "yearly": ("date",),
+    "recent": ("date",),
+    "latest": ("date",),
+    "trend": ("date",),
+    "period": ("date",),
+    "today": ("date",),
+    "yesterday": ("date",),
+    "ago": ("date",),
+    "since": ("date",),
+    "time": ("date",),
+    "number": ("number",),
+    "type": ("type",),
+    "kind": ("type",),
+    "who": ("partner", "user", "name"),
+    "salesperson": ("user",),
+    "currency": ("currency",),
+    "tax": ("tax",),
+    "vat": ("tax",),
+    "item": ("product", "quantity", "name"),
+    "product": ("product", "quantity", "price"),
+    "unit": ("quantity", "uom", "price"),
+}
+
+# Columns always sent when the table has them
+ALWAYS_FIELDS = frozenset({
+    "name", "state", "parent_state", "date", "invoice_date", "partner_id", "move_type", "move_id", "display_type", "amount_total",
+})
+
+# Columns that answer most questions about a table, in order of usefulness
+ESSENTIAL_FIELDS = (
+    "name", "state", "date", "move_type", "partner_id", "amount_total", "amount", "amount_residual",
+    "payment_state", "invoice_date", "invoice_date_due", "balance", "debit", "credit", "price_subtotal",
+    "quantity", "product_id", "currency_id", "company_id", "type", "code", "active", "account_id", "journal_id",
+)
+
+# Bookkeeping columns only sent when the question names them
+TECHNICAL_FIELDS = frozenset({
+    "create_uid", "write_uid", "create_date", "write_date", "access_token", "message_main_attachment_id",
+    "inalterable_hash", "secure_sequence_number", "sequence_prefix", "send_and_print_values",
+    "secure_sequence_id", "restrict_mode_hash_table", "sequence_override_regex", "color",
+})
+
+_stats = {"requests": 0, "schema_tokens": 0, "sent_tokens": 0}
+_stats_lock = threading.Lock()
+
+
+def round_rows(rows: int) -> str:
+    """`rows` to one significant digit, so that the prompt doesn't change with every estimate"""
+    return f"{round(rows, 1 - len(str(rows))):,}" if rows > 0 else "0"
+
+
+def format_fields(fields: dict, types: dict = None, rows: dict = None) -> str:
+    """One line per model; with `types`, columns are followed by their type, with `rows`,
+    models by their estimated number of rows"""
+    lines = []
+    for model, columns in fields.items():
+        header = f"{model} (about {round_rows(rows[model])} rows)" if rows and model in rows else model
+        if types and model in types:
+            columns = [f"{column} {types[model][column]}" if column in types[model] else column for column in columns]
+        lines.append(f"# {header}: {columns}\n")
+    return "".join(lines)
+
+
+def _table(model: str) -> str:
+    return model.replace(".", "_")
+
+
+def _references(stem: str, table: str) -> bool:
+    # move_id -> account_move, commercial_partner_id -> res_partner
+    return table == stem or table.endswith("_" + stem) or table.rsplit("_", 1)[-1] == stem.rsplit("_", 1)[-1]
+
+
+def _join_keys(model: str, columns, models, edges=None) -> set:
+    """Columns of `model` referencing one of the other `models`.
+
+    Taken from the foreign keys in `edges` ({column: table}) when known, otherwise guessed
+    from the column names.
+    """
+    tables = [_table(other) for other in models if other != model]
+    if edges is not None:
+        return {column for column, table in edges.items() if table in tables and column in columns}
+    return {
+        column for column in columns
+        if column.endswith("_id") and any(_references(column[:-3], table) for table in tables)
+    }
+
+
+def rank_fields(question: str, model: str, columns, models, model_words=frozenset(), edges=None) -> dict:
+    """Relevance of each column of `model` to `question`, higher first.
+
+    Question words in `model_words` name the table itself ("invoices" for account.move), so
+    they only count through the columns they usually stand for.
+    """
+    words = set(tokenize(question))
+    concepts = {concept for word in words for concept in CONCEPTS.get(word, ())}
+    words -= model_words
+    keys = _join_keys(model, columns, models, edges)
+    scores = {}
+    for column in columns:
+        parts = set(tokenize(column.replace("_", " ")))
+        if column == "id" or column in keys:
+            score = KEY_SCORE
+        elif parts & words:
+            score = QUESTION_SCORE * len(parts & words)
+        elif column in TECHNICAL_FIELDS:
+            score = -1
+        elif parts & concepts or column in ALWAYS_FIELDS:
+            score = CONCEPT_SCORE
+        else:
+            score = 0
+        scores[column] = score
+    return scores
+
+
+def prune_fields(question: str, fields: dict, min_fields: int = MIN_FIELDS, edges=None) -> dict:
+    """Columns of each model worth sending to nl_to_sql for `question`, in schema order.
+
+    Keeps the primary key, the keys joining the models together and the columns related to
+    the question, then tops tables up to `min_fields` columns with their most common ones.
+    `edges` are the foreign keys of the models from the schema snapshot, when generated.
+    """
+    models = list(fields)
+    index = get_model_index()
+    pruned = {}
+    for model, columns in fields.items():
+        columns = list(columns)
+        if len(columns) <= min_fields:
+            pruned[model] = columns
+            continue
+        scores = rank_fields(
+            question, model, columns, models, index.model_words.get(model, frozenset()),
+            edges.get(model) if edges is not None else None
+        )
+        kept = {c for c in columns if scores[c] >= CONCEPT_SCORE}
+        for column in ESSENTIAL_FIELDS:
+            if len(kept) >= min_fields:
+                break
+            if column in scores:
+                kept.add(column)
+        for column in columns:
+            if len(kept) >= min_fields:
+                break
+            if scores[column] >= 0:
+                kept.add(column)
+        pruned[model] = [c for c in columns if c in kept]
+    return pruned
+
+
+def record_savings(schema: str, sent: str) -> dict:
+    """Token estimates of the full and sent schema, added to the running totals"""
+    savings = {"schema_tokens": estimate_tokens(schema), "sent_tokens": estimate_tokens(sent)}
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["schema_tokens"] += savings["schema_tokens"]
+        _stats["sent_tokens"] += savings["sent_tokens"]
+    logger.info(f"Schema pruning: {savings['sent_tokens']} of {savings['schema_tokens']} tokens sent")
+    return savings
+
+
+def get_pruning_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["saved_tokens"] = stats["schema_tokens"] - stats["sent_tokens"]
+    return stats
@@ -1,19 +1,20 @@
-def get_filter_model_attributes_prompt(query, attributes):
+from odoo.addons.chartly.core.prompt_prefix import assemble_messages
+
+def get_filter_model_attributes_prompt():
     prompt = []
     prompt.append("You are a tool designed to filter out unusful attributes returned from an executing an sql as a result of a natural language query.")
-    prompt.append(f"The query: {query}")
-    prompt.append(f"The attributes: {attributes}")
     prompt.append("Only return the useful attributes as list of attributes seperated by new line.")
     prompt.append("What we mean by useful attributes are attributes that we would use to answer the query in a chatbot settings.")
     prompt.append("The more concise the better, because we are in a chat application.")
     return "\n".join(prompt)
-        
+
 def filter_attributes(client, query: str, attributes: list)-> dict:
-    prompt = get_filter_model_attributes_prompt(query, attributes)
-    messages = []
-    messages = client.add_user_message(messages, prompt)
-    response = client.chat_completion(messages, temperature= 0.3)
+    # The instructions are the same for every query, only the query and attributes change
+    messages = assemble_messages(
+        get_filter_model_attributes_prompt(), variable=f"The query: {query}\nThe attributes: {attributes}"
+    )
+    response = client.chat_completion(messages, temperature= 0.3, stage="filter_attributes")
     response_content = response.get("content").strip().split("\n")
     response_content = [attr.strip() for attr in response_content if attr.strip()]
     request_cost = response.get("cost")
-    return {"attributes": response_content, "cost": request_cost}
\ No newline at end of file
+    return {"attributes": response_content, "cost": request_cost}
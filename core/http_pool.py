@@ -0,0 +1,161 @@
+import http.client
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 60
+
+# Errors raised when a kept-alive socket was closed by the server while idle.
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections, grouped by host."""
+
+    def __init__(self, max_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.hits = 0
+        self.misses = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_size=None, idle_timeout=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max(0, int(max_size))
+            if idle_timeout is not None:
+                self.idle_timeout = float(idle_timeout)
+        self._evict()
+
+    def stats(self):
+        with self._lock:
+            idle = sum(len(conns) for conns in self._idle.values())
+            return {"hits": self.hits, "misses": self.misses, "idle": idle, "max_size": self.max_size}
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=30):
+        """Send a request and return `(status, body_bytes)`, reusing an idle connection if possible."""
+        with self.open(method, url, body=body, headers=headers, timeout=timeout) as response:
+            return response.status, response.read()
+
+    @contextmanager
+    def open(self, method, url, body=None, headers=None, timeout=30):
+        """Send a request and yield the unread response, e.g. to consume a stream line by line.
+
+        The connection goes back to the pool only if the body was read to the end.
+        """
+        response, conn, key = self._send(method, url, body, headers, timeout)
+        try:
+            yield response
+        except BaseException:
+            conn.close()
+            raise
+        if response.isclosed():
+            self._release(key, conn, response)
+        else:
+            conn.close()
+
+    def _send(self, method, url, body, headers, timeout):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        conn, reused = self._acquire(key, timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn.getresponse(), conn, key
+        except STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+            logger.info(f"Stale pooled connection to {parts.hostname}, reconnecting")
+            conn = self._connect(key, timeout)
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn.getresponse(), conn, key
+        except Exception:
+            conn.close()
+            raise
+
+    def _acquire(self, key, timeout):
+        now = time.monotonic()
+        with self._lock:
+            conns = self._idle.get(key, [])
+            while conns:
+                conn, last_used = conns.pop()
+                if now - last_used > self.idle_timeout:
+                    conn.close()
+                    continue
+                self.hits += 1
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            self.misses += 1
+        return self._connect(key, timeout), False
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _release(self, key, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_size:
+                conns.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _evict(self):
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            for key, conns in self._idle.items():
+                kept = []
+                for conn, last_used in reversed(conns):
+                    if now - last_used > self.idle_timeout or len(kept) >= self.max_size:
+                        stale.append(conn)
+                    else:
+                        kept.append((conn, last_used))
+                self._idle[key] = kept[::-1]
+        for conn in stale:
+            conn.close()
+
+
+# One pool per worker process, shared by every OpenAIClient instance.
+# Sockets must never cross a fork, so a prefork worker gets its own pool.
+_pool = ConnectionPool()
+_pool_pid = os.getpid()
+
+
+def get_connection_pool() -> ConnectionPool:
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        _pool = ConnectionPool(_pool.max_size, _pool.idle_timeout)
+        _pool_pid = os.getpid()
+    return _pool
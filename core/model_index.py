@@ -0,0 +1,237 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from logging import getLogger
+from odoo.addons.chartly.core.resources import (
+    CORE_DIR, ALLOWED_ODOO_MODELS_FILE, MODEL_FIELDS_MAP_FILE, get_text, get_allowed_models, get_model_fields_map,
+)
+
+logger = getLogger(__name__)
+
+SCHEMA_MODELS_FILE = os.path.join(CORE_DIR, "accounting_schema_models.txt")
+NL_TO_MODEL_PROMPT_FILE = os.path.join(CORE_DIR, "nl_to_model_prompt.txt")
+
+DEFAULT_SHORTLIST_SIZE = 8
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# A question only names a single model when none of its other words names another model
+# with a score this many times higher
+CONFIDENT_MARGIN = 1.5
+
+# Weight of a term by where it comes from: the meanings listed in the nl_to_model prompt,
+# the model name, then its field names
+SYNONYM_WEIGHT = 3
+NAME_WEIGHT = 3
+FIELD_WEIGHT = 1
+
+STOPWORDS = frozenset({
+    "a", "all", "an", "and", "any", "are", "as", "at", "by", "during", "each", "for", "from", "get",
+    "give", "how", "i", "in", "is", "it", "last", "list", "me", "many", "much", "my", "of", "on",
+    "or", "our", "over", "per", "plot", "show", "that", "the", "their", "this", "to", "top", "what",
+    "which", "with", "itself", "chart", "graph", "bar", "line", "pie", "id", "uid", "rel", "create", "write",
+})
+# "line" names models (invoice line, report line), it is only a stopword in questions
+NAME_STOPWORDS = STOPWORDS - {"line"}
+
+# "  invoice, customer invoice -> account.move" lines of the nl_to_model prompt
+MAPPING_LINE = re.compile(r"^\s+(?P<terms>[^-→]+?)\s*(?:->|→)\s*(?:map to\s+)?(?P<model>[a-z_]+(?:\.[a-z_]+)+)\s*$")
+
+Shortlist = namedtuple("Shortlist", ["models", "confident"])
+
+
+def _stem(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ses", "xes", "ches", "shes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str, stopwords=STOPWORDS) -> list:
+    return [_stem(t) for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in stopwords]
+
+
+def tokenize_with_breaks(text: str, stopwords=NAME_STOPWORDS) -> list:
+    """Tokens of `text` with None in place of stopwords, which phrases can't span"""
+    return [None if t in stopwords else _stem(t) for t in re.findall(r"[a-z0-9]+", text.lower())]
+
+
+def parse_model_mappings(prompt: str) -> dict:
+    """{model: [phrase, ...]} from the meaning-to-model lines of the nl_to_model prompt"""
+    mappings = defaultdict(list)
+    for line in prompt.splitlines():
+        match = MAPPING_LINE.match(line)
+        if match:
+            mappings[match["model"]].extend(p.strip() for p in match["terms"].split(",") if p.strip())
+    return dict(mappings)
+
+
+class ModelIndex:
+    """BM25 index of the allowed models over their meanings, names and field names.
+
+    Also matches the meanings of the nl_to_model prompt as phrases, longest first, which
+    tells when a question names exactly one model.
+    """
+
+    def __init__(self, models, mappings, model_fields):
+        started = time.perf_counter()
+        self.models = sorted(models)
+        self.docs = {model: doc for doc, model in enumerate(self.models)}
+        self.postings = defaultdict(list)
+        self.phrases = {}
+        # Words that name each model rather than one of its fields
+        self.model_words = {}
+        lengths = []
+
+        for doc, model in enumerate(self.models):
+            terms = Counter()
+            for phrase in mappings.get(model, ()):
+                tokens = tuple(tokenize(phrase, NAME_STOPWORDS))
+                if tokens:
+                    self.phrases.setdefault(tokens, model)
+                for token in tokens:
+                    terms[token] += SYNONYM_WEIGHT
+            for token in tokenize(model.replace(".", " "), NAME_STOPWORDS):
+                terms[token] += NAME_WEIGHT
+            self.model_words[model] = frozenset(terms)
+            for field in model_fields.get(model, ()):
+                for token in tokenize(field.replace("_", " "), NAME_STOPWORDS):
+                    terms[token] += FIELD_WEIGHT
+            for term, frequency in terms.items():
+                self.postings[term].append((doc, frequency))
+            lengths.append(sum(terms.values()))
+
+        count = len(self.models)
+        average = sum(lengths) / count if count else 0
+        self.norms = [K1 * (1 - B + B * length / average) if average else K1 for length in lengths]
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        self.longest_phrase = max((len(p) for p in self.phrases), default=0)
+        self.build_time = time.perf_counter() - started
+        self.lookups = 0
+        self.lookup_time = 0.0
+
+    def term_scores(self, term: str) -> dict:
+        """BM25 score of `term` for each model containing it, by document"""
+        idf = self.idf.get(term)
+        if idf is None:
+            return {}
+        return {
+            doc: idf * frequency * (K1 + 1) / (frequency + self.norms[doc])
+            for doc, frequency in self.postings[term]
+        }
+
+    def search(self, query: str, limit=DEFAULT_SHORTLIST_SIZE) -> list:
+        """Best matching models for `query` as (model, score) pairs, best first"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for doc, score in self.term_scores(term).items():
+                scores[doc] += score
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(self.models[doc], score) for doc, score in best]
+
+    def _match(self, query: str) -> list:
+        # (model, phrase tokens) of the meanings in `query`; stopwords break phrases, so that
+        # "vendors by bill amount" doesn't read as "vendor bill"
+        tokens = tokenize_with_breaks(query)
+        matched = []
+        position = 0
+        while position < len(tokens):
+            for size in range(min(self.longest_phrase, len(tokens) - position), 0, -1):
+                span = tokens[position:position + size]
+                model = None if None in span else self.phrases.get(tuple(span))
+                if model:
+                    matched.append((model, span))
+                    position += size
+                    break
+            else:
+                position += 1
+        return matched
+
+    def match_phrases(self, query: str) -> list:
+        """Models whose meanings appear in `query`, longest phrases first, in query order"""
+        return [model for model, _ in self._match(query)]
+
+    def _names_other_model(self, query: str, model: str, matched) -> bool:
+        """Whether a word of `query` outside the matched phrases names another model than `model`"""
+        explained = {token for _, span in matched for token in span}
+        doc = self.docs[model]
+        for term in set(tokenize(query)) - explained:
+            scores = self.term_scores(term)
+            for other, score in scores.items():
+                if other != doc and term in self.model_words[self.models[other]] and score > CONFIDENT_MARGIN * scores.get(doc, 0):
+                    return True
+        return False
+
+    def shortlist(self, query: str, limit=DEFAULT_SHORTLIST_SIZE) -> Shortlist:
+        """Candidate models for `query`.
+
+        Confident when it names a single model that also ranks first, and none of its other
+        words names another model; the LLM is only skipped then.
+        """
+        started = time.perf_counter()
+        ranked = [model for model, _ in self.search(query, limit)]
+        matched = self._match(query)
+        named = list(dict.fromkeys(model for model, _ in matched))
+        confident = (
+            len(named) == 1 and bool(ranked) and ranked[0] == named[0]
+            and not self._names_other_model(query, named[0], matched)
+        )
+        # Models named by the question are always candidates
+        models = (named + [m for m in ranked if m not in named])[:max(limit, len(named))]
+        self.lookups += 1
+        self.lookup_time += time.perf_counter() - started
+        return Shortlist(models, confident)
+
+    def stats(self) -> dict:
+        return {
+            "models": len(self.models),
+            "terms": len(self.postings),
+            "build_ms": round(self.build_time * 1000, 3),
+            "lookups": self.lookups,
+            "avg_lookup_ms": round(self.lookup_time * 1000 / self.lookups, 3) if self.lookups else 0,
+        }
+
+
+def _build_index():
+    schema_tables = set(get_text(SCHEMA_MODELS_FILE).split())
+    fields_map = get_model_fields_map()
+    models = get_allowed_models()
+    model_fields = {
+        model: fields_map.get(model.replace(".", "_"), ())
+        for model in models if model.replace(".", "_") in schema_tables
+    }
+    index = ModelIndex(models, parse_model_mappings(get_text(NL_TO_MODEL_PROMPT_FILE)), model_fields)
+    logger.info(f"Built model index: {index.stats()}")
+    return index
+
+
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
+
+def get_model_index() -> ModelIndex:
+    """The model index, built once and rebuilt only when one of its source files changes"""
+    global _index, _index_key
+    key = tuple(
+        os.stat(path).st_mtime_ns
+        for path in (ALLOWED_ODOO_MODELS_FILE, SCHEMA_MODELS_FILE, MODEL_FIELDS_MAP_FILE, NL_TO_MODEL_PROMPT_FILE)
+    )
+    if _index is not None and _index_key == key:
+        return _index
+    with _index_lock:
+        if _index is None or _index_key != key:
+            _index = _build_index()
+            _index_key = key
+        return _index
@@ -1,5 +1,8 @@
 import json, os
 from logging import getLogger
+from odoo.addons.chartly.core.resources import get_text
+from odoo.addons.chartly.core.model_index import MAPPING_LINE
+from odoo.addons.chartly.core.prompt_prefix import assemble_messages
 
 logger = getLogger(__name__)
 
@@ -8,16 +11,24 @@ NL_TO_MODEL_PROMPT_FILENAME = "nl_to_model_prompt.txt"
 
 def get_nl_to_model_prompt():
     filepath = os.path.join(os.path.dirname(__file__), NL_TO_MODEL_PROMPT_FILENAME)
-    with open(filepath, "r") as f:
-        prompt = f.read()
-    return prompt
+    return get_text(filepath)
         
-def nl_to_model(client, text: str)-> list[str]:
-    prompt = get_nl_to_model_prompt()
-    messages = []
-    messages = client.add_system_message(messages, prompt)
-    messages = client.add_user_message(messages, f"Query: {text}")
-    response = client.chat_completion(messages, temperature= 0.3,)
+def get_shortlist_prompt(candidates) -> str:
+    """The nl_to_model prompt with only the meanings of the `candidates` models, which it then lists"""
+    lines = [
+        line for line in get_nl_to_model_prompt().splitlines()
+        if not (match := MAPPING_LINE.match(line)) or match["model"] in candidates
+    ]
+    lines.append("")
+    lines.append(f"Candidate models, most likely first: {', '.join(candidates)}")
+    lines.append("Choose among the candidates unless the query clearly needs another accounting model.")
+    return "\n".join(lines)
+
+def nl_to_model(client, text: str, candidates=None)-> list[str]:
+    """Models needed to answer `text`; with `candidates`, the prompt only describes those models"""
+    prompt = get_shortlist_prompt(candidates) if candidates else get_nl_to_model_prompt()
+    messages = assemble_messages(prompt, variable=f"Query: {text}")
+    response = client.chat_completion(messages, temperature= 0.3, stage="nl_to_model")
     response_content = response.get("content")
     response_content = json.loads(response_content)
     models = response_content.get("models")
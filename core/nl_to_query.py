@@ -0,0 +1,94 @@
+import json, os
+from logging import getLogger
+from odoo.addons.chartly.core.resources import get_text, get_model_fields_map
+from odoo.addons.chartly.core.prompt_prefix import assemble_messages
+from odoo.addons.chartly.core.field_pruning import format_fields, prune_fields, record_savings
+
+logger = getLogger(__name__)
+
+NL_TO_QUERY_PROMPT_FILENAME = "nl_to_query_prompt.txt"
+
+NL_TO_QUERY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "models": {"type": "array", "items": {"type": "string"}},
+        "sql_query": {"type": "string"},
+        "columns": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["models", "sql_query", "columns"],
+    "additionalProperties": False,
+}
+
+JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "null": type(None),
+}
+
+
+def get_nl_to_query_prompt():
+    """The instructions and the columns of every table, the same for every question"""
+    filepath = os.path.join(os.path.dirname(__file__), NL_TO_QUERY_PROMPT_FILENAME)
+    schema_lines = [f"# {table}: {', '.join(fields)}" for table, fields in sorted(get_model_fields_map().items())]
+    return get_text(filepath) + "\n".join(schema_lines)
+
+
+def matches_schema(value, schema) -> bool:
+    """Check `value` against the subset of JSON schema used by the structured LLM responses"""
+    types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+    if not isinstance(value, tuple(JSON_TYPES[t] for t in types)):
+        return False
+    if "enum" in schema and value not in schema["enum"]:
+        return False
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        if any(key not in value for key in schema.get("required", [])):
+            return False
+        if schema.get("additionalProperties") is False and any(key not in properties for key in value):
+            return False
+        return all(matches_schema(value[key], properties[key]) for key in value if key in properties)
+    if isinstance(value, list) and "items" in schema:
+        return all(matches_schema(item, schema["items"]) for item in value)
+    return True
+
+
+def nl_to_query(client, query: str, fields: dict = None, prune: bool = False, edges: dict = None) -> dict:
+    """Resolve models, SQL and useful result columns for `query` in a single LLM call.
+
+    The prompt prefix describes every table and stays the same for every question, so the
+    provider caches it. `fields`, usually the shortlist of the question, and with `prune` only
+    their columns relevant to it, are pointed out after it, with the question.
+    """
+    variable = f"Query: {query}"
+    if fields:
+        fields = {model: fields[model] for model in sorted(fields)}
+        if prune:
+            pruned = prune_fields(query, fields, edges=edges)
+            record_savings(format_fields(fields), format_fields(pruned))
+            fields = pruned
+        variable = f"Likely models and their relevant fields:\n{format_fields(fields)}{variable}"
+    messages = assemble_messages(get_nl_to_query_prompt(), variable=variable)
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {"name": "nl_to_query", "strict": True, "schema": NL_TO_QUERY_SCHEMA},
+    }
+    response = client.chat_completion(messages, temperature=0.3, response_format=response_format, stage="nl_to_query")
+    request_cost = response.get("cost", 0)
+
+    try:
+        response_content = json.loads(response.get("content") or "")
+    except json.JSONDecodeError:
+        logger.warning(f"NL to Query returned invalid JSON: {response.get('content')}")
+        response_content = None
+
+    if not matches_schema(response_content, NL_TO_QUERY_SCHEMA):
+        logger.warning(f"NL to Query response does not match schema: {response.get('content')}")
+        return {"models": None, "sql_query": None, "columns": None, "cost": request_cost}
+
+    return {
+        "models": response_content["models"],
+        "sql_query": response_content["sql_query"],
+        "columns": response_content["columns"],
+        "cost": request_cost,
+    }
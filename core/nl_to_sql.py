@@ -1,5 +1,8 @@
 import os
 from logging import getLogger
+from odoo.addons.chartly.core.resources import get_text
+from odoo.addons.chartly.core.field_pruning import format_fields, prune_fields, record_savings
+from odoo.addons.chartly.core.prompt_prefix import assemble_messages
 import re
 
 logger = getLogger(__name__)
@@ -8,20 +11,35 @@ NL_TO_SQL_PROMPT_FILENAME = "nl_to_sql_prompt.txt"
 
 def get_nl_to_sql_prompt():
     filepath = os.path.join(os.path.dirname(__file__), NL_TO_SQL_PROMPT_FILENAME)
-    with open(filepath, "r") as f:
-        prompt = f.read()
-    return prompt
+    return get_text(filepath)
         
-def nl_to_sql(client, query: str, models: list[str], fields: dict)-> dict:
+def nl_to_sql(client, query: str, models: list[str], fields: dict, prune: bool = True, edges: dict = None,
+              types: dict = None, rows: dict = None, schema: str = None)-> dict:
+    """SQL answering `query` over `models`; with `prune`, only the fields relevant to it are described.
+
+    `types` and `rows`, from the schema snapshot, add the column types and row estimates.
+    The prompt prefix only holds what every question shares, the instructions and the full
+    `schema` of the database when given; the models and fields of the question follow it.
+    """
     prompt = get_nl_to_sql_prompt()
-    messages = []
-    messages = client.add_system_message(messages, prompt)
-    fields_str = ""
-    for k, v in fields.items():
-        fields_str += f"# {k}: {v}\n"
-    messages = client.add_user_message(messages, f"Models: {models}\nFields:\n{fields_str}")
-    messages = client.add_user_message(messages, f"Query: {query}")
-    response = client.chat_completion(messages, temperature= 0.3,)
+    models = sorted(models)
+    fields = {model: fields[model] for model in sorted(fields)}
+    if schema:
+        # The schema of the prefix already has the types and row estimates
+        types = rows = None
+    fields_str = format_fields(fields, types, rows)
+    if prune:
+        pruned_str = format_fields(prune_fields(query, fields, edges=edges), types, rows)
+        savings = record_savings(fields_str, pruned_str)
+        fields_str = pruned_str
+    messages = assemble_messages(
+        prompt, static=[f"Schema:\n{schema}"] if schema else [],
+        variable=f"Models: {models}\nFields:\n{fields_str}\nQuery: {query}"
+    )
+    response = client.chat_completion(messages, temperature= 0.3, stage="nl_to_sql")
     sql_query = response.get("content")
     request_cost = response.get("cost")
-    return {"sql_query": sql_query, "cost": request_cost}
\ No newline at end of file
+    result = {"sql_query": sql_query, "cost": request_cost}
+    if prune:
+        result["schema_tokens"] = savings
+    return result
@@ -1,10 +1,15 @@
 from typing import Callable
-import urllib.request
+from functools import partial
+import http.client
 import json
 import logging
+from odoo.addons.chartly.core.http_pool import get_connection_pool
+from odoo.addons.chartly.core.prompt_prefix import prefix_hash, record_prompt_usage
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_TOOL_ITERATIONS = 5
+
 PRICING = {
     'gpt-5.1': {
         'input_per_1M': 1.25,
@@ -30,168 +35,321 @@ PRICING = {
 
 class OpenAIClient:
     
-    def __init__(self, api_key, model):
+    def __init__(self, api_key, model, base_url='https://api.openai.com/v1'):
         self.api_key = api_key
-        self.base_url = 'https://api.openai.com/v1'
+        self.base_url = base_url
         self.timeout = 30
         self.model = model
 
-    def chat_completion(self, messages, max_tokens=1000, temperature=0.7, tools=None, tool_choice=None):
-        try:
+    def _build_request_data(self, messages, max_tokens, temperature, tools, tool_choice, response_format=None, stage=None):
+        data = {
+            'model': self.model,
+            'messages': messages,
+        }
+        if stage:
+            # Routes requests sharing a prompt prefix to the same cache
+            data['prompt_cache_key'] = f"chartly-{stage}-{prefix_hash(messages)}"
 
-            data = {
-                'model': self.model,
-                'messages': messages,
-            }
+        if self.model in ["gpt-5-nano", "gpt-5.1"]:
+            data["max_completion_tokens"] = max_tokens
+            data['temperature'] = 1
+        else:
+            data["max_tokens"] = max_tokens
+            data['temperature'] = temperature
+        
+        if tools:
+            data['tools'] = tools
+        if tool_choice:
+            data['tool_choice'] = tool_choice
+        if response_format:
+            data['response_format'] = response_format
+        return data
 
-            if self.model in ["gpt-5-nano", "gpt-5.1"]:
-                data["max_completion_tokens"] = max_tokens
-                data['temperature'] = 1
-            else:
-                data["max_tokens"] = max_tokens
-                data['temperature'] = temperature
-            
-            if tools:
-                data['tools'] = tools
-            if tool_choice:
-                data['tool_choice'] = tool_choice
-            
-            req = urllib.request.Request(
-                f'{self.base_url}/chat/completions',
-                data=json.dumps(data).encode('utf-8'),
-                headers={
-                    'Authorization': f'Bearer {self.api_key}',
-                    'Content-Type': 'application/json'
-                }
-            )
-            
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                
-                if 'choices' in result and len(result['choices']) > 0:
-                    choice = result['choices'][0]
-                   
-                    usage = result.get('usage', {})
-                    logger.info(f"OpenAI API response usage: {usage}")
-
-                    response_data = {
-                        'success': True,
-                        'content': choice['message'].get('content'),
-                        'usage': usage,
-                        'cost': self._compute_request_cost(self.model, usage),
-                        'model': result.get('model', self.model),
-                        'finish_reason': choice.get('finish_reason')
-                    }
-                    
-                    if 'tool_calls' in choice['message']:
-                        response_data['tool_calls'] = choice['message']['tool_calls']
-                    
-                    return response_data
-                else:
-                    logger.error(f"Unexpected API response format: {result}")
-                    return {
-                        'success': False,
-                        'error': 'Unexpected response format from OpenAI API'
-                    }
-                    
-        except urllib.error.HTTPError as e:
-            error_msg = self._parse_http_error(e)
-            logger.error(f"OpenAI API HTTP error: {e.code} - {error_msg}")
-            return {
-                'success': False,
-                'error': f'API request failed with status {e.code}: {error_msg}'
-            }
-            
-        except urllib.error.URLError as e:
-            logger.error(f"OpenAI API URL error: {str(e)}")
+    def _request_headers(self):
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+
+    def _http_error_response(self, status, body):
+        error_msg = self._parse_http_error(body)
+        logger.error(f"OpenAI API HTTP error: {status} - {error_msg}")
+        return {
+            'success': False,
+            'error': f'API request failed with status {status}: {error_msg}'
+        }
+
+    def _error_response(self, error):
+        if isinstance(error, (OSError, http.client.HTTPException)):
+            logger.error(f"OpenAI API connection error: {str(error)}")
             return {
                 'success': False,
                 'error': 'Request timeout or connection error'
             }
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse API response: {str(e)}")
+        if isinstance(error, json.JSONDecodeError):
+            logger.error(f"Failed to parse API response: {str(error)}")
             return {
                 'success': False,
                 'error': 'Invalid response from API'
             }
+        logger.error(f"Unexpected error calling OpenAI API: {str(error)}")
+        return {
+            'success': False,
+            'error': f'Unexpected error: {str(error)}'
+        }
+
+    def _build_response(self, message, finish_reason, usage, model, stage=None):
+        logger.info(f"OpenAI API response usage: {usage}")
+        record_prompt_usage(stage, usage)
+        response_data = {
+            'success': True,
+            'content': message.get('content'),
+            'usage': usage,
+            'cost': self._compute_request_cost(self.model, usage),
+            'model': model or self.model,
+            'finish_reason': finish_reason
+        }
+        
+        if message.get('tool_calls'):
+            response_data['tool_calls'] = message['tool_calls']
+        
+        return response_data
+
+    def chat_completion(self, messages, max_tokens=1000, temperature=0.7, tools=None, tool_choice=None, response_format=None, stage=None):
+        """Chat completion; `stage` names the caller in the prompt cache statistics"""
+        try:
+            data = self._build_request_data(messages, max_tokens, temperature, tools, tool_choice, response_format, stage)
+            
+            status, body = get_connection_pool().request(
+                'POST',
+                f'{self.base_url}/chat/completions',
+                body=json.dumps(data).encode('utf-8'),
+                headers=self._request_headers(),
+                timeout=self.timeout
+            )
+
+            if status >= 400:
+                return self._http_error_response(status, body)
+
+            result = json.loads(body.decode('utf-8'))
+                
+            if 'choices' in result and len(result['choices']) > 0:
+                choice = result['choices'][0]
+                return self._build_response(choice['message'], choice.get('finish_reason'), result.get('usage', {}), result.get('model'), stage)
+            else:
+                logger.error(f"Unexpected API response format: {result}")
+                return {
+                    'success': False,
+                    'error': 'Unexpected response format from OpenAI API'
+                }
             
         except Exception as e:
-            logger.error(f"Unexpected error calling OpenAI API: {str(e)}")
-            return {
-                'success': False,
-                'error': f'Unexpected error: {str(e)}'
+            return self._error_response(e)
+
+    def chat_completion_stream(self, messages, max_tokens=1000, temperature=0.7, tools=None, tool_choice=None, stage=None):
+        """Stream a chat completion over server-sent events.
+
+        Yields `{'type': 'token', 'content': ...}` for every text delta, then a final
+        `{'type': 'done', 'response': ...}` whose response has the same shape as `chat_completion`'s.
+        """
+        try:
+            data = self._build_request_data(messages, max_tokens, temperature, tools, tool_choice, stage=stage)
+            data['stream'] = True
+            data['stream_options'] = {'include_usage': True}
+
+            with get_connection_pool().open(
+                'POST',
+                f'{self.base_url}/chat/completions',
+                body=json.dumps(data).encode('utf-8'),
+                headers=self._request_headers(),
+                timeout=self.timeout
+            ) as response:
+
+                if response.status >= 400:
+                    yield {'type': 'done', 'response': self._http_error_response(response.status, response.read())}
+                    return
+
+                content = []
+                tool_calls = {}
+                finish_reason = None
+                usage = {}
+                model = None
+
+                for line in response:
+                    line = line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+
+                    chunk = json.loads(payload)
+                    model = chunk.get('model', model)
+                    usage = chunk.get('usage') or usage
+
+                    for choice in chunk.get('choices', []):
+                        delta = choice.get('delta', {})
+                        if delta.get('content'):
+                            content.append(delta['content'])
+                            yield {'type': 'token', 'content': delta['content']}
+                        for tool_call in delta.get('tool_calls', []):
+                            call = tool_calls.setdefault(tool_call.get('index', 0), {
+                                'id': None,
+                                'type': 'function',
+                                'function': {'name': '', 'arguments': ''}
+                            })
+                            call['id'] = tool_call.get('id') or call['id']
+                            function = tool_call.get('function', {})
+                            call['function']['name'] += function.get('name') or ''
+                            call['function']['arguments'] += function.get('arguments') or ''
+                        finish_reason = choice.get('finish_reason') or finish_reason
+
+                # Drain the end of the chunked body so the connection can be reused
+                response.read()
+
+            message = {
+                'content': ''.join(content) or None,
+                'tool_calls': [tool_calls[index] for index in sorted(tool_calls)],
             }
+            yield {'type': 'done', 'response': self._build_response(message, finish_reason, usage, model, stage)}
+
+        except Exception as e:
+            yield {'type': 'done', 'response': self._error_response(e)}
     
-    def chat_completion_with_tools(self, messages, tools_descriptions, tools, max_tokens=1000, temperature=0.7, tool_choice='auto'):
+    def chat_completion_with_tools(self, messages, tools_descriptions, tools, max_tokens=1000, temperature=0.7, tool_choice='auto',
+                                   max_iterations=DEFAULT_MAX_TOOL_ITERATIONS, run_tool_calls=None, stage='chat'):
+        """Chat completion that runs the tools the model calls until it answers.
+
+        Every tool call of a response is run, through `run_tool_calls` when given so that
+        independent calls can run concurrently. After `max_iterations` rounds of tool calls
+        the model is asked to answer without tools.
+        """
         history = messages.copy()
         tool_generated_image= None
         cost = 0
 
         logger.debug(f"Passed messages: \n {history}")
 
-        while True:
+        for iteration in range(max_iterations + 1):
             logger.info(f"Calling chat completion")
-            response = self.chat_completion(history, max_tokens=max_tokens, temperature=temperature, tools=tools_descriptions, tool_choice=tool_choice)
+            response = self.chat_completion(history, max_tokens=max_tokens, temperature=temperature, tools=tools_descriptions,
+                                            tool_choice=self._round_tool_choice(tool_choice, iteration, max_iterations), stage=stage)
             
             logger.info(f"Chat completion response: {response}")
-            if response.get('tool_calls') is None:
+            if not response.get('tool_calls'):
                 logger.info(f"Chat compeltion with tools ended")
                 response["cost"] = cost + response.get("cost", 0)
                 if tool_generated_image:
                     response["image"] = tool_generated_image
                 return response
             
-            # if len(response.get('tool_calls')) > 1:
-            #     logger.error("Multiple tool calls in a single response are not supported.")
-            #     response["cost"] = cost + response.get("cost", 0)
-            #     response["success"] = False
-            #     response["error"] = "Failed to call a tool" #"Multiple tool calls in a single response are not supported."
-            #     return response
-            
-            history = self.add_tool_call(history, response['tool_calls'][0])
-            
-            # Call the tool
-            tool_name = response['tool_calls'][0]['function']['name']
-            tool_input = response['tool_calls'][0]['function']['arguments']
-            tool_input = json.loads(tool_input)
-
-            if tool_name in [tool['function']['name'] for tool in tools_descriptions]:
-
-                tool_map = tools.get(tool_name, None)
-                # if not tool_map:
-                #     response["cost"] = cost + response.get("cost", 0)
-                #     response["success"] = False
-                #     response["error"] = "Failed to call a tool" # f"Tool {tool_name} is not in passed tools"
-                #     return response 
-                
-                tool_return_type = tool_map.get("return_type")
-                tool_callable = tool_map.get("tool_callable")
-                
-                tool_response = self.execute_tool(tool_callable, tool_input)
+            cost += response.get("cost", 0)
+            history, tool_cost, tool_image = self._call_tools(history, response['tool_calls'], tools_descriptions, tools, run_tool_calls)
+            cost += tool_cost
+            tool_generated_image = tool_image or tool_generated_image
+
+        logger.error(f"Chat completion still calling tools after {max_iterations} rounds")
+        return {
+            'success': False,
+            'error': 'Too many tool calls',
+            'cost': cost,
+        }
 
-                if tool_return_type=="text":
-                    tool_content = tool_response.get("text")
-                elif tool_return_type=="image":
-                    tool_content = tool_response.get("text")
-                    tool_generated_image = tool_response.get("image")
+    def chat_completion_with_tools_stream(self, messages, tools_descriptions, tools, max_tokens=1000, temperature=0.7, tool_choice='auto',
+                                          max_iterations=DEFAULT_MAX_TOOL_ITERATIONS, run_tool_calls=None, stage='chat'):
+        """Streaming variant of `chat_completion_with_tools`, yielding the events of `chat_completion_stream`"""
+        history = messages.copy()
+        tool_generated_image = None
+        cost = 0
+
+        for iteration in range(max_iterations + 1):
+            response = None
+            for event in self.chat_completion_stream(history, max_tokens=max_tokens, temperature=temperature, tools=tools_descriptions,
+                                                     tool_choice=self._round_tool_choice(tool_choice, iteration, max_iterations), stage=stage):
+                if event['type'] == 'done':
+                    response = event['response']
                 else:
-                    tool_content = tool_response
-                
-                cost += tool_response.get('cost', 0)
-                history = self.add_tool_response(history, response['tool_calls'][0].get('id'), tool_name, tool_content)
+                    yield event
+
+            if not response.get('tool_calls'):
+                response["cost"] = cost + response.get("cost", 0)
+                if tool_generated_image:
+                    response["image"] = tool_generated_image
+                yield {'type': 'done', 'response': response}
+                return
+
+            cost += response.get("cost", 0)
+            history, tool_cost, tool_image = self._call_tools(history, response['tool_calls'], tools_descriptions, tools, run_tool_calls)
+            cost += tool_cost
+            tool_generated_image = tool_image or tool_generated_image
+
+        logger.error(f"Chat completion still calling tools after {max_iterations} rounds")
+        yield {'type': 'done', 'response': {'success': False, 'error': 'Too many tool calls', 'cost': cost}}
+
+    @staticmethod
+    def _round_tool_choice(tool_choice, iteration, max_iterations):
+        # The last round must answer with what the tools returned so far
+        return 'none' if iteration == max_iterations else tool_choice
+
+    def _call_tools(self, history, tool_calls, tools_descriptions, tools, run_tool_calls=None):
+        """Run all the tool calls of a response and append them with their results to the history.
+
+        Results are appended in the order of the calls. Returns the new history, the tools
+        cost and the last image generated by a tool, if any.
+        """
+        calls = [partial(self._run_tool, tool_call, tools_descriptions, tools) for tool_call in tool_calls]
+        results = run_tool_calls(calls) if run_tool_calls else [call() for call in calls]
+
+        cost = 0
+        tool_generated_image = None
+        history = self.add_tool_calls(history, tool_calls)
+        for tool_call, (tool_content, tool_cost, tool_image) in zip(tool_calls, results):
+            history = self.add_tool_response(history, tool_call.get('id'), tool_call['function']['name'], tool_content)
+            cost += tool_cost
+            tool_generated_image = tool_image or tool_generated_image
+        return history, cost, tool_generated_image
+
+    def _run_tool(self, tool_call, tools_descriptions, tools):
+        """Run one tool call and return its content, its cost and the image it generated, if any"""
+        tool_name = tool_call['function']['name']
+        if tool_name not in [tool['function']['name'] for tool in tools_descriptions] or tool_name not in tools:
+            # Every call needs an answer, or the next request is rejected
+            logger.error(f"Model called unknown tool {tool_name}")
+            return f"Unknown tool {tool_name}", 0, None
+
+        try:
+            tool_input = json.loads(tool_call['function']['arguments'] or '{}')
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid arguments for tool {tool_name}: {str(e)}")
+            return f"Invalid arguments for tool {tool_name}", 0, None
+
+        tool_map = tools[tool_name]
+        tool_return_type = tool_map.get("return_type")
+        tool_callable = tool_map.get("tool_callable")
+
+        tool_response = self.execute_tool(tool_callable, tool_input)
+
+        tool_generated_image = None
+        if tool_return_type=="text":
+            tool_content = tool_response.get("text")
+        elif tool_return_type=="image":
+            tool_content = tool_response.get("text")
+            tool_generated_image = tool_response.get("image")
+        else:
+            tool_content = tool_response
+
+        return tool_content, tool_response.get('cost', 0), tool_generated_image
           
-    def _parse_http_error(self, error):
+    def _parse_http_error(self, body):
         try:
-            if hasattr(error, 'read'):
-                error_body = json.loads(error.read().decode('utf-8'))
-                if 'error' in error_body:
-                    if isinstance(error_body['error'], dict):
-                        return error_body['error'].get('message', str(error))
-                    return str(error_body['error'])
-            return str(error)
+            error_body = json.loads(body.decode('utf-8'))
+            if 'error' in error_body:
+                if isinstance(error_body['error'], dict):
+                    return error_body['error'].get('message', str(error_body))
+                return str(error_body['error'])
+            return str(error_body)
         except Exception:
-            return str(error)
+            return body.decode('utf-8', errors='replace')
         
     def _compute_request_cost(self, model, usage):
         input_tokens = usage.get('prompt_tokens', 0)
@@ -216,16 +374,6 @@ class OpenAIClient:
             logger.error(f"Error executing tool {function}: {str(e)}")
             return {"text": f"Error executing tool {function}: {str(e)}", "error": True, "cost": 0}
 
-    @staticmethod
-    def prepare_chat_history(chat_messages):
-        messages = []
-        for msg in chat_messages.sorted('created_at'):
-            if msg.sender == 'user':
-                messages.append({"role": "user", "content": msg.content})
-            elif msg.sender == 'ai':
-                messages.append({"role": "assistant", "content": msg.content})
-        return messages
-    
     @staticmethod
     def add_user_message(messages, user_content):
         return messages + [{"role": "user", "content": user_content}]
@@ -240,6 +388,11 @@ class OpenAIClient:
     
     @staticmethod
     def add_tool_call(messages, tool_call):
+        return OpenAIClient.add_tool_calls(messages, [tool_call])
+
+    @staticmethod
+    def add_tool_calls(messages, tool_calls):
+        # All the calls of a response go in one assistant message, followed by one tool message per call
         messages.append({
             "role": "assistant",
             "tool_calls": [{
@@ -249,7 +402,7 @@ class OpenAIClient:
                     "name": tool_call.get('function').get("name"),
                     "arguments": tool_call.get('function').get("arguments")
                 }
-            }]
+            } for tool_call in tool_calls]
         })
         return messages
     
@@ -281,4 +434,7 @@ def create_function_tool(name, description, parameters, required):
 def get_openai_client(env):
     api_key = env['ir.config_parameter'].sudo().get_param('chartly.api_key')
     model = env['ir.config_parameter'].sudo().get_param('chartly.model')
+    pool_size = env['ir.config_parameter'].sudo().get_param('chartly.http_pool_size')
+    if pool_size:
+        get_connection_pool().configure(max_size=pool_size)
     return OpenAIClient(api_key, model)
\ No newline at end of file
@@ -0,0 +1,250 @@
+import atexit
+import json
+import os
+import pickle
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+from odoo.addons.chartly.core.utils import compile_script, extract_script_as_fct
+from odoo.addons.chartly.core.chart_renderer import check_spec, render_chart
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_CPU_LIMIT = 10
+DEFAULT_TIMEOUT = 30
+STARTUP_TIMEOUT = 60
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "plot_worker.py")
+HEADER = struct.Struct(">I")
+
+
+class RendererTimeout(TimeoutError):
+    pass
+
+
+class _Worker:
+    """One renderer process and the pipes to talk to it"""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            close_fds=True,
+        )
+        self.ready = False
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def _read_exact(self, size, deadline):
+        fd = self.process.stdout.fileno()
+        chunks = []
+        while size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise RendererTimeout("Plot renderer did not answer in time")
+            chunk = os.read(fd, size)
+            if not chunk:
+                raise RuntimeError(f"Plot renderer exited with code {self.process.wait()}")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def receive(self, deadline) -> dict:
+        (size,) = HEADER.unpack(self._read_exact(HEADER.size, deadline))
+        return json.loads(self._read_exact(size, deadline))
+
+    def send(self, payload: dict):
+        body = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        self.process.stdin.write(HEADER.pack(len(body)) + body)
+        self.process.stdin.flush()
+
+    def wait_ready(self):
+        if not self.ready:
+            self.receive(time.monotonic() + STARTUP_TIMEOUT)
+            self.ready = True
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+    def close(self):
+        # Closing stdin makes the worker leave its loop
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+
+class RendererPool:
+    """Pre-started processes with matplotlib loaded, running build_plot scripts under CPU and wall-clock limits.
+
+    Workers are started as plain interpreters rather than forked, so they never inherit the
+    database connections or locks of the Odoo worker. A worker that times out or crashes is
+    killed and replaced on the next render.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, cpu_limit=DEFAULT_CPU_LIMIT, timeout=DEFAULT_TIMEOUT):
+        self.size = size
+        self.cpu_limit = cpu_limit
+        self.timeout = timeout
+        self.renders = 0
+        self.restarts = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def configure(self, size=None, cpu_limit=None, timeout=None):
+        with self._lock:
+            if size is not None:
+                self.size = max(0, int(size))
+            if cpu_limit is not None:
+                self.cpu_limit = int(cpu_limit)
+            if timeout is not None:
+                self.timeout = float(timeout)
+            extra, self._idle = self._idle[self.size:], self._idle[:self.size]
+        for worker in extra:
+            worker.close()
+
+    def stats(self):
+        with self._lock:
+            return {"renders": self.renders, "restarts": self.restarts, "idle": len(self._idle), "size": self.size}
+
+    def warm(self):
+        """Start workers until `size` of them are idle"""
+        with self._lock:
+            missing = self.size - len(self._idle)
+            self._idle.extend(_Worker() for _ in range(max(0, missing)))
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+    def _acquire(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    return worker
+                worker.kill()
+        return _Worker()
+
+    def _release(self, worker):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def render(self, script: str, data, function_name: str = "build_plot", script_key=None) -> str:
+        """Run `function_name` from the checked `script` on `data` in a worker and return the base64 image.
+
+        When `script_key` is given, workers reuse their compiled copy of the script.
+        """
+        return self._run(data, {"script": script, "script_key": script_key, "function_name": function_name})
+
+    def render_spec(self, spec: dict, data) -> str:
+        """Draw the chart `spec` from `data` in a worker and return the base64 image"""
+        return self._run(data, {"spec": spec})
+
+    def _run(self, data, request: dict) -> str:
+        worker = self._acquire()
+        try:
+            worker.wait_ready()
+            worker.send(dict(
+                request,
+                columns=list(data.columns),
+                data=[data.column(c) for c in data.columns],
+                cpu_limit=self.cpu_limit,
+            ))
+            response = worker.receive(time.monotonic() + self.timeout)
+        except Exception:
+            worker.kill()
+            with self._lock:
+                self.restarts += 1
+            raise
+        self._release(worker)
+        with self._lock:
+            self.renders += 1
+        if "error" in response:
+            raise RuntimeError(f"Plot rendering failed: {response['error']}")
+        return response["image"]
+
+
+# One pool per worker process; renderer pipes must not be shared across a fork
+_pool = RendererPool()
+_pool_pid = os.getpid()
+
+
+def get_renderer_pool() -> RendererPool:
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        _pool = RendererPool(_pool.size, _pool.cpu_limit, _pool.timeout)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+@atexit.register
+def _close_pool():
+    if _pool_pid == os.getpid():
+        _pool.clear()
+
+
+def configure_renderer_pool(env) -> RendererPool:
+    params = env['ir.config_parameter'].sudo()
+    size = params.get_param('chartly.plot_pool_size')
+    cpu_limit = params.get_param('chartly.plot_cpu_limit')
+    timeout = params.get_param('chartly.plot_timeout')
+    pool = get_renderer_pool()
+    pool.configure(
+        size=size if size not in (None, False, '') else None,
+        cpu_limit=cpu_limit or None,
+        timeout=timeout or None,
+    )
+    return pool
+
+
+def render_plot(env, script: str, data, function_name: str = "build_plot") -> str:
+    """Check `script` and run its `function_name` on `data`, returning the base64 image.
+
+    Uses the renderer pool, or the current process when the pool size is set to 0.
+    """
+    pool = configure_renderer_pool(env)
+    if not pool.size:
+        return extract_script_as_fct(script, function_name)(data)
+    compiled = compile_script(script)
+    # Workers are started by the first render of each Odoo worker process, not at import or
+    # registry load, so that shells, upgrades and processes that never draw don't start any
+    pool.warm()
+    return pool.render(compiled.script, data, function_name, script_key=compiled.key)
+
+
+def render_chart_spec(env, spec: dict, data) -> str:
+    """Draw the declarative chart `spec` from `data`, returning the base64 image.
+
+    Raises ValueError when `spec` doesn't fit the columns of `data`.
+    """
+    reason = check_spec(spec, data.columns)
+    if reason:
+        raise ValueError(reason)
+    pool = configure_renderer_pool(env)
+    if not pool.size:
+        return render_chart(spec, data)
+    pool.warm()
+    return pool.render_spec(spec, data)
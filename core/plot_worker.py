@@ -0,0 +1,134 @@
+"""Standalone plot renderer process, started by plot_renderer.RendererPool.
+
+Runs outside of Odoo: it only needs matplotlib, result_set.py and chart_renderer.py.
+Requests are read from stdin and responses written to stdout, each as a 4 bytes
+big-endian length followed by the payload. Requests are pickled dicts with
+`columns`, `data`, `cpu_limit` and either a chart `spec` or a `script`, its
+`script_key` and `function_name`; responses are JSON objects with either `image`
+or `error`, so the parent never unpickles anything coming from generated code.
+"""
+import base64
+import importlib.util
+import json
+import os
+import pickle
+import resource
+import signal
+import struct
+import sys
+from collections import OrderedDict
+from io import BytesIO
+
+HEADER = struct.Struct(">I")
+COMPILED_SCRIPT_CACHE_SIZE = 64
+
+_compiled_scripts = OrderedDict()
+
+
+def _load_module(name):
+    # Load by path so that the other modules of core/ don't shadow installed packages
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{name}.py")
+    spec = importlib.util.spec_from_file_location(f"chartly_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _read_frame(stream):
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    (size,) = HEADER.unpack(header)
+    return stream.read(size)
+
+
+def _write_frame(stream, payload: dict):
+    body = json.dumps(payload).encode("utf-8")
+    stream.write(HEADER.pack(len(body)) + body)
+    stream.flush()
+
+
+def _limit_cpu(seconds):
+    # RLIMIT_CPU counts the whole process lifetime, so the limit is moved past the time already used
+    if not seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + int(seconds)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _compile(script, key):
+    if key is None:
+        return compile(script, "<plot_script>", "exec")
+    code = _compiled_scripts.get(key)
+    if code is None:
+        code = _compiled_scripts[key] = compile(script, "<plot_script>", "exec")
+        if len(_compiled_scripts) > COMPILED_SCRIPT_CACHE_SIZE:
+            _compiled_scripts.popitem(last=False)
+    else:
+        _compiled_scripts.move_to_end(key)
+    return code
+
+
+def _render(request, ResultSet, chart_renderer, matplotlib, plt):
+    data = ResultSet(request["columns"], request["data"])
+    if request.get("spec") is not None:
+        return chart_renderer.render_chart(request["spec"], data)
+    namespace = {
+        "plt": plt,
+        "matplotlib": matplotlib,
+        "base64": base64,
+        "BytesIO": BytesIO,
+    }
+    try:
+        exec(_compile(request["script"], request.get("script_key")), namespace)
+        image = namespace[request["function_name"]](data)
+    finally:
+        plt.close("all")
+    if isinstance(image, bytes):
+        image = image.decode("ascii")
+    if not isinstance(image, str):
+        raise TypeError(f"{request['function_name']} must return a base64 string, not {type(image).__name__}")
+    return image
+
+
+def main():
+    # Ctrl+C is for the Odoo server, the worker exits when its stdin is closed
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    requests = sys.stdin.buffer
+    responses = sys.stdout.buffer
+    # Anything printed by generated code goes to the server log, not into the protocol
+    sys.stdout = sys.stderr
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    # Build the font cache and the Agg canvas once, before the first real chart
+    figure = plt.figure()
+    figure.canvas.draw()
+    plt.close(figure)
+
+    ResultSet = _load_module("result_set").ResultSet
+    chart_renderer = _load_module("chart_renderer")
+    _write_frame(responses, {"ready": True})
+
+    while True:
+        frame = _read_frame(requests)
+        if frame is None:
+            return
+        request = pickle.loads(frame)
+        try:
+            _limit_cpu(request.get("cpu_limit"))
+            response = {"image": _render(request, ResultSet, chart_renderer, matplotlib, plt)}
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        _write_frame(responses, response)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import hashlib
+import threading
+from collections import defaultdict
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+# The provider only caches prompts from this many tokens, in steps of 128
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+_usage = defaultdict(lambda: {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "cacheable_requests": 0})
+_usage_lock = threading.Lock()
+
+
+def assemble_messages(instructions: str, static=(), history=(), variable: str = None) -> list:
+    """Chat messages ordered for provider-side prompt caching.
+
+    The prompt cache only reuses the longest identical prefix of a request, so the parts that
+    never change with the question come first, byte for byte the same on every call: the
+    `instructions`, then the `static` blocks (catalog, schema), joined in one system message.
+    The `history`, which only grows at its end, follows, and the `variable` part, usually the
+    question, comes last. Callers keep static blocks deterministic (sorted, same formatting).
+    """
+    system = "\n\n".join(block.strip() for block in (instructions, *static) if block and block.strip())
+    messages = [{"role": "system", "content": system}] + list(history)
+    if variable is not None:
+        messages.append({"role": "user", "content": variable})
+    return messages
+
+
+def prefix_hash(messages) -> str:
+    """Hash of the system message, the part of the prompt meant to be cached"""
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    return hashlib.sha256(system.encode("utf-8")).hexdigest()[:12]
+
+
+def record_prompt_usage(stage: str, usage: dict):
+    """Add the prompt and cached tokens of one request of `stage` to the running totals"""
+    prompt_tokens = usage.get('prompt_tokens', 0) or 0
+    cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens', 0) or 0
+    with _usage_lock:
+        totals = _usage[stage or "other"]
+        totals["requests"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["cached_tokens"] += cached_tokens
+        if prompt_tokens >= PROMPT_CACHE_MIN_TOKENS:
+            totals["cacheable_requests"] += 1
+    if prompt_tokens:
+        logger.info(f"Prompt cache for {stage}: {cached_tokens} of {prompt_tokens} prompt tokens cached")
+
+
+def get_prompt_cache_stats() -> dict:
+    """Prompt and cached tokens per stage, with the share of prompt tokens read from the cache"""
+    with _usage_lock:
+        stats = {stage: dict(totals) for stage, totals in _usage.items()}
+    for totals in stats.values():
+        totals["cached_ratio"] = round(totals["cached_tokens"] / totals["prompt_tokens"], 3) if totals["prompt_tokens"] else 0.0
+    return stats
@@ -0,0 +1,67 @@
+import os
+import json
+import threading
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+CORE_DIR = os.path.dirname(__file__)
+ALLOWED_ODOO_MODELS_FILE = os.path.join(CORE_DIR, "allowed_odoo_models.txt")
+MODEL_FIELDS_MAP_FILE = os.path.join(CORE_DIR, "accounting_schema.json")
+
+
+class ResourceRegistry:
+    """Process-level cache of parsed resource files, reloaded when a file's mtime changes."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, loader):
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._entries.get(path)
+        if entry and entry[0] == mtime:
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == mtime:
+                return entry[1]
+            logger.info(f"Loading resource: {path}")
+            value = loader(path)
+            self._entries[path] = (mtime, value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _load_text(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _load_allowed_models(path):
+    return frozenset(_load_text(path).split())
+
+
+def _load_model_fields(path):
+    with open(path, "r") as f:
+        model_fields_map = json.load(f)
+    logger.info(f"Loaded fields for {len(model_fields_map)} models")
+    return {model: tuple(fields) for model, fields in model_fields_map.items()}
+
+
+registry = ResourceRegistry()
+
+
+def get_text(path: str) -> str:
+    return registry.get(path, _load_text)
+
+
+def get_allowed_models() -> frozenset:
+    return registry.get(ALLOWED_ODOO_MODELS_FILE, _load_allowed_models)
+
+
+def get_model_fields_map() -> dict:
+    return registry.get(MODEL_FIELDS_MAP_FILE, _load_model_fields)
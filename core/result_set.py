@@ -0,0 +1,71 @@
+from collections.abc import Mapping, Sequence
+
+
+class Row(Mapping):
+    """Read-only view on one row of a ResultSet, usable like a dict"""
+
+    __slots__ = ("_result", "_index")
+
+    def __init__(self, result, index):
+        self._result = result
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._result._data[self._result._positions[key]][self._index]
+
+    def __iter__(self):
+        return iter(self._result.columns)
+
+    def __len__(self):
+        return len(self._result.columns)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ResultSet(Sequence):
+    """Columnar query result: column names are stored once and values are kept per column.
+
+    Indexing returns lazy Row views, slicing returns a ResultSet, and `column(name)`
+    gives direct access to all the values of a column.
+    """
+
+    __slots__ = ("columns", "_data", "_positions")
+
+    def __init__(self, columns, data=None):
+        self.columns = list(columns)
+        self._data = data if data is not None else [[] for _ in self.columns]
+        self._positions = {name: position for position, name in enumerate(self.columns)}
+
+    def extend(self, rows):
+        """Append row tuples, as returned by a database cursor"""
+        for row in rows:
+            for values, value in zip(self._data, row):
+                values.append(value)
+
+    def column(self, name) -> list:
+        return self._data[self._positions[name]]
+
+    def select(self, columns):
+        """ResultSet restricted to `columns`, sharing the underlying values"""
+        columns = [c for c in columns if c in self._positions]
+        return ResultSet(columns, [self.column(c) for c in columns])
+
+    def to_dicts(self) -> list:
+        """Rows as a list of dicts, for code that needs plain dicts"""
+        return [dict(zip(self.columns, row)) for row in zip(*self._data)]
+
+    def __len__(self):
+        return len(self._data[0]) if self._data else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ResultSet(self.columns, [values[index] for values in self._data])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ResultSet index out of range")
+        return Row(self, index)
+
+    def __repr__(self):
+        return f"ResultSet(columns={self.columns}, rows={len(self)})"
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import threading
+from collections import namedtuple
+from logging import getLogger
+from odoo.addons.chartly.core.resources import get_allowed_models
+
+logger = getLogger(__name__)
+
+SCHEMA_SNAPSHOT_MODEL = "chartly.schema.model"
+SCHEMA_VERSION_PARAM = "chartly.schema_version"
+# Changes when row estimates are rewritten, which leaves the schema version as it is
+SCHEMA_ROWS_PARAM = "chartly.schema_rows_version"
+
+# Bump when the layout of a snapshot entry changes, every entry is then regenerated
+SNAPSHOT_FORMAT = 3
+
+# Row estimates are only rewritten when they move by more than this factor
+ROWS_CHANGE_FACTOR = 2
+
+COLUMNS_SQL = """
+    SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod)
+      FROM pg_attribute a
+      JOIN pg_class c ON c.oid = a.attrelid
+      JOIN pg_namespace n ON n.oid = c.relnamespace
+     WHERE n.nspname = current_schema()
+       AND c.relkind = 'r'
+       AND c.relname = ANY(%s)
+       AND a.attnum > 0
+       AND NOT a.attisdropped
+     ORDER BY c.relname, a.attnum
+"""
+
+FOREIGN_KEYS_SQL = """
+    SELECT c.relname, a.attname, r.relname
+      FROM pg_constraint k
+      JOIN pg_class c ON c.oid = k.conrelid
+      JOIN pg_class r ON r.oid = k.confrelid
+      JOIN pg_namespace n ON n.oid = c.relnamespace
+      JOIN pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = k.conkey[1]
+     WHERE n.nspname = current_schema()
+       AND k.contype = 'f'
+       AND array_length(k.conkey, 1) = 1
+       AND c.relname = ANY(%s)
+     ORDER BY c.relname, a.attname
+"""
+ROWS_SQL = """
+    SELECT c.relname, c.reltuples::bigint
+      FROM pg_class c
+      JOIN pg_namespace n ON n.oid = c.relnamespace
+     WHERE n.nspname = current_schema()
+       AND c.relkind = 'r'
+       AND c.relname = ANY(%s)
+"""
+
+
+class SchemaSnapshot(namedtuple("SchemaSnapshot", ["version", "models", "rows_version"], defaults=[None])):
+    """Column types, foreign keys and row estimates of the allowed models.
+
+    `models` maps each model to {"table", "columns": [[name, type], ...], "edges": {column:
+    table}, "rows"}. `version` changes with any column or foreign key, not with row counts.
+    """
+
+    def columns(self, model: str) -> list:
+        entry = self.models.get(model)
+        return [name for name, _ in entry["columns"]] if entry else []
+
+    def column_types(self, models) -> dict:
+        """{model: {column: type}} of `models`"""
+        return {model: dict(self.models[model]["columns"]) for model in models if model in self.models}
+
+    def row_estimates(self, models) -> dict:
+        """{model: rows} estimated by the planner statistics, for `models`"""
+        return {model: self.models[model].get("rows", 0) for model in models if model in self.models}
+
+    def edges(self, models) -> dict:
+        """{model: {column: table}} foreign keys of `models`, restricted to the tables of `models`"""
+        tables = {self.models[m]["table"] for m in models if m in self.models}
+        return {
+            model: {c: t for c, t in self.models[model]["edges"].items() if t in tables}
+            for model in models if model in self.models
+        }
+
+
+def model_table(model: str) -> str:
+    return model.replace(".", "_")
+
+
+def introspect(cr, models) -> dict:
+    """Snapshot entries of `models` read from the database catalog, for the tables that exist"""
+    tables = {model_table(model): model for model in models}
+    entries = {}
+    cr.execute(COLUMNS_SQL, [list(tables)])
+    for table, column, column_type in cr.fetchall():
+        entry = entries.setdefault(tables[table], {"table": table, "columns": [], "edges": {}, "rows": 0})
+        entry["columns"].append([column, column_type])
+    cr.execute(FOREIGN_KEYS_SQL, [list(tables)])
+    for table, column, target in cr.fetchall():
+        if tables[table] in entries:
+            entries[tables[table]]["edges"][column] = target
+    cr.execute(ROWS_SQL, [list(tables)])
+    for table, rows in cr.fetchall():
+        if tables[table] in entries:
+            # -1 until the table is first analyzed
+            entries[tables[table]]["rows"] = max(rows, 0)
+    return entries
+
+
+def entry_hash(entry: dict) -> str:
+    """Hash of the structure of a snapshot entry, row estimates left out"""
+    structure = [SNAPSHOT_FORMAT, entry["table"], entry["columns"], sorted(entry["edges"].items())]
+    return hashlib.sha256(dump_entry(structure).encode("utf-8")).hexdigest()[:16]
+
+
+def snapshot_version(hashes: dict) -> str:
+    digest = hashlib.sha256()
+    for model, model_hash in sorted(hashes.items()):
+        digest.update(f"{model}:{model_hash}\0".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def dump_entry(entry) -> str:
+    return json.dumps(entry, separators=(",", ":"))
+
+
+def rows_changed(old: int, new: int) -> bool:
+    low, high = sorted((max(old, 1), max(new, 1)))
+    return high > low * ROWS_CHANGE_FACTOR
+
+
+def get_snapshot_models() -> list:
+    return sorted(get_allowed_models())
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_schema_snapshot(env):
+    """The schema snapshot of the database of `env`, or None before it is generated.
+
+    Entries are decoded once per process and version; checking the version only reads a
+    cached system parameter.
+    """
+    params = env['ir.config_parameter'].sudo()
+    version = params.get_param(SCHEMA_VERSION_PARAM)
+    if not version:
+        return None
+    rows_version = params.get_param(SCHEMA_ROWS_PARAM)
+    dbname = env.cr.dbname
+    snapshot = _snapshots.get(dbname)
+    if snapshot is not None and (snapshot.version, snapshot.rows_version) == (version, rows_version):
+        return snapshot
+    with _snapshots_lock:
+        snapshot = _snapshots.get(dbname)
+        if snapshot is None or (snapshot.version, snapshot.rows_version) != (version, rows_version):
+            records = env[SCHEMA_SNAPSHOT_MODEL].sudo().search_read([], ['model', 'data'])
+            snapshot = SchemaSnapshot(version, {r['model']: json.loads(r['data']) for r in records}, rows_version)
+            _snapshots[dbname] = snapshot
+            logger.info(f"Loaded schema snapshot {version} of {len(snapshot.models)} models")
+        return snapshot
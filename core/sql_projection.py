@@ -0,0 +1,159 @@
+import re
+from functools import lru_cache
+import sqlglot
+from sqlglot import exp
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+SQL_DIALECT = "postgres"
+PROJECTION_ALIAS = "chartly_result"
+
+FUNCTION_CALL = re.compile(r"^([a-z_][a-z0-9_]*)\s*\(", re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def parse_sql(sql_query: str) -> tuple:
+    """Parse `sql_query` into its statements, once per distinct query text.
+
+    The returned trees are shared, copy them before modifying them.
+    """
+    return tuple(s for s in sqlglot.parse(sql_query, read=SQL_DIALECT) if s is not None)
+
+
+def parse_select(sql_query: str):
+    """Parse `sql_query` into a SELECT expression, or return None if it is not a single SELECT"""
+    try:
+        statements = parse_sql(sql_query)
+    except sqlglot.errors.ParseError as e:
+        logger.warning(f"Could not parse SQL query: {e}")
+        return None
+    if len(statements) != 1 or not isinstance(statements[0], exp.Select):
+        return None
+    return statements[0].copy()
+
+
+def parse_query(sql_query: str):
+    """Parse `sql_query` into a SELECT or set operation (UNION, ...), or return None if it is not a single one"""
+    try:
+        statements = parse_sql(sql_query)
+    except sqlglot.errors.ParseError as e:
+        logger.warning(f"Could not parse SQL query: {e}")
+        return None
+    if len(statements) != 1 or not isinstance(statements[0], (exp.Select, exp.SetOperation)):
+        return None
+    return statements[0].copy()
+
+
+def output_name(expression):
+    """Name Postgres gives to the output column of a select `expression`, or None when unsure.
+
+    Aliases and columns keep their name, function calls and aggregates are named after the
+    function (sum, count, date_trunc, ...), casts and parentheses after what they wrap.
+    """
+    if isinstance(expression, exp.Alias):
+        return expression.alias or None
+    if isinstance(expression, exp.Column):
+        return None if expression.is_star else expression.name
+    if isinstance(expression, (exp.Cast, exp.Paren)):
+        return output_name(expression.this)
+    if isinstance(expression, exp.Case):
+        return "case"
+    if isinstance(expression, exp.Subquery) and isinstance(expression.this, exp.Select):
+        inner = expression.this.expressions
+        return output_name(inner[0]) if len(inner) == 1 else None
+    if isinstance(expression, exp.Func):
+        match = FUNCTION_CALL.match(expression.sql(dialect=SQL_DIALECT))
+        return match.group(1).lower() if match else None
+    # Postgres names anything else "?column?", which can't be selected again
+    return None
+
+
+def _output_names(select):
+    """Output names of `select`, or None when one of them is unknown"""
+    if select.is_star:
+        return None
+    names = [output_name(e) for e in select.expressions]
+    return None if None in names else names
+
+
+def get_output_columns(sql_query: str):
+    """Output column names of `sql_query`, or None when they can't be known without the database"""
+    select = parse_select(sql_query)
+    if select is None:
+        return None
+    return _output_names(select)
+
+
+def _references_outputs(select, removed: set) -> bool:
+    """Whether GROUP BY, HAVING or ORDER BY refer to removed output aliases or to output positions"""
+    for clause in ("group", "having", "order"):
+        node = select.args.get(clause)
+        if node is None:
+            continue
+        for column in node.find_all(exp.Column):
+            if not column.table and column.name in removed:
+                return True
+        for item in node.expressions if clause != "having" else []:
+            item = item.this if isinstance(item, exp.Ordered) else item
+            if isinstance(item, exp.Literal) and not item.is_string:
+                return True
+    return False
+
+
+def _has_aggregate(expressions) -> bool:
+    return any(e.find(exp.AggFunc) for e in expressions)
+
+
+def project_columns(sql_query: str, columns: list):
+    """Rewrite `sql_query` so that it only returns `columns`.
+
+    Unused select expressions are dropped when that can't change the result, otherwise
+    the query is wrapped in a projecting subquery. Returns None if the query can't be rewritten.
+    """
+    select = parse_select(sql_query)
+    # Never project to empty names
+    if select is None or not columns or not all(columns):
+        return None
+
+    outputs = _output_names(select)
+    removed = set(outputs or ()) - set(columns)
+    prunable = (
+        outputs is not None
+        and not select.args.get("distinct")
+        and len(set(outputs)) == len(outputs)
+        and not _references_outputs(select, removed)
+    )
+
+    if prunable:
+        kept = [e for e, name in zip(select.expressions, outputs) if name in columns]
+        if not kept:
+            return None
+        # Without GROUP BY, dropping every aggregate would return one row per input row
+        if not select.args.get("group") and _has_aggregate(select.expressions) and not _has_aggregate(kept):
+            prunable = False
+        else:
+            select.set("expressions", kept)
+
+    if not prunable:
+        select = exp.select(*[exp.column(c, quoted=True) for c in columns]).from_(select.subquery(PROJECTION_ALIAS))
+
+    return select.sql(dialect=SQL_DIALECT)
+
+
+def limit_zero(sql_query: str):
+    """Wrap `sql_query` so that it returns its columns but no rows"""
+    select = parse_query(sql_query)
+    if select is None:
+        return None
+    return exp.select("*").from_(select.subquery(PROJECTION_ALIAS)).limit(0).sql(dialect=SQL_DIALECT)
+
+
+def limit_rows(sql_query: str, limit=None):
+    """Normalize `sql_query` into a single statement, capped to `limit` rows when given"""
+    select = parse_query(sql_query)
+    if select is None:
+        return None
+    if limit is not None:
+        select = exp.select("*").from_(select.subquery(PROJECTION_ALIAS)).limit(int(limit))
+    return select.sql(dialect=SQL_DIALECT)
@@ -0,0 +1,130 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict, namedtuple
+import sqlglot
+from sqlglot import exp
+from odoo.addons.chartly.core.resources import get_allowed_models, get_model_fields_map
+from odoo.addons.chartly.core.sql_projection import parse_sql
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+VERDICT_CACHE_SIZE = 1024
+
+SqlVerdict = namedtuple("SqlVerdict", ["formatted", "safe", "reason"])
+
+# Nodes that write data, change the schema or take locks, wherever they appear in the tree
+FORBIDDEN_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge,
+    exp.Create, exp.Drop, exp.Alter, exp.TruncateTable,
+    exp.Command, exp.Into, exp.Lock,
+)
+
+# Functions sqlglot does not model itself; every other function must be one of its builtins
+ALLOWED_FUNCTIONS = frozenset({
+    "age", "date", "make_date", "make_interval", "make_timestamp",
+    "justify_days", "justify_interval", "to_number", "date_bin",
+    "bool_and", "bool_or", "every", "percentile_cont", "percentile_disc",
+    "mode", "ntile", "cume_dist", "percent_rank", "nth_value",
+    "first_value", "last_value", "jsonb_build_object", "json_build_object",
+})
+
+_verdicts = OrderedDict()
+_verdicts_lock = threading.Lock()
+
+
+def normalize_query(sql_query: str) -> str:
+    return re.sub(r"\s+", " ", sql_query.strip())
+
+
+def _get_allowed_tables(allowed_models):
+    return frozenset(model.replace(".", "_") for model in allowed_models)
+
+
+def _visible_ctes(node) -> set:
+    """Names of the CTEs a table reference at `node` resolves to, following Postgres scoping.
+
+    A CTE is visible to the CTEs defined after it in the same WITH and to the query the WITH
+    belongs to, but not to its own body unless the WITH is RECURSIVE.
+    """
+    names = set()
+    child, parent = node, node.parent
+    while parent is not None:
+        if isinstance(parent, exp.With):
+            for cte in parent.expressions:
+                if cte is child and not parent.args.get("recursive"):
+                    break
+                names.add(cte.alias_or_name.lower())
+                if cte is child:
+                    break
+        elif not isinstance(child, exp.With):
+            for with_ in parent.iter_expressions():
+                if isinstance(with_, exp.With):
+                    names.update(cte.alias_or_name.lower() for cte in with_.expressions)
+        child, parent = parent, parent.parent
+    return names
+
+
+def _check(sql_query: str, allowed_models) -> SqlVerdict:
+    try:
+        statements = parse_sql(sql_query)
+    except sqlglot.errors.ParseError as e:
+        return SqlVerdict(False, False, f"Could not parse query: {e}")
+
+    if not statements:
+        return SqlVerdict(False, False, "Empty query")
+    if len(statements) > 1:
+        return SqlVerdict(True, False, "Multiple statements are not allowed")
+
+    tree = statements[0]
+    if not isinstance(tree, (exp.Select, exp.SetOperation)):
+        return SqlVerdict(True, False, f"{tree.key.upper()} statements are not allowed")
+
+    allowed_tables = _get_allowed_tables(allowed_models)
+    known_tables = allowed_tables | frozenset(get_model_fields_map())
+
+    for node in tree.walk():
+        if node.comments:
+            return SqlVerdict(True, False, "Comments are not allowed")
+        if isinstance(node, FORBIDDEN_NODES):
+            return SqlVerdict(True, False, f"{node.key.upper()} is not allowed")
+        if isinstance(node, exp.CTE) and node.alias_or_name.lower() in known_tables:
+            return SqlVerdict(True, False, f"CTE {node.alias_or_name} shadows a table")
+        if isinstance(node, exp.Table) and isinstance(node.this, exp.Identifier):
+            name = node.name.lower()
+            if node.catalog or node.db.lower() not in ("", "public"):
+                return SqlVerdict(True, False, f"Table {node.sql()} is not allowed")
+            # Every table is checked, CTE bodies included; only bare references to a CTE in scope are exempt
+            if name not in allowed_tables and (node.db or name not in _visible_ctes(node)):
+                return SqlVerdict(True, False, f"Table {node.sql()} is not allowed")
+        if isinstance(node, exp.Anonymous) and node.name.lower() not in ALLOWED_FUNCTIONS:
+            return SqlVerdict(True, False, f"Function {node.name} is not allowed")
+
+    return SqlVerdict(True, True, None)
+
+
+def validate_query(sql_query: str) -> SqlVerdict:
+    """Parse `sql_query` once and check it is a single read-only SELECT over allowed tables and functions.
+
+    Verdicts are memoized per normalized query and allowed model list.
+    """
+    allowed_models = get_allowed_models()
+    normalized = normalize_query(sql_query)
+    key = (hashlib.sha1(normalized.encode("utf-8")).hexdigest(), allowed_models)
+
+    with _verdicts_lock:
+        verdict = _verdicts.get(key)
+        if verdict is not None:
+            _verdicts.move_to_end(key)
+            return verdict
+
+    verdict = _check(sql_query, allowed_models)
+    if not verdict.safe:
+        logger.warning(f"SQL query rejected: {verdict.reason}")
+
+    with _verdicts_lock:
+        _verdicts[key] = verdict
+        if len(_verdicts) > VERDICT_CACHE_SIZE:
+            _verdicts.popitem(last=False)
+    return verdict
@@ -0,0 +1,93 @@
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+Stage = namedtuple("Stage", ["name", "fn", "inputs", "inline"])
+
+
+class StageScheduler:
+    """Run the stages of a pipeline as soon as the values they depend on are known.
+
+    A stage is called with its inputs as keyword arguments, taken from the initial values
+    given to `run` or from the results of other stages. Stages using the database cursor
+    are `inline` and run one at a time in the calling thread, which owns the cursor; the
+    others run on `executor`, inside `context()` when given.
+    """
+
+    def __init__(self, executor, context=None):
+        self.executor = executor
+        self.context = context
+        self.stages = {}
+        self.results = {}
+        # {stage name: (start, duration)} in seconds since the start of `run`
+        self.timings = {}
+
+    def add(self, name, fn, inputs=(), inline=False):
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already defined")
+        self.stages[name] = Stage(name, fn, tuple(inputs), inline)
+        return self
+
+    def _call(self, stage, started):
+        kwargs = {name: self.results[name] for name in stage.inputs}
+        start = time.monotonic()
+        try:
+            if stage.inline or self.context is None:
+                return stage.fn(**kwargs)
+            with self.context():
+                return stage.fn(**kwargs)
+        finally:
+            self.timings[stage.name] = (start - started, time.monotonic() - start)
+
+    def run(self, **values) -> dict:
+        """Run every stage and return the initial values and stage results, by name.
+
+        The first stage error is raised once the stages already running are over; the
+        results computed so far stay in `results`.
+        """
+        self.results = dict(values)
+        self.timings = {}
+        known = set(values) | set(self.stages)
+        for stage in self.stages.values():
+            missing = [name for name in stage.inputs if name not in known]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown values {', '.join(missing)}")
+
+        pending = dict(self.stages)
+        running = {}
+        started = time.monotonic()
+        try:
+            while pending or running:
+                ready = [stage for stage in pending.values() if all(name in self.results for name in stage.inputs)]
+                for stage in ready:
+                    if not stage.inline:
+                        del pending[stage.name]
+                        running[self.executor.submit(self._call, stage, started)] = stage.name
+
+                inline = next((stage for stage in ready if stage.inline), None)
+                if inline:
+                    del pending[inline.name]
+                    self.results[inline.name] = self._call(inline, started)
+                    continue
+
+                if not running:
+                    raise ValueError(f"Stages {', '.join(pending)} depend on each other")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.results[running.pop(future)] = future.result()
+        finally:
+            # Threaded stages only use their inputs, but let them end before the caller moves on;
+            # the results of those that succeed are kept, their cost was spent anyway
+            for future in running:
+                future.cancel()
+            wait(running)
+            for future, name in running.items():
+                if not future.cancelled() and future.exception() is None:
+                    self.results[name] = future.result()
+            logger.info("Stage timings: " + ", ".join(
+                f"{name} {start:.2f}s+{duration:.2f}s" for name, (start, duration) in self.timings.items()
+            ))
+        return self.results
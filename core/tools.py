@@ -1,14 +1,27 @@
 import base64
 from odoo.addons.chartly.core.utils import get_model_fields
-from odoo.addons.chartly.core.utils import extract_script_as_fct
-from odoo.addons.chartly.core.openai import get_openai_client, create_function_tool
+from odoo.addons.chartly.core.resources import get_model_fields_map
+from odoo.addons.chartly.core.plot_renderer import render_plot, render_chart_spec
+from odoo.addons.chartly.core.chart_spec import query_to_chart_spec
+from odoo.addons.chartly.core.openai import get_openai_client, create_function_tool, DEFAULT_MAX_TOOL_ITERATIONS
 from odoo.addons.chartly.core.filter_model_attributes import filter_attributes
-from odoo.addons.chartly.core.nl_to_sql import nl_to_sql
-from odoo.addons.chartly.core.execute_query import execute_query
+from odoo.addons.chartly.core.nl_to_sql import nl_to_sql, get_nl_to_sql_prompt
+from odoo.addons.chartly.core.execute_query import execute_query, describe_query
+from odoo.addons.chartly.core.sql_projection import get_output_columns, project_columns
 from odoo.addons.chartly.core.query_to_plot import query_to_plot
-from odoo.addons.chartly.core.nl_to_model import nl_to_model
+from odoo.addons.chartly.core.nl_to_model import nl_to_model, get_nl_to_model_prompt
+from odoo.addons.chartly.core.model_index import get_model_index, DEFAULT_SHORTLIST_SIZE
+from odoo.addons.chartly.core.field_pruning import PRUNING_VERSION, format_fields
+from odoo.addons.chartly.core.schema_snapshot import get_schema_snapshot
+from odoo.addons.chartly.core.nl_to_query import nl_to_query, get_nl_to_query_prompt
+from odoo.addons.chartly.core.translation_cache import cached_translation, get_version
 from odoo.addons.chartly.core.utils import is_allowed_oodoo_model
+from odoo.addons.chartly.core.stage_scheduler import StageScheduler
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from odoo import api
 from odoo.http import request
 
 from logging import getLogger
@@ -18,84 +31,346 @@ logger = getLogger(__name__)
 _openai_client_override = None
 _env = None
 
+# per-thread overrides, used when tools run outside of the HTTP request thread
+_context = threading.local()
+
 PLOTS_DIR = "/tmp/chartly"
 
 PLOT_TAG = "PLOT_666"
 
+DEFAULT_QUERY_ROW_LIMIT = 1000
+DEFAULT_QUERY_TIMEOUT = 30000
+DEFAULT_QUERY_BATCH_SIZE = 500
+
+PIPELINE_STAGED = "staged"
+PIPELINE_FUSED = "fused"
+
+PLOT_MODE_SCRIPT = "script"
+PLOT_MODE_SPEC = "spec"
+
+SCHEMA_PRUNED = "pruned"
+SCHEMA_FULL = "full"
+
+TOOL_WORKERS = 4
+STAGE_WORKERS = 4
+
+# One executor of each kind per worker process, threads don't survive a fork. Tools and
+# pipeline stages have their own, so that tools waiting for their stages can't starve them.
+_executors = {}
+_executors_pid = None
+_executors_lock = threading.Lock()
+
 def _get_env():
     logger.info(f"_env override: {_env}")
-    return _env or request.env
+    return getattr(_context, "env", None) or _env or request.env
 
 def _get_openai_client():
-    return _openai_client_override or get_openai_client(_get_env())
+    return getattr(_context, "openai_client", None) or _openai_client_override or get_openai_client(_get_env())
+
+@contextmanager
+def tools_context(env=None, openai_client=None, progress=None):
+    """Run tools in the current thread with the given env, client and progress callback"""
+    previous = dict(_context.__dict__)
+    _context.env = env
+    _context.openai_client = openai_client
+    _context.progress = progress
+    try:
+        yield
+    finally:
+        _context.__dict__.clear()
+        _context.__dict__.update(previous)
+
+def _get_executor(kind, max_workers):
+    global _executors_pid
+    with _executors_lock:
+        if _executors_pid != os.getpid():
+            _executors.clear()
+            _executors_pid = os.getpid()
+        if kind not in _executors:
+            _executors[kind] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"chartly-{kind}")
+        return _executors[kind]
+
+def run_tool_calls(calls):
+    """Run independent tool `calls` concurrently and return their results in order.
+
+    Each call runs in a pool thread on its own cursor, with the env user, OpenAI client and
+    progress callback of the calling thread. A single call runs in the calling thread.
+    """
+    if len(calls) < 2:
+        return [call() for call in calls]
+
+    env = _get_env()
+    registry, uid, context = env.registry, env.uid, dict(env.context)
+    openai_client = _get_openai_client()
+    progress = getattr(_context, "progress", None)
+
+    def run(call):
+        with registry.cursor() as cr:
+            with tools_context(env=api.Environment(cr, uid, context), openai_client=openai_client, progress=progress):
+                return call()
+
+    return list(_get_executor("tool", TOOL_WORKERS).map(run, calls))
+
+def get_max_tool_iterations(odoo_env):
+    value = odoo_env['ir.config_parameter'].sudo().get_param('chartly.max_tool_iterations')
+    return int(value) if value else DEFAULT_MAX_TOOL_ITERATIONS
+
+def _report_progress(message: str):
+    progress = getattr(_context, "progress", None)
+    if progress:
+        progress(message)
+
+def _get_pipeline_mode(odoo_env):
+    return odoo_env['ir.config_parameter'].sudo().get_param('chartly.pipeline_mode') or PIPELINE_STAGED
+
+def _get_plot_mode(odoo_env):
+    return odoo_env['ir.config_parameter'].sudo().get_param('chartly.plot_mode') or PLOT_MODE_SCRIPT
+
+def _describe_chart(openai_client, query, sql_query, columns):
+    _report_progress("Describing chart")
+    return query_to_chart_spec(openai_client, query, sql_query, columns)
+
+def _render_spec(odoo_env, spec, data):
+    # None means the script fallback must be used
+    if not spec:
+        return None
+    try:
+        _report_progress("Rendering chart")
+        return render_chart_spec(odoo_env, spec, data)
+    except (ValueError, RuntimeError, TimeoutError) as e:
+        logger.warning(f"Chart spec could not be rendered, falling back to a plot script: {e}")
+        return None
+
+def _write_plot_script(openai_client, query, sql_query):
+    _report_progress("Writing chart script")
+    return query_to_plot(openai_client, query, sql_query)
+
+def _get_schema_pruning(odoo_env):
+    return (odoo_env['ir.config_parameter'].sudo().get_param('chartly.schema_mode') or SCHEMA_PRUNED) == SCHEMA_PRUNED
 
-def _get_data(openai_client, odoo_env, query: str):
+def _get_schema(odoo_env, models):
+    """Fields, foreign keys, schema version, column types and row estimates of `models`.
 
+    Read from the schema snapshot of the database, falling back to the bundled schema for
+    models it doesn't cover; the version is then derived from the fields themselves, and
+    the types and row estimates are unknown.
+    """
+    snapshot = get_schema_snapshot(odoo_env)
+    if snapshot and all(m in snapshot.models for m in models):
+        fields = {m: snapshot.columns(m) for m in models}
+        return fields, snapshot.edges(models), snapshot.version, snapshot.column_types(models), snapshot.row_estimates(models)
+    fields = {m: get_model_fields(m) for m in models}
+    return fields, None, sorted(fields.items()), None, None
+
+def _get_full_schema(odoo_env):
+    """Columns of every model, the same for every question so that it can be cached as a prompt
+    prefix: from the schema snapshot with their types and row estimates, or the bundled schema"""
+    snapshot = get_schema_snapshot(odoo_env)
+    if snapshot:
+        models = sorted(snapshot.models)
+        fields = {m: snapshot.columns(m) for m in models}
+        return format_fields(fields, snapshot.column_types(models), snapshot.row_estimates(models))
+    return format_fields(dict(sorted(get_model_fields_map().items())))
+
+def _shortlist_models(odoo_env, query: str):
+    # None when the shortlist is disabled
+    size = odoo_env['ir.config_parameter'].sudo().get_param('chartly.model_shortlist_size')
+    size = DEFAULT_SHORTLIST_SIZE if size in (None, False, '') else int(size)
+    if size <= 0:
+        return None
+    return get_model_index().shortlist(query, size)
+
+def _translate_fused(openai_client, odoo_env, query: str):
+    # Get models, SQL and useful columns in a single request, pointing out the shortlisted
+    # models when there is a shortlist
+    _report_progress("Writing SQL")
+    shortlist = _shortlist_models(odoo_env, query)
+    if shortlist:
+        fields, edges, schema_version, _, _ = _get_schema(odoo_env, shortlist.models)
+        prune = _get_schema_pruning(odoo_env)
+        version = get_version(get_nl_to_query_prompt(), sorted(fields), schema_version, prune and PRUNING_VERSION)
+    else:
+        fields = edges = None
+        prune = False
+        version = get_version(get_nl_to_query_prompt())
+    response = cached_translation(
+        odoo_env, "nl_to_query", openai_client, query, version,
+        lambda: nl_to_query(openai_client, query, fields, prune=prune, edges=edges)
+    )
+    logger.info(f"NL to Query response: {response}")
+    return response.get("models"), response.get("sql_query"), response.get("columns"), response.get("cost", 0)
+
+def _get_query_bounds(odoo_env, row_limit=None):
+    params = odoo_env['ir.config_parameter'].sudo()
+    limit = int(params.get_param('chartly.query_row_limit') or DEFAULT_QUERY_ROW_LIMIT)
+    if row_limit:
+        limit = min(limit, row_limit)
+    return {
+        "limit": limit,
+        "timeout": int(params.get_param('chartly.query_timeout') or DEFAULT_QUERY_TIMEOUT),
+        "batch_size": int(params.get_param('chartly.query_batch_size') or DEFAULT_QUERY_BATCH_SIZE),
+    }
+
+class QueryError(Exception):
+    """A question that can't be answered, with the message to give back to the model"""
+
+def _translate(openai_client, odoo_env, query: str):
+    """Models and SQL query for `query`, with the columns when the fused request picked them"""
     cost=0 
+    models = sql_query = columns = None
+
+    if _get_pipeline_mode(odoo_env) == PIPELINE_FUSED:
+        models, sql_query, columns, fused_cost = _translate_fused(openai_client, odoo_env, query)
+        cost += fused_cost
+        if not sql_query:
+            logger.info("Fused pipeline failed, falling back to the staged pipeline")
 
-    # Get Odoo model
-    response = nl_to_model(openai_client, query)
-    models = response.get("models")
-    cost += response.get("cost", 0)
-    logger.info(f"NL to Model response: Model: {models}, Cost: {cost}")
+    if not sql_query:
+        # Get Odoo model, from a local shortlist when the question names a single one
+        _report_progress("Resolving models")
+        shortlist = _shortlist_models(odoo_env, query)
+        if shortlist and shortlist.confident:
+            models = shortlist.models[:1]
+            logger.info(f"Model resolved from the index: {models}")
+        else:
+            candidates = shortlist.models if shortlist else None
+            response = cached_translation(
+                odoo_env, "nl_to_model", openai_client, query,
+                get_version(get_nl_to_model_prompt(), candidates),
+                lambda: nl_to_model(openai_client, query, candidates)
+            )
+            models = response.get("models")
+            cost += response.get("cost", 0)
+            logger.info(f"NL to Model response: Model: {models}, Cost: {cost}")
 
     # NL to Query safety checks
     if not all(is_allowed_oodoo_model(m) for m in models):
         message = "Chartly only support integration with Invoicing/Accounting apps. Your query requires integration with other apps."
         logger.info(message) 
-        return message
+        raise QueryError(message)
 
-    # Get SQL from natural language
-    fields = {m: get_model_fields(m) for m in models}
-    response = nl_to_sql(openai_client, query, models, fields)
-    sql_query = response.get("sql_query")
-    cost += response.get("cost", 0)
+    if not sql_query:
+        # Get SQL from natural language
+        _report_progress("Writing SQL")
+        fields, edges, schema_version, types, rows = _get_schema(odoo_env, models)
+        prune = _get_schema_pruning(odoo_env)
+        response = cached_translation(
+            odoo_env, "nl_to_sql", openai_client, query,
+            get_version(get_nl_to_sql_prompt(), sorted(models), schema_version, prune and PRUNING_VERSION),
+            lambda: nl_to_sql(
+                openai_client, query, models, fields, prune=prune, edges=edges, types=types, rows=rows,
+                schema=_get_full_schema(odoo_env)
+            )
+        )
+        sql_query = response.get("sql_query")
+        cost += response.get("cost", 0)
 
     logger.info(f"NL to SQL response: Models: {models}, SQL Query: {sql_query}")
-    
+    return {"models": models, "sql_query": sql_query, "columns": columns, "cost": cost}
+
+def _get_query_columns(odoo_env, translation):
+    # Known from the SQL itself in most cases, otherwise from an empty run of the query
+    sql_query = translation["sql_query"]
+    query_columns = get_output_columns(sql_query)
+    if query_columns is None:
+        query_columns = describe_query(odoo_env, sql_query).get("columns")
+    return query_columns or []
+
+def _select_columns(openai_client, query: str, translation, query_columns):
+    if not query_columns:
+        return {"columns": [], "cost": 0}
+    if translation["columns"]:
+        # Columns were already selected by the fused request
+        return {"columns": [c for c in translation["columns"] if c in query_columns], "cost": 0}
+    _report_progress("Selecting columns")
+    response = filter_attributes(openai_client, query, query_columns)
+    return {"columns": [c for c in response.get("attributes") if c in query_columns], "cost": response.get("cost", 0)}
+
+def _select_result_columns(data, columns, query_columns):
+    """Keep the selected `columns` of the fetched `data`.
+
+    The selection is made on the columns parsed from the SQL; result columns the parsing
+    missed were never offered to it, so they are kept rather than silently dropped.
+    """
+    if not columns:
+        return data
+    offered = set(query_columns)
+    kept = [c for c in data.columns if c in columns or c not in offered]
+    return data.select(kept) if kept else data
+
+def _run_query(odoo_env, translation, query_columns, row_limit=None, project=True):
+    sql_query = translation["sql_query"]
+    columns = [c for c in translation["columns"] or [] if c in query_columns]
+    projected_sql_query = project_columns(sql_query, columns) if project and columns else None
+    if projected_sql_query:
+        # Only the columns picked by the fused request are fetched
+        logger.info(f"Projected SQL Query: {projected_sql_query}")
+        sql_query = projected_sql_query
+
     # Execute the query to get data
-    output = execute_query(odoo_env, sql_query)
+    _report_progress("Running SQL")
+    output = execute_query(odoo_env, sql_query, **_get_query_bounds(odoo_env, row_limit))
 
     if output.get("not_safe"):
         message = "Your query contains unsafe operations that are not allowed."
         logger.info(message)
-        return message
+        raise QueryError(message)
     
     if output.get("not_formatted"):
         message = "Can you please rephrase your query? We were unable to understand it."
         logger.info(message)
-        return message
+        raise QueryError(message)
     
-    raw_data = output.get("data")
+    return {"data": output.get("data"), "projected": bool(projected_sql_query)}
 
-    if not raw_data:
-        return [], cost, sql_query
+def _data_stages(openai_client, odoo_env, query: str, row_limit: int = None, project=True):
+    """Scheduler with the stages that translate `query` and fetch its data.
 
-    # Get attributes from data and filter them
-    attributes = raw_data[0].keys()
-    response = filter_attributes(openai_client, query, attributes)
-    attributes = response.get("attributes")
-    cost += response.get("cost", 0)
-    
-    # Retain relevant attributes using filtering
-    filtered_data = []
-    for record in raw_data:
-        filtered_record = {attr: record[attr] for attr in attributes}
-        filtered_data.append(filtered_record)
+    Stages that use the cursor run in the calling thread, the LLM-only stages that callers
+    add run concurrently with them on the stage executor.
+    """
+    progress = getattr(_context, "progress", None)
+    scheduler = StageScheduler(
+        _get_executor("stage", STAGE_WORKERS),
+        context=lambda: tools_context(openai_client=openai_client, progress=progress),
+    )
+    scheduler.add("translation", lambda: _translate(openai_client, odoo_env, query), inline=True)
+    scheduler.add(
+        "query_columns", lambda translation: _get_query_columns(odoo_env, translation),
+        inputs=("translation",), inline=True
+    )
+    scheduler.add(
+        "data", lambda translation, query_columns: _run_query(odoo_env, translation, query_columns, row_limit, project),
+        inputs=("translation", "query_columns"), inline=True
+    )
+    return scheduler
 
-    return filtered_data, cost, sql_query
+def _stages_cost(scheduler):
+    return sum(r.get("cost", 0) for r in scheduler.results.values() if isinstance(r, dict))
 
 def query_returning_text(query: str, limit: int = 10):
-    cost=0
+    scheduler = None
     try:
         openai_client = _get_openai_client()
         odoo_env = _get_env()
 
-        filtered_data, cost, _ = _get_data(openai_client, odoo_env, query)
+        # Fetch one extra row to know whether there are more records; the useful columns
+        # are selected while the query runs
+        scheduler = _data_stages(openai_client, odoo_env, query, row_limit=limit + 1)
+        scheduler.add(
+            "selection", lambda translation, query_columns: _select_columns(openai_client, query, translation, query_columns),
+            inputs=("translation", "query_columns")
+        )
+        results = scheduler.run()
+
+        filtered_data = results["data"]["data"]
+        if filtered_data and not results["data"]["projected"]:
+            filtered_data = _select_result_columns(filtered_data, results["selection"]["columns"], results["query_columns"])
 
         if not filtered_data:
-            return {"text": "No records", "cost": cost}
+            return {"text": "No records", "cost": _stages_cost(scheduler), "timings": scheduler.timings}
 
+        has_more = len(filtered_data) > limit
         filtered_data = filtered_data[:limit]
 
         result_lines = []
@@ -109,40 +384,67 @@ def query_returning_text(query: str, limit: int = 10):
                 result_lines.append(f"  • {field_name}: {display_value}")
             result_lines.append("")
         
-        if len(filtered_data) > limit:
-            result_lines.append(f"\n*... and {len(filtered_data) - limit} more record(s)*")
+        if has_more:
+            result_lines.append("\n*... and more record(s)*")
+    except QueryError as e:
+        return {"text": str(e), "cost": _stages_cost(scheduler)}
     except Exception as e:
         logger.error(f"Error executing tool {e}")
-        return {"text": "Error executing tool", "cost": cost}
+        return {"text": "Error executing tool", "cost": _stages_cost(scheduler) if scheduler else 0}
         
-    return {"text": "\n".join(result_lines), "cost": cost}
+    return {"text": "\n".join(result_lines), "cost": _stages_cost(scheduler), "timings": scheduler.timings}
 
 def query_returning_plot(query:str):
-    cost= 0
+    scheduler = None
+    cost = 0
     try:
         openai_client = _get_openai_client()
         odoo_env = _get_env()
+        spec_mode = _get_plot_mode(odoo_env) == PLOT_MODE_SPEC
 
-        filtered_data, cost, sql_query = _get_data(openai_client, odoo_env, query)
+        # The chart only needs the question and the SQL, so it is described while the query
+        # runs; it is written for every output column, which are all kept
+        scheduler = _data_stages(openai_client, odoo_env, query, project=False)
+        if spec_mode:
+            scheduler.add(
+                "chart", lambda translation, query_columns: _describe_chart(openai_client, query, translation["sql_query"], query_columns),
+                inputs=("translation", "query_columns")
+            )
+        else:
+            scheduler.add(
+                "chart", lambda translation: _write_plot_script(openai_client, query, translation["sql_query"]),
+                inputs=("translation",)
+            )
+        results = scheduler.run()
+        cost = _stages_cost(scheduler)
 
-        if not filtered_data:
-            return {"text": "No records", "cost": cost}
+        data = results["data"]["data"]
+        if not data:
+            return {"text": "No records", "cost": cost, "timings": scheduler.timings}
 
-        attributes = list(filtered_data[0].keys())
+        plot_as_base64 = None
+        plot_script = None
+        if spec_mode:
+            plot_as_base64 = _render_spec(odoo_env, results["chart"].get("spec"), data)
+        else:
+            plot_script = results["chart"].get("plot_script")
 
-        # Generate plot from filtered data
-        response = query_to_plot(openai_client, query, sql_query)
-        plot_script = response.get("plot_script")
-        cost += response.get("cost", 0)
+        if plot_as_base64 is None:
+            if plot_script is None:
+                response = _write_plot_script(openai_client, query, results["translation"]["sql_query"])
+                plot_script = response.get("plot_script")
+                cost += response.get("cost", 0)
 
-        # Extract the script function and execute it to get the plot
-        plot_function = extract_script_as_fct(plot_script, "build_plot")
-        plot_as_base64 = plot_function(filtered_data)
+            # Check the script and run it in a renderer process to get the plot
+            _report_progress("Rendering chart")
+            plot_as_base64 = render_plot(odoo_env, plot_script, data, "build_plot")
+    except QueryError as e:
+        return {"text": str(e), "cost": _stages_cost(scheduler)}
     except Exception as e:
         logger.error(f"Error executing tool {e}")
-        return {"text": "Error executing tool", "cost": cost}
+        return {"text": "Error executing tool", "cost": cost or (_stages_cost(scheduler) if scheduler else 0)}
 
-    return {"text": "Plot generated successfully", "image": plot_as_base64,  "cost": cost}
+    return {"text": "Plot generated successfully", "image": plot_as_base64,  "cost": cost, "timings": scheduler.timings}
 
 def get_tools():
     
@@ -0,0 +1,53 @@
+import hashlib
+import re
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+TRANSLATION_CACHE_MODEL = "chartly.translation.cache"
+
+
+def normalize_query(query: str) -> str:
+    query = query.strip().lower()
+    query = re.sub(r"\s+", " ", query)
+    return query.rstrip(" ?.!")
+
+
+def get_version(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def make_cache_key(stage: str, llm_model: str, version: str, query: str) -> str:
+    return get_version(stage, llm_model, version, normalize_query(query))
+
+
+def cached_translation(env, stage: str, client, query: str, version: str, translate) -> dict:
+    """Return a cached translation for `query`, calling `translate()` on a miss.
+
+    Hits are returned with a zero cost so they are not billed twice. Cache failures are
+    logged and the translation goes on without the cache.
+    """
+    key = make_cache_key(stage, client.model, version, query)
+    cache = env[TRANSLATION_CACHE_MODEL].sudo()
+
+    try:
+        value = cache.lookup(key)
+    except Exception as e:
+        logger.warning(f"Translation cache lookup failed for {stage}: {e}")
+        value = None
+    if value is not None:
+        logger.info(f"Translation cache hit for {stage}: {query}")
+        return dict(value, cost=0, cached=True)
+
+    response = translate()
+    value = {k: v for k, v in response.items() if k != "cost"}
+    if all(value.values()):
+        try:
+            cache.store(key, stage, value, query=query, llm_model=client.model)
+        except Exception as e:
+            logger.warning(f"Translation cache store failed for {stage}: {e}")
+    return response
@@ -1,87 +1,226 @@
-import os
-import re
 import ast
-import json
+import builtins
+import hashlib
+import threading
+from collections import Counter, OrderedDict, namedtuple
+from odoo.addons.chartly.core.resources import get_allowed_models, get_model_fields_map
 
 from logging import getLogger
 logger = getLogger(__name__)
 
 
-ALLOWED_ODOO_MODELS_FILENAME = "allowed_odoo_models.txt"
-MODEL_FIELDS_MAP_FILE = "accounting_schema.json"
+CODE_VERDICT_CACHE_SIZE = 256
+COMPILED_SCRIPT_CACHE_SIZE = 128
 
+CodeVerdict = namedtuple("CodeVerdict", ["tree", "valid", "safe", "reason"])
+CompiledScript = namedtuple("CompiledScript", ["key", "script", "code"])
 
-def is_valid_python(code: str) -> bool:
+# Modules the generated plot code may import, by their full name
+ALLOWED_MODULES = frozenset({
+    "matplotlib", "matplotlib.pyplot", "matplotlib.ticker", "matplotlib.dates", "matplotlib.colors",
+    "matplotlib.cm", "matplotlib.patches", "numpy", "base64", "math", "statistics",
+    "datetime", "decimal", "collections", "itertools", "textwrap",
+})
+
+# Single names the generated plot code may import from other modules; the plot worker
+# already provides BytesIO, the import is only kept because the prompt asks for it
+ALLOWED_FROM_IMPORTS = frozenset({("io", "BytesIO")})
+
+# Builtins the generated plot code may use, every other builtin name is rejected
+ALLOWED_BUILTINS = frozenset({
+    "abs", "all", "any", "bool", "dict", "divmod", "enumerate", "filter", "float",
+    "format", "frozenset", "int", "isinstance", "len", "list", "map", "max", "min",
+    "print", "range", "reversed", "round", "set", "slice", "sorted", "str", "sum",
+    "tuple", "zip", "ValueError", "TypeError", "KeyError", "IndexError", "None", "True", "False",
+})
+
+# Attributes the generated plot code may use, and names it may import from the allowed
+# modules. Nothing here reads or writes files, starts processes or leads to a module that
+# does; every other attribute is rejected.
+ALLOWED_ATTRIBUTES = frozenset({
+    # Submodules
+    "pyplot", "ticker", "dates", "colors", "cm", "patches",
+    # Result set and rows
+    "column", "columns", "select", "to_dicts", "keys", "values", "items", "get",
+    # Builtin types
+    "append", "extend", "insert", "pop", "sort", "index", "count", "copy", "update", "setdefault",
+    "join", "split", "strip", "lstrip", "rstrip", "replace", "lower", "upper", "title", "capitalize",
+    "startswith", "endswith", "format", "zfill", "ljust", "rjust", "center", "encode", "decode",
+    "isdigit", "real", "imag",
+    # base64, io buffers, math, statistics, decimal, textwrap
+    "b64encode", "getvalue", "seek",
+    "sqrt", "ceil", "floor", "log", "log10", "exp", "isnan", "isinf", "isfinite", "pi", "inf", "nan",
+    "mean", "median", "mode", "stdev", "pstdev", "variance", "fsum",
+    "Decimal", "quantize", "wrap", "fill", "shorten",
+    # datetime
+    "date", "datetime", "timedelta", "time", "today", "now", "year", "month", "day", "hour", "minute",
+    "weekday", "isoformat", "strftime", "strptime", "fromisoformat", "days", "total_seconds",
+    # collections and itertools
+    "Counter", "defaultdict", "OrderedDict", "namedtuple", "most_common",
+    "groupby", "chain", "islice", "accumulate", "zip_longest", "product",
+    # numpy
+    "array", "asarray", "arange", "linspace", "zeros", "ones", "full", "cumsum", "sum", "max", "min",
+    "argsort", "argmax", "argmin", "round", "where", "unique", "histogram", "polyfit", "poly1d", "percentile",
+    "std", "abs", "clip", "concatenate", "digitize", "nan_to_num", "radians", "degrees", "sin", "cos",
+    "tolist", "astype", "shape", "size", "reshape", "flatten", "T", "ndim", "float64", "int64", "ndarray",
+    # pyplot, figures and axes
+    "subplots", "figure", "gcf", "gca", "close", "tight_layout", "subplots_adjust", "suptitle",
+    "bar", "barh", "plot", "scatter", "pie", "hist", "stackplot", "fill_between", "step", "errorbar",
+    "boxplot", "axhline", "axvline", "annotate", "text", "legend", "grid", "xlabel", "ylabel",
+    "xticks", "yticks", "xlim", "ylim", "axis", "twinx", "twiny", "margins", "imshow", "colorbar",
+    "set_title", "set_xlabel", "set_ylabel", "set_xticks", "set_yticks", "set_xticklabels",
+    "set_yticklabels", "set_xlim", "set_ylim", "set_axis_off", "set_aspect", "set_facecolor",
+    "set_size_inches", "set_figwidth", "set_figheight", "autofmt_xdate", "bar_label", "tick_params",
+    "invert_xaxis", "invert_yaxis", "xaxis", "yaxis", "spines", "patches", "set_visible", "set_color",
+    "set_linewidth", "set_alpha", "set_rotation", "set_ha", "set_horizontalalignment",
+    "get_xticklabels", "get_yticklabels", "get_height", "get_width", "get_x", "get_y",
+    "set_major_formatter", "set_major_locator", "set_minor_locator",
+    "FuncFormatter", "StrMethodFormatter", "PercentFormatter", "MaxNLocator", "MultipleLocator",
+    "DateFormatter", "AutoDateLocator", "MonthLocator", "DayLocator", "date2num",
+    "get_cmap", "colormaps", "to_rgba", "Normalize", "Rectangle", "Patch",
+})
+# The only file-writing call allowed, into a BytesIO buffer of the script bound once
+SAVEFIG = "savefig"
+
+_BUILTIN_NAMES = frozenset(dir(builtins))
+
+_code_verdicts = OrderedDict()
+_code_verdicts_lock = threading.Lock()
+
+_compiled_scripts = OrderedDict()
+_compiled_scripts_lock = threading.Lock()
+_compiled_scripts_stats = {"hits": 0, "misses": 0}
+
+
+def script_key(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def _bindings(tree) -> Counter:
+    """How many times each name is bound in `tree`, in any scope"""
+    bindings = Counter()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            bindings[node.id] += 1
+        elif isinstance(node, ast.arg):
+            bindings[node.arg] += 1
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bindings[node.name] += 1
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bindings[node.name] += 1
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                bindings[alias.asname or alias.name.split(".")[0]] += 1
+    return bindings
+
+
+def _savefig_calls(tree) -> set:
+    """Ids of the `savefig` function nodes of calls writing into a BytesIO buffer of the script.
+
+    The buffer must be a name bound exactly once, from BytesIO(), and BytesIO itself must
+    not be bound by the script other than by importing it from io.
+    """
+    bindings = _bindings(tree)
+    imported = sum(
+        1 for node in ast.walk(tree) if isinstance(node, ast.ImportFrom) and node.module == "io"
+        for alias in node.names if alias.name == "BytesIO" and not alias.asname
+    )
+    if bindings["BytesIO"] != imported:
+        return set()
+    buffers = {
+        node.targets[0].id
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+        and isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name)
+        and node.value.func.id == "BytesIO" and bindings[node.targets[0].id] == 1
+    }
+    calls = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+        if name != SAVEFIG:
+            continue
+        target = node.args[0] if node.args else next((k.value for k in node.keywords if k.arg == "fname"), None)
+        if isinstance(target, ast.Name) and target.id in buffers:
+            calls.add(id(func))
+    return calls
+
+
+def _is_allowed_import(module: str, name: str) -> bool:
+    return (module, name) in ALLOWED_FROM_IMPORTS or module in ALLOWED_MODULES and (
+        name in ALLOWED_ATTRIBUTES or f"{module}.{name}" in ALLOWED_MODULES
+    )
+
+
+def _check_code(code: str) -> CodeVerdict:
     try:
-        ast.parse(code)
-        return True
+        tree = ast.parse(code)
     except SyntaxError as e:
-        logger.error(f"Syntax error in generated code: {e}")
-        return False
+        return CodeVerdict(None, False, False, f"Syntax error: {e}")
 
+    savefig_calls = _savefig_calls(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name not in ALLOWED_MODULES:
+                    return CodeVerdict(tree, True, False, f"Import of {alias.name} is not allowed")
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            for alias in node.names:
+                if not _is_allowed_import(module, alias.name):
+                    return CodeVerdict(tree, True, False, f"Import of {alias.name} from {module} is not allowed")
+        elif isinstance(node, ast.Attribute):
+            if node.attr == SAVEFIG:
+                if id(node) not in savefig_calls:
+                    return CodeVerdict(tree, True, False, "savefig may only write into a BytesIO buffer")
+            elif node.attr not in ALLOWED_ATTRIBUTES:
+                return CodeVerdict(tree, True, False, f"Attribute {node.attr} is not allowed")
+        elif isinstance(node, ast.Name):
+            name = node.id
+            if name.startswith("__") or (name in _BUILTIN_NAMES and name not in ALLOWED_BUILTINS):
+                return CodeVerdict(tree, True, False, f"Name {name} is not allowed")
+            if name == SAVEFIG and id(node) not in savefig_calls:
+                return CodeVerdict(tree, True, False, "savefig may only write into a BytesIO buffer")
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            return CodeVerdict(tree, True, False, "Global and nonlocal statements are not allowed")
 
-def is_safe_code(code: str) -> bool:
+    return CodeVerdict(tree, True, True, None)
+
+
+def check_code(code: str) -> CodeVerdict:
+    """Parse `code` once and check its imports, calls and attributes against the allow-lists.
+
+    Verdicts, including the parsed tree, are memoized per script hash.
+    """
+    key = script_key(code)
+
+    with _code_verdicts_lock:
+        verdict = _code_verdicts.get(key)
+        if verdict is not None:
+            _code_verdicts.move_to_end(key)
+            return verdict
 
-    forbidden_imports = [
-        r"\bimport\s+os\b",
-        r"\bimport\s+sys\b",
-        r"\bimport\s+subprocess\b",
-        r"\bimport\s+shutil\b",
-        r"\bimport\s+socket\b",
-        r"\bimport\s+requests\b",
-        r"\bimport\s+urllib\b",
-        r"\bfrom\s+os\b",
-        r"\bfrom\s+sys\b",
-        r"\bfrom\s+subprocess\b",
-    ]
-
-    forbidden_functions = [
-        r"\beval\s*\(",
-        r"\bexec\s*\(",
-        r"\bcompile\s*\(",
-        r"\bopen\s*\(",
-        r"\b__import__\s*\(",
-        r"\bgetattr\s*\(",
-        r"\bsetattr\s*\(",
-        r"\bglobals\s*\(",
-        r"\blocals\s*\(",
-    ]
-
-    forbidden_attributes = [
-        "__builtins__", "__class__", "__bases__",
-        "__subclasses__", "__mro__", "__code__",
-        "__globals__", "__dict__"
-    ]
-
-    forbidden_system = [
-        r"\.system\s*\(",
-        r"\.popen\s*\(",
-        r"\.spawn",
-        r"\.call\s*\(",
-        r"\.Popen\s*\(",
-    ]
-
-    for pattern in forbidden_imports:
-        if re.search(pattern, code, re.IGNORECASE):
-            logger.warning(f"Forbidden import detected: {pattern}")
-            return False
-
-    for pattern in forbidden_functions:
-        if re.search(pattern, code, re.IGNORECASE):
-            logger.warning(f"Forbidden function detected: {pattern}")
-            return False
-
-    for attr in forbidden_attributes:
-        if attr in code:
-            logger.warning(f"Forbidden attribute detected: {attr}")
-            return False
-
-    for pattern in forbidden_system:
-        if re.search(pattern, code, re.IGNORECASE):
-            logger.warning(f"Forbidden system call detected: {pattern}")
-            return False
-
-    return True
+    verdict = _check_code(code)
+    if not verdict.valid:
+        logger.error(f"Invalid generated code: {verdict.reason}")
+    elif not verdict.safe:
+        logger.warning(f"Unsafe generated code: {verdict.reason}")
+
+    with _code_verdicts_lock:
+        _code_verdicts[key] = verdict
+        if len(_code_verdicts) > CODE_VERDICT_CACHE_SIZE:
+            _code_verdicts.popitem(last=False)
+    return verdict
+
+
+def is_valid_python(code: str) -> bool:
+    return check_code(code).valid
+
+
+def is_safe_code(code: str) -> bool:
+    return check_code(code).safe
 
 
 def clean_code_block(code: str) -> str:
@@ -95,14 +234,50 @@ def clean_code_block(code: str) -> str:
     return code.strip()
 
 
-def extract_script_as_fct(script: str, function_name: str = "build_plot"):
+def compile_script(script: str) -> CompiledScript:
+    """Clean, check and compile `script`, raising ValueError if it can't be run.
+
+    Compiled scripts are kept in an LRU keyed by the hash of the cleaned script, so a
+    script returned again by the LLM skips both the checks and the compilation.
+    """
     script = clean_code_block(script)
-    
-    if not is_safe_code(script):
-        raise ValueError("Unsafe code detected")
-    
-    if not is_valid_python(script):
+    key = script_key(script)
+
+    with _compiled_scripts_lock:
+        compiled = _compiled_scripts.get(key)
+        if compiled is not None:
+            _compiled_scripts.move_to_end(key)
+            _compiled_scripts_stats["hits"] += 1
+            return compiled
+        _compiled_scripts_stats["misses"] += 1
+
+    verdict = check_code(script)
+
+    if not verdict.valid:
         raise ValueError("Invalid Python syntax")
+
+    if not verdict.safe:
+        raise ValueError("Unsafe code detected")
+
+    compiled = CompiledScript(key, script, compile(verdict.tree, "<plot_script>", "exec"))
+
+    with _compiled_scripts_lock:
+        _compiled_scripts[key] = compiled
+        if len(_compiled_scripts) > COMPILED_SCRIPT_CACHE_SIZE:
+            _compiled_scripts.popitem(last=False)
+    return compiled
+
+
+def get_script_cache_stats() -> dict:
+    with _compiled_scripts_lock:
+        hits, misses = _compiled_scripts_stats["hits"], _compiled_scripts_stats["misses"]
+        size = len(_compiled_scripts)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "size": size, "hit_rate": hits / total if total else 0.0}
+
+
+def extract_script_as_fct(script: str, function_name: str = "build_plot"):
+    compiled = compile_script(script)
     
     import matplotlib
     matplotlib.use('Agg')
@@ -117,19 +292,13 @@ def extract_script_as_fct(script: str, function_name: str = "build_plot"):
         'BytesIO': BytesIO,
     }
     
-    exec(script, namespace)
+    # The code object is shared, but each call gets its own module namespace
+    exec(compiled.code, namespace)
     return namespace[function_name]
 
 def is_allowed_oodoo_model(model: str) -> bool:
-    allowed_models_file = os.path.join(os.path.dirname(__file__), ALLOWED_ODOO_MODELS_FILENAME)
-    with open(allowed_models_file, "r") as f:
-        allowed_models = f.read().split()
-    return model in allowed_models
+    return model in get_allowed_models()
 
 def get_model_fields(model: str) -> list:
-    model_fields_map_file = os.path.join(os.path.dirname(__file__), MODEL_FIELDS_MAP_FILE)
-    logger.info(f"Loading model fields from: {model_fields_map_file}")
-    model_fields_map = json.load(open(model_fields_map_file, "r"))
-    logger.info(f"Loaded fields for {len(model_fields_map.keys())} models")
     model = model.replace('.', '_')
-    return model_fields_map.get(model, [])
+    return list(get_model_fields_map().get(model, ()))
\ No newline at end of file
@@ -1,4 +1,7 @@
 from . import res_config_settings
 from . import chat
 from . import message
-from . import demo_utils
\ No newline at end of file
+from . import job
+from . import demo_utils
+from . import translation_cache
+from . import schema_snapshot
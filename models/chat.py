@@ -1,4 +1,9 @@
 from odoo import models, fields, api
+from odoo.addons.chartly.core.chat_history import (
+    DEFAULT_HISTORY_TOKEN_BUDGET, SUMMARY_MAX_TOKENS, COMPACTED_HISTORY_SHARE, build_history, summarize_messages,
+    get_main_prompt,
+)
+from odoo.addons.chartly.core.prompt_prefix import assemble_messages
 
 class Chat(models.Model):
     _name = "chartly.chat"
@@ -6,26 +11,40 @@ class Chat(models.Model):
     _order = "created_at desc"
 
     title = fields.Char(string="Title", default="New Chat")
-    created_at = fields.Datetime(string="Created At", default=fields.Datetime.now)
+    created_at = fields.Datetime(string="Created At", default=fields.Datetime.now, index=True)
     messages = fields.One2many(
         comodel_name="chartly.chat.message",
         inverse_name="chat_id",
         string="Messages"
     )
-    message_count = fields.Integer(string="Message Count", compute="_compute_message_count")
+    message_count = fields.Integer(string="Message Count", compute="_compute_message_stats", store=True)
     # Add a dummy field for the widget to bind to
     chat_interface = fields.Char(string="Chat Interface", compute="_compute_chat_interface")
-    total_cost = fields.Float(string="Total Cost", compute="_compute_total_cost")
+    total_cost = fields.Float(string="Total Cost", compute="_compute_message_stats", store=True)
+    # Running summary of the messages that no longer fit in the history sent to the model
+    history_summary = fields.Text(string="History Summary", copy=False)
+    summary_message_id = fields.Many2one(
+        comodel_name="chartly.chat.message",
+        string="Summarized Up To",
+        ondelete="set null",
+        copy=False
+    )
 
-    @api.depends('messages')
-    def _compute_total_cost(self):
-        for chat in self:
-            chat.total_cost = sum(chat.messages.mapped('cost'))
+    @api.depends('messages', 'messages.cost')
+    def _compute_message_stats(self):
+        """Recomputed by the ORM when messages are created, deleted or re-costed.
 
-    @api.depends('messages')
-    def _compute_message_count(self):
+        One grouped SQL query covers the whole batch, so messages are never loaded.
+        """
+        stats = {}
+        chat_ids = [chat_id for chat_id in self.ids if chat_id]
+        if chat_ids:
+            groups = self.env['chartly.chat.message']._read_group(
+                [('chat_id', 'in', chat_ids)], ['chat_id'], ['cost:sum', '__count']
+            )
+            stats = {chat.id: (cost, count) for chat, cost, count in groups}
         for chat in self:
-            chat.message_count = len(chat.messages)
+            chat.total_cost, chat.message_count = stats.get(chat.id, (0.0, 0))
 
     def _compute_chat_interface(self):
         """Dummy compute method for the widget"""
@@ -46,6 +65,56 @@ class Chat(models.Model):
             'target': 'current',
         }
 
+    def _get_history_token_budget(self):
+        budget = self.env['ir.config_parameter'].sudo().get_param('chartly.history_token_budget')
+        return int(budget or DEFAULT_HISTORY_TOKEN_BUDGET)
+
+    def prepare_history(self, openai_client, exclude_ids=(), before_id=None):
+        """Chat history fitted to the token budget, and the cost of updating the summary.
+
+        With `before_id`, only the messages older than that one are part of the history.
+        Messages already folded into the summary are not read again. Messages that drop out
+        of the budget are added to the summary with one LLM call, once.
+        """
+        self.ensure_one()
+        domain = [('chat_id', '=', self.id), ('id', 'not in', list(exclude_ids)), ('state', '!=', 'pending')]
+        if before_id:
+            domain.append(('id', '<', before_id))
+        if self.summary_message_id:
+            domain.append(('id', '>', self.summary_message_id.id))
+        rows = self.env['chartly.chat.message'].search_read(domain, ['sender', 'content'], order='id asc')
+
+        budget = self._get_history_token_budget()
+        messages, dropped = build_history(rows, budget)
+        if dropped:
+            # Leave room for the summary, and for the next turns: until the history outgrows its
+            # budget again, the summary and the messages kept stay the same prompt prefix
+            messages, dropped = build_history(rows, int((budget - SUMMARY_MAX_TOKENS) * COMPACTED_HISTORY_SHARE))
+
+        cost = 0
+        if dropped:
+            result = summarize_messages(openai_client, self.history_summary, dropped)
+            cost = result.get("cost", 0)
+            if result.get("summary"):
+                self.write({
+                    'history_summary': result["summary"],
+                    'summary_message_id': dropped[-1]['id'],
+                })
+
+        if self.history_summary:
+            messages = [{"role": "system", "content": f"Summary of the earlier conversation:\n{self.history_summary}"}] + messages
+        return messages, cost
+
+    def prepare_messages(self, openai_client, user_message):
+        """System prompt, earlier messages fitted to the token budget, then `user_message` in full"""
+        self.ensure_one()
+        # Messages posted after the question, while its job was queued, are not its context
+        chat_history, summary_cost = self.prepare_history(openai_client, before_id=user_message.id)
+        if summary_cost:
+            # Charge the summary update to the turn that needed it
+            user_message.cost += summary_cost
+        return assemble_messages(get_main_prompt(), history=chat_history, variable=user_message.content)
+
     def get_chat_context(self):
         """Get context for the chat interface"""
         return {
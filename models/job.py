@@ -0,0 +1,189 @@
+from contextlib import contextmanager
+from odoo import models, fields, api
+from odoo.addons.chartly.core.openai import get_openai_client
+from odoo.addons.chartly.core.tools import get_tools, tools_context, run_tool_calls, get_max_tool_iterations
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+JOB_PLACEHOLDER_CONTENT = "Working on it..."
+JOB_MAX_ATTEMPTS = 2
+# First key of the session advisory locks held on running jobs, the job id being the second;
+# the lock goes away with the connection of a worker that died, however long the job runs
+JOB_LOCK_KEY = 0x63686a62
+JOB_NOTIFICATION = "chartly.job"
+
+class ChatJob(models.Model):
+    _name = "chartly.job"
+    _description = "Chartly AI Turn"
+    _order = "id asc"
+
+    chat_id = fields.Many2one("chartly.chat", string="Chat", required=True, ondelete="cascade")
+    user_message_id = fields.Many2one("chartly.chat.message", string="Question", required=True, ondelete="cascade")
+    message_id = fields.Many2one("chartly.chat.message", string="Answer", required=True, ondelete="cascade")
+    user_id = fields.Many2one("res.users", string="User", required=True, default=lambda self: self.env.user)
+    state = fields.Selection(
+        [("pending", "Pending"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")],
+        string="State",
+        default="pending",
+        required=True,
+        index=True
+    )
+    error = fields.Text(string="Error")
+    attempts = fields.Integer(string="Attempts", default=0)
+    created_at = fields.Datetime(string="Created At", default=fields.Datetime.now)
+    started_at = fields.Datetime(string="Started At")
+    worker_pid = fields.Integer(string="Worker Backend PID", help="Database backend of the worker running the job")
+    finished_at = fields.Datetime(string="Finished At")
+
+    @api.model
+    def enqueue(self, chat, user_message):
+        """Queue the AI answer to `user_message` behind a pending placeholder message.
+
+        The answer is computed by the jobs cron, triggered right away; the placeholder is
+        filled in when it ends and the user is notified on the bus.
+        """
+        placeholder = self.env['chartly.chat.message'].create({
+            'chat_id': chat.id,
+            'content': JOB_PLACEHOLDER_CONTENT,
+            'sender': 'ai',
+            'state': 'pending',
+        })
+        job = self.sudo().create({
+            'chat_id': chat.id,
+            'user_message_id': user_message.id,
+            'message_id': placeholder.id,
+            'user_id': self.env.uid,
+        })
+        self.env.ref('chartly.ir_cron_chartly_jobs').sudo()._trigger()
+        return job.with_env(self.env)
+
+    def _commit(self):
+        # Each claimed job is committed on its own so that other workers skip it
+        if not self.env.registry.in_test_mode():
+            self.env.cr.commit()
+
+    @api.model
+    def _claim(self):
+        """Mark the oldest pending job as running, skipping jobs locked by other workers.
+
+        The worker keeps a session advisory lock on the job until it is finished, taken before
+        the job shows as running to the others.
+        """
+        self.env.flush_all()
+        self.env.cr.execute(f"""
+            UPDATE {self._table}
+               SET state = 'running', started_at = now() at time zone 'UTC', attempts = attempts + 1,
+                   worker_pid = pg_backend_pid()
+             WHERE id = (
+                SELECT id FROM {self._table}
+                 WHERE state = 'pending'
+                 ORDER BY id
+                 LIMIT 1
+                 FOR UPDATE SKIP LOCKED
+             )
+         RETURNING id
+        """)
+        row = self.env.cr.fetchone()
+        if row:
+            self.env.cr.execute("SELECT pg_advisory_lock(%s, %s)", (JOB_LOCK_KEY, row[0]))
+        self.invalidate_model(['state', 'started_at', 'attempts', 'worker_pid'])
+        self._commit()
+        return self.browse(row[0]) if row else self.browse()
+
+    def _release(self):
+        self.ensure_one()
+        self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", (JOB_LOCK_KEY, self.id))
+
+    @api.model
+    def _requeue_stale(self):
+        """Requeue the running jobs whose worker is gone: no session holds their lock anymore"""
+        self.env.flush_all()
+        self.env.cr.execute(f"""
+            SELECT id FROM {self._table} job
+             WHERE state = 'running'
+               AND NOT EXISTS (
+                SELECT 1 FROM pg_locks l
+                 WHERE l.locktype = 'advisory' AND l.granted AND l.objsubid = 2
+                   AND l.classid = %s::oid AND l.objid = job.id::oid
+               )
+        """, (JOB_LOCK_KEY,))
+        stale = self.browse([row[0] for row in self.env.cr.fetchall()])
+        retry = stale.filtered(lambda job: job.attempts < JOB_MAX_ATTEMPTS)
+        retry.write({'state': 'pending', 'worker_pid': False})
+        for job in stale - retry:
+            job._finish({'success': False, 'error': 'The worker running the answer stopped'})
+        if stale:
+            logger.warning(f"Requeued {len(retry)} and abandoned {len(stale - retry)} stale Chartly jobs")
+
+    @api.model
+    def _cron_run_jobs(self):
+        """Run the oldest pending job; started by the jobs cron and triggered by `enqueue`.
+
+        A single turn per run keeps runs within the cron time limit; the cron is triggered
+        again while jobs are pending. Returns whether a job was run.
+        """
+        self._requeue_stale()
+        job = self._claim()
+        if not job:
+            return False
+        try:
+            job._run()
+            self._commit()
+        finally:
+            job._release()
+        if self.search_count([('state', '=', 'pending')], limit=1):
+            self.env.ref('chartly.ir_cron_chartly_jobs').sudo()._trigger()
+        return True
+
+    def _complete(self):
+        """Run the AI turn of the job as its user"""
+        self.ensure_one()
+        openai_client = get_openai_client(self.env)
+        chat_history = self.chat_id.prepare_messages(openai_client, self.user_message_id)
+        tools_map, tools_descriptions = get_tools()
+        with tools_context(env=self.env, openai_client=openai_client):
+            return openai_client.chat_completion_with_tools(
+                chat_history, tools_descriptions, tools_map,
+                max_iterations=get_max_tool_iterations(self.env), run_tool_calls=run_tool_calls
+            )
+
+    @contextmanager
+    def _pipeline_env(self):
+        # Outside tests the pipeline runs on its own cursor, so that the job's cursor holds no
+        # transaction, only the job lock, while the LLM answers
+        if self.env.registry.in_test_mode():
+            with self.env.cr.savepoint():
+                yield self.env
+            return
+        with self.env.registry.cursor() as cr:
+            yield self.env(cr=cr)
+
+    def _run(self):
+        self.ensure_one()
+        user = self.user_id
+        self._commit()
+        try:
+            with self._pipeline_env() as env:
+                ai_result = self.with_env(env).with_user(user)._complete()
+        except Exception as e:
+            logger.error(f"Error in Chartly job {self.id}: {str(e)}")
+            ai_result = {'success': False, 'error': str(e)}
+        self._finish(ai_result)
+
+    def _finish(self, ai_result):
+        """Store `ai_result` in the placeholder message and notify the user"""
+        self.ensure_one()
+        Message = self.env['chartly.chat.message']
+        self.message_id.write(Message._ai_result_values(ai_result))
+        self.write({
+            'state': 'done' if ai_result.get('success') else 'failed',
+            'error': None if ai_result.get('success') else ai_result.get('error', 'Unknown error'),
+            'finished_at': fields.Datetime.now(),
+        })
+        self.env['bus.bus']._sendone(self.user_id.partner_id, JOB_NOTIFICATION, {
+            'job_id': self.id,
+            'chat_id': self.chat_id.id,
+            'message_id': self.message_id.id,
+            'state': self.state,
+        })
@@ -1,4 +1,4 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 
 class ChatMessage(models.Model):
     _name = "chartly.chat.message"
@@ -14,6 +14,50 @@ class ChatMessage(models.Model):
         required=True
     )
 
+    # AI messages of background jobs are created pending and filled in when the job ends
+    state = fields.Selection(
+        [("pending", "Pending"), ("done", "Done"), ("failed", "Failed")],
+        string="State",
+        default="done",
+        required=True
+    )
+
     created_at = fields.Datetime(string="Created At", default=fields.Datetime.now)
     has_image = fields.Boolean(string="Has Image", default=False)
-    image = fields.Binary(string="Image")
\ No newline at end of file
+    # Stored as an ir.attachment in the filestore and served by /chartly/image/<id>
+    image = fields.Binary(string="Image", attachment=True)
+
+    def init(self):
+        # Messages are always read per chat, in chat order or by id cursor (see get_messages);
+        # both indexes also serve lookups on chat_id alone
+        tools.create_index(self._cr, 'chartly_chat_message_chat_id_created_at_idx', self._table, ['chat_id', 'created_at'])
+        tools.create_index(self._cr, 'chartly_chat_message_chat_id_id_idx', self._table, ['chat_id', 'id'])
+
+    @api.model
+    def _ai_result_values(self, ai_result):
+        """Message values for the outcome of an AI turn"""
+        if ai_result.get('success'):
+            content = ai_result.get('content') or 'No response from AI.'
+        else:
+            content = f"Error: {ai_result.get('error', 'Unknown error')}"
+
+        values = {
+            'content': content,
+            'sender': 'ai',
+            'cost': ai_result.get('cost', 0),
+            'state': 'done' if ai_result.get('success') else 'failed',
+        }
+        if "image" in ai_result:
+            values.update({
+                'has_image': True,
+                'image': ai_result["image"],
+            })
+        return values
+
+    def _get_image_attachment(self):
+        self.ensure_one()
+        return self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', 'image'),
+        ], limit=1)
\ No newline at end of file
@@ -7,4 +7,72 @@ class ResConfigSettings(models.TransientModel):
     model = fields.Selection(
         selection=[ ('gpt-3.5-turbo', 'GPT-3.5 Turbo'), ('gpt-4.1', 'GPT-4.1'), ('gpt-5-nano', 'GPT-5 Nano'), ('gpt-5.1', 'GPT-5.1') ],
         string="AI Model",
-        config_parameter='chartly.model')
\ No newline at end of file
+        config_parameter='chartly.model')
+    http_pool_size = fields.Integer(
+        string="HTTP Pool Size",
+        default=4,
+        config_parameter='chartly.http_pool_size')
+    translation_cache_ttl_hours = fields.Float(
+        string="Translation Cache TTL (hours)",
+        default=24,
+        config_parameter='chartly.translation_cache_ttl_hours')
+    translation_cache_size = fields.Integer(
+        string="Translation Cache Size",
+        default=1000,
+        config_parameter='chartly.translation_cache_size')
+    pipeline_mode = fields.Selection(
+        selection=[('staged', 'Staged (models, SQL, columns)'), ('fused', 'Fused (single request)')],
+        string="Pipeline Mode",
+        default='staged',
+        config_parameter='chartly.pipeline_mode')
+    response_mode = fields.Selection(
+        selection=[('stream', 'Streamed'), ('async', 'Background job')],
+        string="Response Mode",
+        default='stream',
+        config_parameter='chartly.response_mode')
+    max_tool_iterations = fields.Integer(
+        string="Max Tool Rounds",
+        default=5,
+        config_parameter='chartly.max_tool_iterations')
+    model_shortlist_size = fields.Integer(
+        string="Model Shortlist Size",
+        default=8,
+        config_parameter='chartly.model_shortlist_size')
+    schema_mode = fields.Selection(
+        selection=[('pruned', 'Fields relevant to the question'), ('full', 'All fields')],
+        string="SQL Schema",
+        default='pruned',
+        config_parameter='chartly.schema_mode')
+    history_token_budget = fields.Integer(
+        string="History Token Budget",
+        default=4000,
+        config_parameter='chartly.history_token_budget')
+    query_row_limit = fields.Integer(
+        string="Query Row Limit",
+        default=1000,
+        config_parameter='chartly.query_row_limit')
+    query_timeout = fields.Integer(
+        string="Query Timeout (ms)",
+        default=30000,
+        config_parameter='chartly.query_timeout')
+    query_batch_size = fields.Integer(
+        string="Query Batch Size",
+        default=500,
+        config_parameter='chartly.query_batch_size')
+    plot_mode = fields.Selection(
+        selection=[('script', 'Generated script'), ('spec', 'Chart spec (script fallback)')],
+        string="Chart Mode",
+        default='script',
+        config_parameter='chartly.plot_mode')
+    plot_pool_size = fields.Integer(
+        string="Renderer Processes",
+        default=2,
+        config_parameter='chartly.plot_pool_size')
+    plot_cpu_limit = fields.Integer(
+        string="Chart CPU Limit (s)",
+        default=10,
+        config_parameter='chartly.plot_cpu_limit')
+    plot_timeout = fields.Integer(
+        string="Chart Timeout (s)",
+        default=30,
+        config_parameter='chartly.plot_timeout')
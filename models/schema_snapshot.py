@@ -0,0 +1,97 @@
+import json
+from odoo import models, fields, api
+from odoo.addons.chartly.core.schema_snapshot import (
+    SCHEMA_VERSION_PARAM, SCHEMA_ROWS_PARAM, introspect, entry_hash, snapshot_version, dump_entry, rows_changed,
+    get_snapshot_models,
+)
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+# Key of the advisory lock letting a single process refresh the snapshot at a time
+SNAPSHOT_LOCK_KEY = 0x63687363
+
+class SchemaSnapshotModel(models.Model):
+    _name = "chartly.schema.model"
+    _description = "Chartly Schema Snapshot"
+    _order = "model"
+
+    model = fields.Char(string="Model", required=True, index=True)
+    table_name = fields.Char(string="Table", required=True)
+    schema_hash = fields.Char(string="Hash", required=True)
+    # Compact JSON of the snapshot entry, see core/schema_snapshot.py
+    data = fields.Text(string="Data", required=True)
+    row_estimate = fields.Integer(string="Rows (estimate)")
+    updated_at = fields.Datetime(string="Updated At", default=fields.Datetime.now)
+
+    _sql_constraints = [
+        ("model_unique", "unique(model)", "Each model has a single schema snapshot."),
+    ]
+
+    def init(self):
+        # Run on every install and upgrade of the module itself
+        self.refresh_snapshot()
+
+    def _register_hook(self):
+        # The registry is also loaded at server start and when any other module is installed
+        # or upgraded, which may change the tables; nothing is written unless they did
+        super()._register_hook()
+        self.env.cr.execute("SELECT pg_try_advisory_xact_lock(%s)", (SNAPSHOT_LOCK_KEY,))
+        if self.env.cr.fetchone()[0]:
+            self.refresh_snapshot()
+
+    @api.model
+    def refresh_snapshot(self):
+        """Regenerate the entries of the models whose columns or foreign keys changed, or whose
+        row estimate moved by more than ROWS_CHANGE_FACTOR.
+
+        Returns the snapshot version, which changes with the structure of any model.
+        """
+        entries = introspect(self.env.cr, get_snapshot_models())
+        existing = {record.model: record for record in self.sudo().search([])}
+        hashes = {}
+        changed = []
+        recounted = []
+        for model, entry in entries.items():
+            model_hash = hashes[model] = entry_hash(entry)
+            vals = {
+                'table_name': entry['table'],
+                'schema_hash': model_hash,
+                'data': dump_entry(entry),
+                'row_estimate': entry['rows'],
+                'updated_at': fields.Datetime.now(),
+            }
+            record = existing.pop(model, None)
+            if record is None:
+                self.sudo().create(dict(vals, model=model))
+                changed.append(model)
+            elif record.schema_hash != model_hash:
+                record.write(vals)
+                changed.append(model)
+            elif rows_changed(record.row_estimate, entry['rows']):
+                record.write(vals)
+                recounted.append(model)
+        removed = self.sudo().browse([record.id for record in existing.values()])
+        removed_models = removed.mapped('model')
+        removed.unlink()
+
+        version = snapshot_version(hashes)
+        params = self.env['ir.config_parameter'].sudo()
+        if params.get_param(SCHEMA_VERSION_PARAM) != version:
+            params.set_param(SCHEMA_VERSION_PARAM, version)
+        if changed or recounted or removed_models:
+            rows_version = snapshot_version({r.model: str(r.row_estimate) for r in self.sudo().search([])})
+            params.set_param(SCHEMA_ROWS_PARAM, rows_version)
+        if changed or removed_models:
+            logger.info(f"Schema snapshot {version}: regenerated {changed}, removed {removed_models}")
+        return version
+
+    @api.model
+    def get_stats(self):
+        records = self.sudo().search_read([], ['data', 'row_estimate'])
+        return {
+            "version": self.env['ir.config_parameter'].sudo().get_param(SCHEMA_VERSION_PARAM),
+            "models": len(records),
+            "edges": sum(len(json.loads(r['data'])['edges']) for r in records),
+            "rows": sum(r['row_estimate'] for r in records),
+        }
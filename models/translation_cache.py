@@ -0,0 +1,123 @@
+import json
+from datetime import timedelta
+import psycopg2
+from odoo import models, fields, api
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+DEFAULT_TTL_HOURS = 24
+DEFAULT_MAX_ENTRIES = 1000
+
+class TranslationCache(models.Model):
+    _name = "chartly.translation.cache"
+    _description = "Chartly Translation Cache"
+    _order = "last_used_at desc"
+
+    key = fields.Char(string="Key", required=True, index=True)
+    stage = fields.Selection(
+        [("nl_to_model", "NL to Model"), ("nl_to_sql", "NL to SQL"), ("nl_to_query", "NL to Query")],
+        string="Stage",
+        required=True
+    )
+    query = fields.Text(string="Query")
+    llm_model = fields.Char(string="LLM Model")
+    value = fields.Text(string="Value", required=True)
+    hit_count = fields.Integer(string="Hits", default=0)
+    created_at = fields.Datetime(string="Created At", default=fields.Datetime.now)
+    last_used_at = fields.Datetime(string="Last Used At", default=fields.Datetime.now, index=True)
+
+    _sql_constraints = [
+        ("key_unique", "unique(key)", "Translation cache keys must be unique."),
+    ]
+
+    def _get_ttl(self):
+        ttl = self.env['ir.config_parameter'].sudo().get_param('chartly.translation_cache_ttl_hours')
+        return timedelta(hours=float(ttl if ttl not in (None, False, '') else DEFAULT_TTL_HOURS))
+
+    def _get_max_entries(self):
+        size = self.env['ir.config_parameter'].sudo().get_param('chartly.translation_cache_size')
+        return int(size if size not in (None, False, '') else DEFAULT_MAX_ENTRIES)
+
+    @api.model
+    def lookup(self, key):
+        """Return the cached value for `key`, or None when missing or expired.
+
+        The hit is counted on a best-effort basis: a concurrent request updating the same
+        entry only makes this one skip its count.
+        """
+        entries = self.search_read([('key', '=', key)], ['value', 'created_at'], limit=1)
+        if not entries:
+            return None
+        entry = entries[0]
+        if entry['created_at'] and entry['created_at'] + self._get_ttl() < fields.Datetime.now():
+            # Expired entries are removed by the eviction of the next store
+            return None
+        self._execute_safely(f"""
+            UPDATE {self._table}
+               SET hit_count = hit_count + 1, last_used_at = now() at time zone 'UTC'
+             WHERE id = (SELECT id FROM {self._table} WHERE id = %s FOR UPDATE SKIP LOCKED)
+        """, [entry['id']])
+        self.invalidate_model(['hit_count', 'last_used_at'])
+        return json.loads(entry['value'])
+
+    @api.model
+    def store(self, key, stage, value, query=None, llm_model=None):
+        """Store `value` under `key` and evict expired and least recently used entries.
+
+        Concurrent requests storing the same key don't fail: the entry is upserted, and an
+        entry that can't be written is only logged, the translation itself is not affected.
+        """
+        self.env.flush_all()
+        stored = self._execute_safely(f"""
+            INSERT INTO {self._table}
+                   (key, stage, value, query, llm_model, hit_count, created_at, last_used_at,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES (%(key)s, %(stage)s, %(value)s, %(query)s, %(llm_model)s, 0, %(now)s, %(now)s,
+                    %(uid)s, %(now)s, %(uid)s, %(now)s)
+            ON CONFLICT (key) DO UPDATE
+               SET stage = EXCLUDED.stage, value = EXCLUDED.value, query = EXCLUDED.query,
+                   llm_model = EXCLUDED.llm_model, created_at = EXCLUDED.created_at,
+                   last_used_at = EXCLUDED.last_used_at, write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, {
+            'key': key, 'stage': stage, 'value': json.dumps(value), 'query': query,
+            'llm_model': llm_model, 'now': fields.Datetime.now(), 'uid': self.env.uid,
+        })
+        self.invalidate_model()
+        if stored:
+            self._evict()
+
+    def _execute_safely(self, query, params) -> bool:
+        # Cache writes run in a savepoint so that a conflict with a concurrent request
+        # only loses the write, not the transaction of the chat turn
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute(query, params)
+            return True
+        except psycopg2.Error as e:
+            logger.info(f"Translation cache write skipped: {e}")
+            return False
+
+    @api.model
+    def _evict(self):
+        expired_before = fields.Datetime.now() - self._get_ttl()
+        self._execute_safely(f"""
+            DELETE FROM {self._table}
+             WHERE created_at < %s
+                OR id IN (SELECT id FROM {self._table} ORDER BY last_used_at DESC, id DESC OFFSET %s)
+        """, [expired_before, self._get_max_entries()])
+        self.invalidate_model()
+
+    @api.model
+    def get_stats(self):
+        """Entries and hits per stage"""
+        stats = {'entries': 0, 'hits': 0, 'stages': {}}
+        groups = self.read_group([], ['hit_count:sum'], ['stage'])
+        for group in groups:
+            entries = group['stage_count']
+            hits = group['hit_count'] or 0
+            stats['stages'][group['stage']] = {'entries': entries, 'hits': hits}
+            stats['entries'] += entries
+            stats['hits'] += hits
+        return stats
@@ -1,9 +1,14 @@
 /** @odoo-module **/
 
 import { registry } from "@web/core/registry";
-import { Component, useState, onWillStart, onMounted } from "@odoo/owl";
+import { Component, useState, onWillStart, onMounted, onWillUnmount } from "@odoo/owl";
 import { useService } from "@web/core/utils/hooks";
 
+const MESSAGES_PAGE_SIZE = 50;
+// Background jobs are polled with a growing delay; bus notifications cut the wait short
+const JOB_POLL_MIN_DELAY = 1000;
+const JOB_POLL_MAX_DELAY = 8000;
+
 export class ChatWidget extends Component {
   static template = "chartly.chat_widget";
 
@@ -12,12 +17,19 @@ export class ChatWidget extends Component {
   setup() {
     this.rpc = useService("rpc");
     this.action = useService("action");
+    this.busService = useService("bus_service");
+    // Wake-up callbacks of the jobs being waited for, by pending message id
+    this.jobWaiters = new Map();
+    this.onJobNotification = this.onJobNotification.bind(this);
 
     this.state = useState({
       messages: [],
+      hasMoreMessages: false,
+      isLoadingOlder: false,
       inputValue: "",
       isLoading: false,
       totalCost: 0,
+      responseMode: "stream",
       chatTitle: "",
       createdAt: "",
       showMenu: false,
@@ -48,6 +60,13 @@ export class ChatWidget extends Component {
       this.scrollToBottom();
       // Close dropdown when clicking outside
       document.addEventListener("click", this.onDocumentClick.bind(this));
+      this.busService.subscribe("chartly.job", this.onJobNotification);
+      this.resumePendingMessages();
+    });
+
+    onWillUnmount(() => {
+      this.busService.unsubscribe("chartly.job", this.onJobNotification);
+      this.jobWaiters.clear();
     });
   }
 
@@ -85,6 +104,7 @@ export class ChatWidget extends Component {
         this.state.chatTitle = result.title || "";
         this.state.createdAt = result.created_at || "";
         this.state.totalCost = result.total_cost || 0;
+        this.state.responseMode = result.response_mode || "stream";
       }
     } catch (error) {
       console.error("Error loading chat info:", error);
@@ -101,10 +121,12 @@ export class ChatWidget extends Component {
     try {
       const result = await this.rpc("/chartly/get_messages", {
         chat_id: id,
+        limit: MESSAGES_PAGE_SIZE,
       });
 
       if (result.success) {
         this.state.messages = result.messages;
+        this.state.hasMoreMessages = result.has_more;
         this.state.totalCost = result.total_cost || 0;
         this.scrollToBottom();
       }
@@ -113,6 +135,59 @@ export class ChatWidget extends Component {
     }
   }
 
+  async loadOlderMessages() {
+    const first = this.state.messages.find((m) => !m.isLocal);
+    if (!first || this.state.isLoadingOlder) return;
+
+    this.state.isLoadingOlder = true;
+    const container = document.querySelector(".chat-messages-scrollable");
+    const previousHeight = container ? container.scrollHeight : 0;
+    try {
+      const result = await this.rpc("/chartly/get_messages", {
+        chat_id: this.chatId,
+        before_id: first.id,
+        limit: MESSAGES_PAGE_SIZE,
+      });
+
+      if (result.success) {
+        this.state.messages.unshift(...result.messages);
+        this.state.hasMoreMessages = result.has_more;
+        // Keep the messages that were on screen in place
+        setTimeout(() => {
+          if (container) {
+            container.scrollTop += container.scrollHeight - previousHeight;
+          }
+        }, 0);
+      }
+    } catch (error) {
+      console.error("Error loading older messages:", error);
+    } finally {
+      this.state.isLoadingOlder = false;
+    }
+  }
+
+  // Fetch only the messages stored since the last one shown
+  async loadNewMessages() {
+    const persisted = this.state.messages.filter((m) => !m.isLocal);
+    const lastId = persisted.length ? persisted[persisted.length - 1].id : null;
+    if (!lastId) {
+      await this.loadMessages();
+      return [];
+    }
+
+    const result = await this.rpc("/chartly/get_messages", {
+      chat_id: this.chatId,
+      after_id: lastId,
+      limit: MESSAGES_PAGE_SIZE,
+    });
+    if (!result.success) {
+      return [];
+    }
+    this.state.messages.push(...result.messages);
+    this.state.totalCost = result.total_cost || 0;
+    return result.messages;
+  }
+
   // Navigation methods
   onGoHome() {
     this.action.doAction("chartly.action_chartly_chat");
@@ -273,6 +348,7 @@ export class ChatWidget extends Component {
       sender: "user",
       created_at: new Date().toLocaleString(),
       cost: 0,
+      isLocal: true,
     };
     this.state.messages.push(userMessage);
 
@@ -283,25 +359,52 @@ export class ChatWidget extends Component {
       sender: "ai",
       created_at: "",
       isLoading: true,
+      isLocal: true,
+      progress: "",
       cost: 0,
     };
     this.state.messages.push(loadingMessage);
     this.scrollToBottom();
 
     try {
-      const result = await this.rpc("/chartly/send_message", {
-        chat_id: chatId,
-        message_content: messageContent,
-      });
-
+      let result = null;
+      if (this.state.responseMode === "async") {
+        result = await this.sendMessageAsync(chatId, messageContent);
+      } else {
+        await this.streamMessage(chatId, messageContent, (event, data) => {
+          const pending = this.state.messages.find((m) => m.isLoading);
+          if (event === "progress" && pending) {
+            pending.progress = data.message;
+          } else if (event === "token" && pending) {
+            pending.content += data.content;
+          } else if (event === "done" || event === "error") {
+            result = data;
+          }
+        });
+      }
       // Remove loading message
       const loadingIndex = this.state.messages.findIndex((m) => m.isLoading);
       if (loadingIndex !== -1) {
         this.state.messages.splice(loadingIndex, 1);
       }
 
+      if (!result) {
+        // The stream was cut: pick up whatever the server stored meanwhile
+        this.removeLocalMessages();
+        const stored = await this.loadNewMessages();
+        result = stored.some((m) => m.sender === "ai")
+          ? { success: true }
+          : { success: false, error: "Connection closed before the response completed" };
+      }
+
       if (result.success) {
-        // Add AI message to state (user message already shown)
+        // Replace the optimistic user message by the stored one
+        if (result.user_message) {
+          const localIndex = this.state.messages.findIndex((m) => m.isLocal && m.sender === "user");
+          if (localIndex !== -1) {
+            this.state.messages.splice(localIndex, 1, result.user_message);
+          }
+        }
         if (result.ai_message) {
           this.state.messages.push(result.ai_message);
         }
@@ -317,6 +420,7 @@ export class ChatWidget extends Component {
           sender: "ai",
           created_at: new Date().toLocaleString(),
           cost: 0,
+          isLocal: true,
         });
       }
     } catch (error) {
@@ -332,6 +436,7 @@ export class ChatWidget extends Component {
         sender: "ai",
         created_at: new Date().toLocaleString(),
         cost: 0,
+        isLocal: true,
       });
     } finally {
       this.state.isLoading = false;
@@ -339,6 +444,125 @@ export class ChatWidget extends Component {
     }
   }
 
+  removeLocalMessages() {
+    this.state.messages = this.state.messages.filter((m) => !m.isLocal);
+  }
+
+  async sendMessageAsync(chatId, messageContent) {
+    const queued = await this.rpc("/chartly/send_message_async", {
+      chat_id: chatId,
+      message_content: messageContent,
+    });
+    if (!queued.success) {
+      return queued;
+    }
+    const pending = this.state.messages.find((m) => m.isLoading);
+    if (pending) {
+      pending.progress = "Queued";
+    }
+    const status = await this.waitForJob(queued.ai_message.id);
+    if (!status.success) {
+      return status;
+    }
+    return {
+      success: true,
+      user_message: queued.user_message,
+      ai_message: status.ai_message,
+      total_cost: status.total_cost,
+    };
+  }
+
+  // Resolve with the job status once the answer of the pending message `messageId` is stored
+  async waitForJob(messageId) {
+    let delay = JOB_POLL_MIN_DELAY;
+    while (true) {
+      await new Promise((resolve) => {
+        const timer = setTimeout(resolve, delay);
+        this.jobWaiters.set(messageId, () => {
+          clearTimeout(timer);
+          resolve();
+        });
+      });
+      this.jobWaiters.delete(messageId);
+      const result = await this.rpc("/chartly/job_status", { message_id: messageId });
+      if (!result.success || result.state === "done" || result.state === "failed") {
+        return result;
+      }
+      delay = Math.min(delay * 2, JOB_POLL_MAX_DELAY);
+    }
+  }
+
+  onJobNotification(payload) {
+    const wake = this.jobWaiters.get(payload.message_id);
+    if (wake) {
+      wake();
+    }
+  }
+
+  // Answers still computed by a background job when the chat was opened
+  async resumePendingMessages() {
+    const pending = this.state.messages.filter((m) => m.state === "pending");
+    await Promise.all(
+      pending.map(async (message) => {
+        try {
+          const result = await this.waitForJob(message.id);
+          const index = this.state.messages.findIndex((m) => m.id === message.id);
+          if (result.success && result.ai_message && index !== -1) {
+            this.state.messages.splice(index, 1, result.ai_message);
+            this.state.totalCost = result.total_cost || 0;
+            this.scrollToBottom();
+          }
+        } catch (error) {
+          console.error("Error waiting for pending message:", error);
+        }
+      })
+    );
+  }
+
+  async streamMessage(chatId, messageContent, onEvent) {
+    const response = await fetch("/chartly/send_message_stream", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        chat_id: chatId,
+        message_content: messageContent,
+      }),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Streaming request failed with status ${response.status}`);
+    }
+
+    // Server-sent events are separated by a blank line
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = "message";
+        let data = "";
+        for (const line of rawEvent.split("\n")) {
+          if (line.startsWith("event:")) {
+            event = line.slice(6).trim();
+          } else if (line.startsWith("data:")) {
+            data += line.slice(5).trim();
+          }
+        }
+        if (data) {
+          onEvent(event, JSON.parse(data));
+          this.scrollToBottom();
+        }
+      }
+    }
+  }
+
   onKeyPress(ev) {
     if (ev.key === "Enter" && !ev.shiftKey) {
       ev.preventDefault();
@@ -1,12 +1,32 @@
 # Unit tests
 from . import test_openai 
+from . import test_prompt_prefix
 from . import test_nl_to_sql
+from . import test_field_pruning
+from . import test_schema_snapshot
 from . import test_filter_attributes
 from . import test_query_to_plot
+from . import test_plot_renderer
+from . import test_chart_spec
 from . import test_nl_to_model
+from . import test_model_index
+from . import test_nl_to_query
 from . import test_execute_query
+from . import test_sql_projection
+from . import test_sql_validator
+from . import test_stage_scheduler
+from . import test_result_set
+from . import test_chat
+from . import test_chat_history
+from . import test_job
 from . import test_utils
+from . import test_http_pool
+from . import test_translation_cache
+from . import test_resources
 
 # Integration tests
+from . import test_message_image
+from . import test_get_messages
+from . import test_send_message_stream
 from . import test_tools
 from . import test_call_tool
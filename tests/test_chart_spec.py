@@ -0,0 +1,78 @@
+import base64
+import json
+from decimal import Decimal
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.openai import OpenAIClient
+from odoo.addons.chartly.core.chart_spec import query_to_chart_spec
+from odoo.addons.chartly.core.chart_renderer import check_spec, render_chart
+from odoo.addons.chartly.core.result_set import ResultSet
+
+
+class StubClient(OpenAIClient):
+
+    def __init__(self, content):
+        super().__init__("test-key", "gpt-4.1")
+        self.content = content
+
+    def chat_completion(self, messages, **kwargs):
+        return {"success": True, "content": self.content, "cost": 0.001}
+
+
+def make_spec(**values):
+    spec = {"type": "bar", "x": "customer", "y": ["amount"], "series": None,
+            "aggregation": "sum", "sort": "y_desc", "title": "Revenue per customer"}
+    spec.update(values)
+    return spec
+
+
+@tagged('unit', 'chart_spec')
+class TestChartSpec(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = ResultSet(["customer", "amount", "state"])
+        self.data.extend([
+            ("Azure", Decimal("100"), "posted"),
+            ("Deco", Decimal("40"), "draft"),
+            ("Azure", Decimal("60"), "draft"),
+            (None, None, "posted"),
+        ])
+
+    def assertPng(self, image):
+        self.assertTrue(base64.b64decode(image).startswith(b"\x89PNG"))
+
+    def test_spec_response(self):
+        result = query_to_chart_spec(StubClient(json.dumps(make_spec())), "Revenue per customer", "SELECT ...", self.data.columns)
+        self.assertEqual(result["spec"]["type"], "bar")
+        self.assertEqual(result["cost"], 0.001)
+
+    def test_unsupported_or_invalid_spec_signals_fallback(self):
+        for content in [json.dumps(make_spec(type="none")), json.dumps(make_spec(type="heatmap")), "plt.bar(...)"]:
+            with self.subTest(content=content):
+                result = query_to_chart_spec(StubClient(content), "Revenue", "SELECT ...", self.data.columns)
+                self.assertIsNone(result["spec"])
+
+    def test_check_spec(self):
+        self.assertIsNone(check_spec(make_spec(), self.data.columns))
+        self.assertIsNone(check_spec(make_spec(y=[], aggregation="count"), self.data.columns))
+        self.assertTrue(check_spec(make_spec(x="partner"), self.data.columns))
+        self.assertTrue(check_spec(make_spec(y=[]), self.data.columns))
+        self.assertTrue(check_spec(make_spec(type="pie", series="state"), self.data.columns))
+
+    def test_render_chart_types(self):
+        specs = [
+            make_spec(),
+            make_spec(type="pie", sort="none"),
+            make_spec(series="state"),
+            make_spec(type="line", aggregation="avg", sort="x_asc"),
+            make_spec(type="scatter", x="amount", aggregation="none", sort="none"),
+            make_spec(y=[], aggregation="count"),
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                self.assertPng(render_chart(spec, self.data))
+
+    def test_render_chart_rejects_unknown_columns(self):
+        with self.assertRaises(ValueError):
+            render_chart(make_spec(y=["total"]), self.data)
@@ -0,0 +1,44 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+
+@tagged('unit', 'chat')
+class TestChat(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.chat = self.env['chartly.chat'].create({'title': 'Costs'})
+        self.Message = self.env['chartly.chat.message']
+
+    def add_message(self, chat, cost):
+        return self.Message.create({'chat_id': chat.id, 'sender': 'ai', 'content': 'Answer', 'cost': cost})
+
+    def test_stats_follow_messages(self):
+        self.assertEqual((self.chat.message_count, self.chat.total_cost), (0, 0))
+        first = self.add_message(self.chat, 0.01)
+        self.add_message(self.chat, 0.02)
+        self.assertEqual(self.chat.message_count, 2)
+        self.assertAlmostEqual(self.chat.total_cost, 0.03)
+
+        first.cost = 0.05
+        self.assertAlmostEqual(self.chat.total_cost, 0.07)
+
+        first.unlink()
+        self.assertEqual(self.chat.message_count, 1)
+        self.assertAlmostEqual(self.chat.total_cost, 0.02)
+
+    def test_stats_are_stored(self):
+        other = self.env['chartly.chat'].create({'title': 'Other'})
+        self.add_message(self.chat, 0.01)
+        self.add_message(other, 0.5)
+        self.env.flush_all()
+        self.env.cr.execute(
+            "SELECT id, message_count, total_cost FROM chartly_chat WHERE id IN %s ORDER BY id",
+            [(self.chat.id, other.id)]
+        )
+        self.assertEqual(self.env.cr.fetchall(), [(self.chat.id, 1, 0.01), (other.id, 1, 0.5)])
+
+    def test_message_indexes(self):
+        self.env.cr.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'chartly_chat_message'")
+        indexes = {row[0] for row in self.env.cr.fetchall()}
+        self.assertIn('chartly_chat_message_chat_id_created_at_idx', indexes)
+        self.assertIn('chartly_chat_message_chat_id_id_idx', indexes)
@@ -0,0 +1,99 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.openai import OpenAIClient
+from odoo.addons.chartly.core.chat_history import (
+    estimate_tokens, truncate_to_tokens, build_history, TRUNCATION_MARKER, TRUNCATED_MESSAGE_TOKENS,
+)
+
+TABLE = "**Found 40 record(s):**\n" + "\n".join(
+    f"**{i}.**\n  • Name: Customer {i}\n  • Amount Total: {i * 100.5}" for i in range(40)
+)
+
+
+class StubClient(OpenAIClient):
+
+    def __init__(self):
+        super().__init__("test-key", "gpt-4.1")
+        self.requests = []
+
+    def chat_completion(self, messages, **kwargs):
+        self.requests.append(messages)
+        return {"success": True, "content": f"Summary {len(self.requests)}", "cost": 0.002}
+
+
+@tagged('unit', 'chat_history')
+class TestChatHistory(TransactionCase):
+
+    def test_estimate_and_truncate(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertGreater(estimate_tokens(TABLE), 500)
+        short = truncate_to_tokens(TABLE, 40)
+        self.assertTrue(short.endswith(TRUNCATION_MARKER))
+        self.assertLessEqual(estimate_tokens(short), 40)
+        self.assertEqual(truncate_to_tokens("Total revenue", 40), "Total revenue")
+
+    def test_build_history_within_budget(self):
+        rows = []
+        for i in range(12):
+            rows.append({"sender": "user", "content": f"Question {i}"})
+            rows.append({"sender": "ai", "content": TABLE})
+
+        messages, dropped = build_history(rows, 3000)
+        self.assertTrue(dropped)
+        self.assertEqual(len(messages) + len(dropped), len(rows))
+        self.assertLessEqual(sum(estimate_tokens(m["content"]) + 4 for m in messages), 3000)
+        # Newest turn verbatim, older answers cut down
+        self.assertEqual(messages[-1], {"role": "assistant", "content": TABLE})
+        self.assertEqual(messages[-2], {"role": "user", "content": "Question 11"})
+        self.assertLessEqual(estimate_tokens(messages[0]["content"]), TRUNCATED_MESSAGE_TOKENS)
+
+        messages, dropped = build_history(rows[:4], 100000)
+        self.assertEqual(dropped, [])
+        self.assertEqual([m["content"] for m in messages], [r["content"] for r in rows[:4]])
+
+    def test_summary_is_persisted_and_incremental(self):
+        self.env['ir.config_parameter'].sudo().set_param('chartly.history_token_budget', 1500)
+        chat = self.env['chartly.chat'].create({'title': 'History'})
+        Message = self.env['chartly.chat.message']
+        for i in range(6):
+            Message.create({'chat_id': chat.id, 'sender': 'user', 'content': f'Question {i}'})
+            Message.create({'chat_id': chat.id, 'sender': 'ai', 'content': TABLE})
+
+        client = StubClient()
+        messages, cost = chat.prepare_history(client)
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(cost, 0.002)
+        self.assertEqual(chat.history_summary, "Summary 1")
+        self.assertEqual(messages[0]["role"], "system")
+        self.assertIn("Summary 1", messages[0]["content"])
+        summarized_up_to = chat.summary_message_id
+
+        # Nothing new dropped out: the summary is reused without any request
+        messages, cost = chat.prepare_history(client)
+        self.assertEqual((len(client.requests), cost), (1, 0))
+
+        for i in range(6, 9):
+            Message.create({'chat_id': chat.id, 'sender': 'user', 'content': f'Question {i}'})
+            Message.create({'chat_id': chat.id, 'sender': 'ai', 'content': TABLE})
+        chat.prepare_history(client)
+        self.assertEqual(len(client.requests), 2)
+        self.assertIn("Summary 1", client.requests[1][-1]["content"])
+        self.assertGreater(chat.summary_message_id.id, summarized_up_to.id)
+
+    def test_current_message_is_excluded(self):
+        chat = self.env['chartly.chat'].create({'title': 'Exclude'})
+        question = self.env['chartly.chat.message'].create({'chat_id': chat.id, 'sender': 'user', 'content': 'Hi'})
+        messages, cost = chat.prepare_history(StubClient(), exclude_ids=question.ids)
+        self.assertEqual((messages, cost), ([], 0))
+
+    def test_later_messages_are_not_history(self):
+        chat = self.env['chartly.chat'].create({'title': 'Queued'})
+        Message = self.env['chartly.chat.message']
+        Message.create({'chat_id': chat.id, 'sender': 'user', 'content': 'Earlier'})
+        question = Message.create({'chat_id': chat.id, 'sender': 'user', 'content': 'Queued question'})
+        Message.create({'chat_id': chat.id, 'sender': 'user', 'content': 'Posted later'})
+        messages = chat.prepare_messages(StubClient(), question)
+        contents = [m['content'] for m in messages]
+        self.assertIn('Earlier', contents)
+        self.assertNotIn('Posted later', contents)
+        self.assertEqual(messages[-1], {'role': 'user', 'content': 'Queued question'})
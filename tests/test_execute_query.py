@@ -1,6 +1,7 @@
 from odoo.tests.common import TransactionCase
 from odoo.tests import tagged
 from odoo.addons.chartly.core.execute_query import execute_query
+from odoo.addons.chartly.core.result_set import ResultSet
 
 @tagged('unit', 'execute_query')
 class TestExecuteQuery(TransactionCase):
@@ -29,7 +30,7 @@ class TestExecuteQuery(TransactionCase):
         result = execute_query(self.env, sql)
         self.assertFalse(result.get("not_safe", False))
         self.assertFalse(result.get("not_formatted", False))
-        self.assertTrue(isinstance(result.get("data"), list))
+        self.assertTrue(isinstance(result.get("data"), ResultSet))
         self.assertTrue(len(result["data"]) >= 3)
         self.assertIn("name", result["data"][0])
         self.assertIn("email", result["data"][0])
@@ -69,7 +70,7 @@ class TestExecuteQuery(TransactionCase):
         result = execute_query(self.env, sql)
         self.assertFalse(result.get("not_safe", False))
         self.assertFalse(result.get("not_formatted", False))
-        self.assertIsInstance(result.get("data"), list)
+        self.assertIsInstance(result.get("data"), ResultSet)
 
     # -----------------------------
     # ✔ Test safe query with upper/mixed case
@@ -82,28 +83,61 @@ class TestExecuteQuery(TransactionCase):
         self.assertTrue(len(result.get("data")) > 0)
 
     # -----------------------------
-    # ✔ Test code injection patterns (eval, env, exec)
+    # ✔ Test server functions outside the allow-list
     # -----------------------------
-    def test_forbidden_code_injection(self):
-        sql = "SELECT name FROM res_partner WHERE email LIKE '%exec(%';"
+    def test_forbidden_function(self):
+        sql = "SELECT pg_read_file('/etc/passwd') AS content FROM res_partner;"
         result = execute_query(self.env, sql)
         self.assertTrue(result.get("not_safe", True))
         self.assertEqual(result.get("data"), [])
 
+    # -----------------------------
+    # ✔ Test keywords inside string literals are not rejected
+    # -----------------------------
+    def test_keyword_in_string_literal(self):
+        sql = "SELECT name FROM res_partner WHERE name LIKE '%replace or exec(%';"
+        result = execute_query(self.env, sql)
+        self.assertFalse(result.get("not_safe", False))
+        self.assertFalse(result.get("not_formatted", False))
+        self.assertIsInstance(result.get("data"), ResultSet)
+
     # -----------------------------
     # ✔ Test SELECT with JOIN
     # -----------------------------
     def test_select_with_join(self):
         sql = """
-        SELECT p.name, u.login
+        SELECT p.name, m.name AS move_name
         FROM res_partner p
-        JOIN res_users u ON u.partner_id = p.id
+        JOIN account_move m ON m.partner_id = p.id
         LIMIT 5;
         """
         result = execute_query(self.env, sql)
         self.assertFalse(result.get("not_safe", False))
         self.assertFalse(result.get("not_formatted", False))
-        self.assertIsInstance(result.get("data"), list)
+        self.assertIsInstance(result.get("data"), ResultSet)
+
+    # -----------------------------
+    # ✔ Test tables outside the allowed models
+    # -----------------------------
+    def test_forbidden_table(self):
+        sql = """
+        SELECT p.name, u.login
+        FROM res_partner p
+        JOIN res_users u ON u.partner_id = p.id
+        LIMIT 5;
+        """
+        result = execute_query(self.env, sql)
+        self.assertTrue(result.get("not_safe", True))
+        self.assertEqual(result.get("data"), [])
+
+    # -----------------------------
+    # ✔ Test writes hidden in a CTE
+    # -----------------------------
+    def test_forbidden_write_in_cte(self):
+        sql = "WITH d AS (DELETE FROM res_partner RETURNING id) SELECT id FROM d;"
+        result = execute_query(self.env, sql)
+        self.assertTrue(result.get("not_safe", True))
+        self.assertEqual(result.get("data"), [])
 
     # -----------------------------
     # ✔ Test SELECT with ORDER BY
@@ -113,7 +147,7 @@ class TestExecuteQuery(TransactionCase):
         result = execute_query(self.env, sql)
         self.assertFalse(result.get("not_safe", False))
         self.assertFalse(result.get("not_formatted", False))
-        self.assertIsInstance(result.get("data"), list)
+        self.assertIsInstance(result.get("data"), ResultSet)
 
     # -----------------------------
     # ✔ Test SELECT with subquery
@@ -126,7 +160,7 @@ class TestExecuteQuery(TransactionCase):
         result = execute_query(self.env, sql)
         self.assertFalse(result.get("not_safe", False))
         self.assertFalse(result.get("not_formatted", False))
-        self.assertIsInstance(result.get("data"), list)
+        self.assertIsInstance(result.get("data"), ResultSet)
 
     # -----------------------------
     # ✔ Test injection attempt using comment '--'
@@ -136,3 +170,33 @@ class TestExecuteQuery(TransactionCase):
         result = execute_query(self.env, sql)
         self.assertTrue(result.get("not_safe", True))
         self.assertEqual(result.get("data"), [])
+
+    # -----------------------------
+    # ✔ Test bounded mode caps rows
+    # -----------------------------
+    def test_bounded_query_limit(self):
+        sql = "SELECT name FROM res_partner WHERE name LIKE 'Test Partner%' ORDER BY name;"
+        result = execute_query(self.env, sql, limit=2, batch_size=1)
+        self.assertNotIn("error", result)
+        self.assertEqual([r["name"] for r in result["data"]], ["Test Partner 1", "Test Partner 2"])
+
+    # -----------------------------
+    # ✔ Test bounded mode statement timeout
+    # -----------------------------
+    def test_bounded_query_timeout(self):
+        sql = "SELECT count(*) AS total FROM res_partner CROSS JOIN generate_series(1, 100000000) AS s"
+        result = execute_query(self.env, sql, timeout=50)
+        self.assertIn("error", result)
+        self.assertEqual(result.get("data"), [])
+        # The transaction is still usable and the timeout was not kept
+        self.env.cr.execute("SHOW statement_timeout")
+        self.assertNotEqual(self.env.cr.fetchone()[0], "50ms")
+
+    # -----------------------------
+    # ✔ Test bounded mode caps set operations
+    # -----------------------------
+    def test_bounded_union_limit(self):
+        sql = "SELECT name FROM res_partner WHERE name LIKE 'Test Partner%' UNION ALL SELECT email FROM res_partner WHERE name LIKE 'Test Partner%'"
+        result = execute_query(self.env, sql, limit=2, timeout=1000)
+        self.assertNotIn("error", result)
+        self.assertEqual(len(result["data"]), 2)
@@ -0,0 +1,48 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.utils import get_model_fields
+from odoo.addons.chartly.core.field_pruning import format_fields, prune_fields, record_savings, get_pruning_stats
+
+@tagged('unit', 'field_pruning')
+class TestFieldPruning(TransactionCase):
+
+    def fields(self, *models):
+        return {m: get_model_fields(m) for m in models}
+
+    def test_keeps_keys_and_related_fields(self):
+        fields = self.fields("account.move.line", "account.move", "product.product")
+        pruned = prune_fields("Revenue per product last quarter", fields)
+        lines = pruned["account.move.line"]
+        for column in ("id", "move_id", "product_id", "date", "price_subtotal", "quantity", "display_type", "parent_state"):
+            self.assertIn(column, lines)
+        self.assertNotIn("write_uid", lines)
+        self.assertNotIn("blocked", lines)
+        # Columns stay in schema order
+        self.assertEqual(lines, [c for c in fields["account.move.line"] if c in lines])
+
+    def test_question_words_naming_the_table(self):
+        pruned = prune_fields("Show all unpaid customer invoices", self.fields("account.move"))["account.move"]
+        for column in ("payment_state", "amount_residual", "partner_id", "invoice_date", "amount_total", "move_type"):
+            self.assertIn(column, pruned)
+        # "invoices" names account.move, not its invoice_* columns
+        self.assertNotIn("invoice_incoterm_id", pruned)
+        self.assertNotIn("invoice_cash_rounding_id", pruned)
+
+    def test_small_tables_are_sent_whole(self):
+        fields = self.fields("account.analytic.plan")
+        self.assertEqual(prune_fields("List analytic plans", fields), fields)
+
+    def test_tables_keep_a_minimum_of_fields(self):
+        pruned = prune_fields("zzz", self.fields("account.journal"))["account.journal"]
+        self.assertEqual(len(pruned), 12)
+        self.assertIn("name", pruned)
+        self.assertNotIn("create_uid", pruned)
+
+    def test_token_savings(self):
+        fields = self.fields("account.move", "res.partner")
+        before = get_pruning_stats()
+        savings = record_savings(format_fields(fields), format_fields(prune_fields("Total revenue per customer per month", fields)))
+        self.assertLess(savings["sent_tokens"], savings["schema_tokens"] / 2)
+        after = get_pruning_stats()
+        self.assertEqual(after["requests"], before["requests"] + 1)
+        self.assertEqual(after["saved_tokens"] - before["saved_tokens"], savings["schema_tokens"] - savings["sent_tokens"])
@@ -0,0 +1,46 @@
+from odoo.tests.common import HttpCase
+from odoo.tests import tagged
+
+@tagged('post_install', '-at_install', 'get_messages')
+class TestGetMessages(HttpCase):
+
+    def setUp(self):
+        super().setUp()
+        self.chat = self.env['chartly.chat'].create({'title': 'Pagination'})
+        self.messages = self.env['chartly.chat.message'].create([{
+            'chat_id': self.chat.id,
+            'content': f'Message {i}',
+            'sender': 'user' if i % 2 else 'ai',
+            'cost': 0.001,
+        } for i in range(7)])
+        self.authenticate('admin', 'admin')
+
+    def get_messages(self, **params):
+        return self.make_jsonrpc_request('/chartly/get_messages', dict(params, chat_id=self.chat.id))
+
+    def contents(self, result):
+        return [m['content'] for m in result['messages']]
+
+    def test_newest_page_first(self):
+        result = self.get_messages(limit=3)
+        self.assertTrue(result['success'])
+        self.assertEqual(self.contents(result), ['Message 4', 'Message 5', 'Message 6'])
+        self.assertTrue(result['has_more'])
+        self.assertEqual(set(result['messages'][0]), {'id', 'content', 'sender', 'created_at', 'cost', 'state'})
+
+    def test_older_pages(self):
+        first_page = self.get_messages(limit=3)
+        result = self.get_messages(before_id=first_page['messages'][0]['id'], limit=3)
+        self.assertEqual(self.contents(result), ['Message 1', 'Message 2', 'Message 3'])
+        self.assertTrue(result['has_more'])
+        result = self.get_messages(before_id=result['messages'][0]['id'], limit=3)
+        self.assertEqual(self.contents(result), ['Message 0'])
+        self.assertFalse(result['has_more'])
+
+    def test_new_messages_since_last_seen(self):
+        last_seen = self.messages[-1].id
+        self.assertEqual(self.get_messages(after_id=last_seen)['messages'], [])
+        self.env['chartly.chat.message'].create({'chat_id': self.chat.id, 'content': 'Message 7', 'sender': 'ai'})
+        result = self.get_messages(after_id=last_seen)
+        self.assertEqual(self.contents(result), ['Message 7'])
+        self.assertFalse(result['has_more'])
@@ -0,0 +1,108 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.http_pool import ConnectionPool
+from odoo.addons.chartly.core.openai import OpenAIClient
+from odoo.addons.chartly.core import openai
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import json
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_data = json.loads(self.rfile.read(length) or b"{}")
+        if request_data.get("stream"):
+            return self.send_stream()
+        body = json.dumps({
+            "model": "gpt-4.1",
+            "choices": [{"message": {"content": "hello"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 1},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self):
+        chunks = [
+            {"model": "gpt-4.1", "choices": [{"delta": {"content": "hel"}}]},
+            {"model": "gpt-4.1", "choices": [{"delta": {"content": "lo"}, "finish_reason": "stop"}]},
+            {"model": "gpt-4.1", "choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2}},
+        ]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for payload in [json.dumps(chunk) for chunk in chunks] + ["[DONE]"]:
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@tagged('unit', 'http_pool')
+class TestConnectionPool(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.pool = ConnectionPool(max_size=2)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.pool.clear)
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            status, body = self.pool.request("POST", f"{self.base_url}/chat/completions", body=b"{}")
+            self.assertEqual(status, 200)
+            self.assertIn(b"hello", body)
+        stats = self.pool.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["idle"], 1)
+
+    def test_idle_connections_are_evicted(self):
+        self.pool.request("POST", f"{self.base_url}/chat/completions", body=b"{}")
+        self.pool.configure(idle_timeout=0)
+        self.assertEqual(self.pool.stats()["idle"], 0)
+        self.pool.request("POST", f"{self.base_url}/chat/completions", body=b"{}")
+        self.assertEqual(self.pool.stats()["misses"], 2)
+
+    def test_client_uses_shared_pool(self):
+        original_pool = openai.get_connection_pool
+        openai.get_connection_pool = lambda: self.pool
+        self.addCleanup(setattr, openai, "get_connection_pool", original_pool)
+
+        client = OpenAIClient("test-key", "gpt-4.1", base_url=self.base_url)
+        other_client = OpenAIClient("test-key", "gpt-4.1", base_url=self.base_url)
+        result = client.chat_completion([{"role": "user", "content": "Hi"}])
+        other_client.chat_completion([{"role": "user", "content": "Hi"}])
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["content"], "hello")
+        self.assertEqual(self.pool.stats()["hits"], 1)
+
+    def test_client_streams_completion(self):
+        original_pool = openai.get_connection_pool
+        openai.get_connection_pool = lambda: self.pool
+        self.addCleanup(setattr, openai, "get_connection_pool", original_pool)
+
+        client = OpenAIClient("test-key", "gpt-4.1", base_url=self.base_url)
+        events = list(client.chat_completion_stream([{"role": "user", "content": "Hi"}]))
+
+        tokens = [event["content"] for event in events if event["type"] == "token"]
+        self.assertEqual(tokens, ["hel", "lo"])
+        response = events[-1]["response"]
+        self.assertTrue(response["success"])
+        self.assertEqual(response["content"], "hello")
+        self.assertEqual(response["usage"]["completion_tokens"], 2)
+        self.assertEqual(self.pool.stats()["idle"], 1)
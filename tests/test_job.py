@@ -0,0 +1,114 @@
+from unittest.mock import patch
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.openai import OpenAIClient
+from odoo.addons.chartly.models.job import JOB_MAX_ATTEMPTS, JOB_LOCK_KEY
+
+
+class StubClient(OpenAIClient):
+
+    def __init__(self, result):
+        super().__init__("test-key", "gpt-4.1")
+        self.result = result
+        self.requests = []
+
+    def chat_completion_with_tools(self, messages, tools_descriptions, tools_map, **kwargs):
+        self.requests.append(messages)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+@tagged('unit', 'job')
+class TestJob(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.chat = self.env['chartly.chat'].create({'title': 'Jobs'})
+        self.Job = self.env['chartly.job']
+
+    def enqueue(self, content='Total revenue per month'):
+        user_message = self.env['chartly.chat.message'].create({
+            'chat_id': self.chat.id, 'content': content, 'sender': 'user',
+        })
+        return self.Job.enqueue(self.chat, user_message)
+
+    def run_jobs(self, result):
+        client = StubClient(result)
+        with patch('odoo.addons.chartly.models.job.get_openai_client', return_value=client):
+            while self.Job._cron_run_jobs():
+                pass
+        return client
+
+    def test_enqueue_creates_placeholder(self):
+        job = self.enqueue()
+        self.assertEqual(job.state, 'pending')
+        self.assertEqual(job.user_id, self.env.user)
+        self.assertEqual((job.message_id.sender, job.message_id.state), ('ai', 'pending'))
+        self.assertEqual(self.chat.message_count, 2)
+
+    def test_run_fills_placeholder(self):
+        job = self.enqueue()
+        client = self.run_jobs({'success': True, 'content': 'Revenue grew', 'cost': 0.01})
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.worker_pid)
+        # The job lock is released once the job is finished
+        self.env.cr.execute(
+            "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND classid = %s::oid AND objid = %s::oid",
+            (JOB_LOCK_KEY, job.id)
+        )
+        self.assertEqual(self.env.cr.fetchone()[0], 0)
+        self.assertTrue(job.finished_at)
+        self.assertEqual((job.message_id.content, job.message_id.state), ('Revenue grew', 'done'))
+        self.assertAlmostEqual(self.chat.total_cost, 0.01)
+        # The pending placeholder is not part of the history sent to the model
+        sent = client.requests[0]
+        self.assertEqual(sent[-1], {'role': 'user', 'content': 'Total revenue per month'})
+        self.assertNotIn('Working on it...', [m['content'] for m in sent])
+
+    def test_failures_are_stored(self):
+        job = self.enqueue()
+        self.run_jobs(RuntimeError('OpenAI is down'))
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(job.error, 'OpenAI is down')
+        self.assertEqual(job.message_id.state, 'failed')
+        self.assertEqual(job.message_id.content, 'Error: OpenAI is down')
+
+    def test_jobs_run_in_order(self):
+        first, second = self.enqueue('First'), self.enqueue('Second')
+        client = self.run_jobs({'success': True, 'content': 'Answer', 'cost': 0})
+        self.assertEqual((first.state, second.state), ('done', 'done'))
+        self.assertEqual([r[-1]['content'] for r in client.requests], ['First', 'Second'])
+
+    def test_one_job_per_run(self):
+        first, second = self.enqueue('First'), self.enqueue('Second')
+        cron = self.env.ref('chartly.ir_cron_chartly_jobs')
+        triggers = self.env['ir.cron.trigger'].search([('cron_id', '=', cron.id)])
+        with patch('odoo.addons.chartly.models.job.get_openai_client', return_value=StubClient({'success': True, 'content': 'Answer', 'cost': 0})):
+            self.assertTrue(self.Job._cron_run_jobs())
+        self.assertEqual((first.state, second.state), ('done', 'pending'))
+        # The cron runs again for the job left
+        self.assertGreater(self.env['ir.cron.trigger'].search_count([('cron_id', '=', cron.id)]), len(triggers))
+
+    def test_stale_jobs(self):
+        retried, abandoned = self.enqueue('Retried'), self.enqueue('Abandoned')
+        # Running, but no worker holds their lock
+        retried.write({'state': 'running', 'attempts': 1})
+        abandoned.write({'state': 'running', 'attempts': JOB_MAX_ATTEMPTS})
+
+        self.run_jobs({'success': True, 'content': 'Answer', 'cost': 0})
+        self.assertEqual((retried.state, retried.attempts), ('done', 2))
+        self.assertEqual(abandoned.state, 'failed')
+        self.assertEqual(abandoned.message_id.state, 'failed')
+
+    def test_jobs_of_live_workers_are_kept(self):
+        job = self.enqueue()
+        job.write({'state': 'running', 'attempts': JOB_MAX_ATTEMPTS})
+        self.env.cr.execute("SELECT pg_advisory_lock(%s, %s)", (JOB_LOCK_KEY, job.id))
+        try:
+            self.run_jobs({'success': True, 'content': 'Answer', 'cost': 0})
+        finally:
+            self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", (JOB_LOCK_KEY, job.id))
+        self.assertEqual(job.state, 'running')
+        self.assertEqual(job.message_id.state, 'pending')
@@ -0,0 +1,48 @@
+import base64
+from odoo.tests.common import HttpCase
+from odoo.tests import tagged
+
+# 1x1 transparent PNG
+PNG = base64.b64encode(base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+))
+
+@tagged('post_install', '-at_install', 'message_image')
+class TestMessageImage(HttpCase):
+
+    def setUp(self):
+        super().setUp()
+        self.chat = self.env['chartly.chat'].create({'title': 'Images'})
+        self.message = self.env['chartly.chat.message'].create({
+            'chat_id': self.chat.id,
+            'content': 'Plot generated successfully',
+            'sender': 'ai',
+            'has_image': True,
+            'image': PNG,
+        })
+        self.authenticate('admin', 'admin')
+
+    def test_image_is_an_attachment(self):
+        attachment = self.message._get_image_attachment()
+        self.assertTrue(attachment)
+        self.assertEqual(attachment.raw, base64.b64decode(PNG))
+
+    def test_image_served_with_etag(self):
+        response = self.url_open(f'/chartly/image/{self.message.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, base64.b64decode(PNG))
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+
+        response = self.url_open(f'/chartly/image/{self.message.id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+
+    def test_missing_image(self):
+        message = self.env['chartly.chat.message'].create({
+            'chat_id': self.chat.id,
+            'content': 'No records',
+            'sender': 'ai',
+        })
+        self.assertEqual(self.url_open(f'/chartly/image/{message.id}').status_code, 404)
+        self.assertEqual(self.url_open('/chartly/image/0').status_code, 404)
@@ -0,0 +1,68 @@
+import csv
+import os
+import time
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.model_index import get_model_index, parse_model_mappings, tokenize
+from odoo.addons.chartly.core.nl_to_model import get_nl_to_model_prompt, get_shortlist_prompt
+
+@tagged('unit', 'model_index')
+class TestModelIndex(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.index = get_model_index()
+        csv_path = os.path.join(os.path.dirname(__file__), "nl_model_test_pairs.csv")
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            self.test_cases = [(row["Query"], row["Model"].split(",")) for row in csv.DictReader(f, delimiter=';')]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Show all unpaid customer invoices"), ["unpaid", "customer", "invoice"])
+        self.assertEqual(tokenize("analytic entries"), ["analytic", "entry"])
+
+    def test_prompt_mappings(self):
+        mappings = parse_model_mappings(get_nl_to_model_prompt())
+        self.assertIn("vendor bill", mappings["account.move"])
+        self.assertIn("taxes collected per", mappings["account.tax.repartition.line"])
+        self.assertIn("product by itself", mappings["product.template"])
+
+    def test_shortlist_keeps_expected_models(self):
+        for query, expected in self.test_cases:
+            shortlist = self.index.shortlist(query)
+            self.assertLessEqual(len(shortlist.models), 8)
+            for model in expected:
+                self.assertIn(model.strip(), shortlist.models, query)
+
+    def test_confident_only_for_a_single_named_model(self):
+        shortlist = self.index.shortlist("Show all unpaid customer invoices")
+        self.assertTrue(shortlist.confident)
+        self.assertEqual(shortlist.models[0], "account.move")
+        self.assertEqual(self.index.shortlist("journal items this month").models[0], "account.move.line")
+        for query in ("Top 10 customers by total payments last month", "revenue per product", "sales per month"):
+            self.assertFalse(self.index.shortlist(query).confident, query)
+
+    def test_join_question_is_not_confident(self):
+        # "vendors by bill" isn't the "vendor bill" phrase, and "vendor" names the partners
+        shortlist = self.index.shortlist("top vendors by bill amount")
+        self.assertFalse(shortlist.confident)
+        self.assertIn("res.partner", shortlist.models)
+        self.assertIn("account.move", shortlist.models)
+        self.assertEqual(self.index.shortlist("Show all posted vendor bills").models[0], "account.move")
+
+    def test_shortlist_prompt(self):
+        candidates = self.index.shortlist("Top 10 customers by total payments last month").models
+        prompt = get_shortlist_prompt(candidates)
+        self.assertLess(len(prompt), len(get_nl_to_model_prompt()) * 0.7)
+        self.assertIn("customer payment", prompt)
+        self.assertNotIn("reconciliation model line", prompt)
+        self.assertIn("## EXAMPLES", prompt)
+
+    def test_lookup_latency(self):
+        queries = [query for query, _ in self.test_cases]
+        started = time.perf_counter()
+        for _ in range(20):
+            for query in queries:
+                self.index.shortlist(query)
+        average_ms = (time.perf_counter() - started) * 1000 / (20 * len(queries))
+        self.assertLess(average_ms, 2)
+        self.assertGreater(self.index.stats()["lookups"], 0)
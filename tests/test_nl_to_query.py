@@ -0,0 +1,68 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.openai import OpenAIClient
+from odoo.addons.chartly.core.nl_to_query import nl_to_query, matches_schema, NL_TO_QUERY_SCHEMA
+from odoo.addons.chartly.core.utils import get_model_fields
+import json
+
+
+class StubClient(OpenAIClient):
+
+    def __init__(self, content):
+        super().__init__("test-key", "gpt-4.1")
+        self.content = content
+        self.requests = []
+
+    def chat_completion(self, messages, **kwargs):
+        self.messages = messages
+        self.requests.append(kwargs)
+        return {"success": True, "content": self.content, "cost": 0.001}
+
+
+@tagged('unit', 'nl_to_query')
+class TestNLToQuery(TransactionCase):
+
+    def test_schema_validation(self):
+        valid = {"models": ["account.move"], "sql_query": "SELECT 1", "columns": ["id"]}
+        self.assertTrue(matches_schema(valid, NL_TO_QUERY_SCHEMA))
+        self.assertFalse(matches_schema({"models": ["account.move"], "sql_query": "SELECT 1"}, NL_TO_QUERY_SCHEMA))
+        self.assertFalse(matches_schema(dict(valid, columns="id"), NL_TO_QUERY_SCHEMA))
+        self.assertFalse(matches_schema(dict(valid, extra=True), NL_TO_QUERY_SCHEMA))
+
+    def test_single_request(self):
+        content = json.dumps({
+            "models": ["account.move", "res.partner"],
+            "sql_query": "SELECT rp.name AS customer_name FROM account_move am JOIN res_partner rp ON am.partner_id = rp.id",
+            "columns": ["customer_name"],
+        })
+        client = StubClient(content)
+        result = nl_to_query(client, "Customers with invoices")
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(client.requests[0]["response_format"]["type"], "json_schema")
+        self.assertEqual(result["models"], ["account.move", "res.partner"])
+        self.assertEqual(result["columns"], ["customer_name"])
+        self.assertEqual(result["cost"], 0.001)
+
+    def test_invalid_response_signals_fallback(self):
+        result = nl_to_query(StubClient("SELECT * FROM account_move"), "All invoices")
+        self.assertIsNone(result["sql_query"])
+        self.assertEqual(result["cost"], 0.001)
+
+    def test_shortlisted_models_follow_the_shared_prefix(self):
+        client = StubClient("{}")
+        nl_to_query(client, "Customers with invoices")
+        prefix = client.messages[0]
+        self.assertIn("# account_journal:", prefix["content"])
+        self.assertEqual(client.messages[-1]["content"], "Query: Customers with invoices")
+
+        fields = {m: get_model_fields(m) for m in ("res.partner", "account.move")}
+        nl_to_query(client, "Customers with invoices", fields)
+        self.assertEqual(client.messages[0], prefix)
+        shortlisted = client.messages[-1]["content"]
+        self.assertLess(shortlisted.index("# account.move:"), shortlisted.index("# res.partner:"))
+
+        nl_to_query(client, "Customers with invoices", fields, prune=True)
+        self.assertEqual(client.messages[0], prefix)
+        pruned = client.messages[-1]["content"]
+        self.assertLess(len(pruned), len(shortlisted))
+        self.assertIn("partner_id", pruned)
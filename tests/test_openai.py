@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from odoo.tests.common import TransactionCase
 from odoo.tests import tagged
-from odoo.addons.chartly.core.openai import OpenAIClient
+from odoo.addons.chartly.core.openai import OpenAIClient, create_function_tool
 import os
 
 @tagged('unit', 'billed', 'openai')
@@ -40,3 +40,71 @@ class TestOpenAIClientLive(TransactionCase):
 
         self.assertTrue(result['success'])
         self.assertIn('content', result)
+
+
+class ScriptedClient(OpenAIClient):
+    """Answers chat completions from a list of prepared responses"""
+
+    def __init__(self, responses):
+        super().__init__("test-key", "gpt-4.1")
+        self.responses = list(responses)
+        self.requests = []
+
+    def chat_completion(self, messages, **kwargs):
+        self.requests.append((list(messages), kwargs))
+        return self.responses.pop(0)
+
+
+def tool_call(call_id, name, arguments):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+
+
+@tagged('unit', 'openai_tools')
+class TestToolCalls(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tools_descriptions = [
+            create_function_tool(name, name, {"query": {"type": "string", "description": "Query"}}, ["query"])
+            for name in ("table", "chart")
+        ]
+        self.tools = {
+            "table": {"return_type": "text", "tool_callable": lambda query: {"text": f"rows of {query}", "cost": 0.01}},
+            "chart": {"return_type": "image", "tool_callable": lambda query: {"text": "Plot generated", "image": "png", "cost": 0.02}},
+        }
+
+    def test_all_tool_calls_are_answered_in_order(self):
+        client = ScriptedClient([
+            {"success": True, "content": None, "cost": 0.001, "tool_calls": [
+                tool_call("a", "chart", '{"query": "sales per month"}'),
+                tool_call("b", "table", '{"query": "top customers"}'),
+                tool_call("c", "missing", '{}'),
+            ]},
+            {"success": True, "content": "Here you go", "cost": 0.001},
+        ])
+        batches = []
+
+        def run_tool_calls(calls):
+            batches.append(len(calls))
+            return [call() for call in calls]
+
+        result = client.chat_completion_with_tools([], self.tools_descriptions, self.tools, run_tool_calls=run_tool_calls)
+        self.assertEqual(result["content"], "Here you go")
+        self.assertEqual(result["image"], "png")
+        self.assertAlmostEqual(result["cost"], 0.032)
+        self.assertEqual(batches, [3])
+
+        history = client.requests[1][0]
+        self.assertEqual([c["id"] for c in history[0]["tool_calls"]], ["a", "b", "c"])
+        self.assertEqual(
+            [(m["tool_call_id"], m["content"]) for m in history[1:]],
+            [("a", "Plot generated"), ("b", "rows of top customers"), ("c", "Unknown tool missing")]
+        )
+
+    def test_max_iterations(self):
+        looping = {"success": True, "content": None, "cost": 0, "tool_calls": [tool_call("a", "table", '{"query": "x"}')]}
+        client = ScriptedClient([looping, looping, {"success": True, "content": "Done", "cost": 0}])
+        result = client.chat_completion_with_tools([], self.tools_descriptions, self.tools, max_iterations=2)
+        self.assertEqual(result["content"], "Done")
+        # The last round may not call tools anymore
+        self.assertEqual([kwargs["tool_choice"] for _, kwargs in client.requests], ["auto", "auto", "none"])
@@ -0,0 +1,70 @@
+import base64
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.plot_renderer import RendererPool, RendererTimeout, render_plot
+from odoo.addons.chartly.core.result_set import ResultSet
+
+PLOT_SCRIPT = """
+import matplotlib.pyplot as plt
+import base64
+from io import BytesIO
+
+def build_plot(data):
+    fig, ax = plt.subplots()
+    ax.bar(data.column("name"), data.column("total"))
+    plt.tight_layout()
+    buffer = BytesIO()
+    plt.savefig(buffer, format="png")
+    plt.close(fig)
+    return base64.b64encode(buffer.getvalue()).decode()
+"""
+
+@tagged('unit', 'plot_renderer')
+class TestPlotRenderer(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = ResultSet(["name", "total"])
+        self.data.extend([("Azure", 120.5), ("Deco", 80)])
+        self.pool = RendererPool(size=1, cpu_limit=5, timeout=10)
+        self.addCleanup(self.pool.clear)
+
+    def assertPng(self, image):
+        self.assertTrue(base64.b64decode(image).startswith(b"\x89PNG"))
+
+    def test_render_reuses_worker(self):
+        self.pool.warm()
+        self.assertPng(self.pool.render(PLOT_SCRIPT, self.data))
+        self.assertPng(self.pool.render(PLOT_SCRIPT, self.data))
+        self.assertEqual(self.pool.stats(), {"renders": 2, "restarts": 0, "idle": 1, "size": 1})
+
+    def test_script_error_keeps_worker(self):
+        script = "def build_plot(data):\n    return data.column('missing')\n"
+        with self.assertRaisesRegex(RuntimeError, "KeyError"):
+            self.pool.render(script, self.data)
+        self.assertEqual(self.pool.stats()["restarts"], 0)
+        self.assertPng(self.pool.render(PLOT_SCRIPT, self.data))
+
+    def test_wall_clock_limit(self):
+        self.pool.configure(timeout=0.5)
+        script = "import time\ndef build_plot(data):\n    time.sleep(5)\n"
+        with self.assertRaises(RendererTimeout):
+            self.pool.render(script, self.data)
+        self.assertEqual(self.pool.stats()["restarts"], 1)
+        self.pool.configure(timeout=10)
+        self.assertPng(self.pool.render(PLOT_SCRIPT, self.data))
+
+    def test_cpu_limit(self):
+        self.pool.configure(cpu_limit=1, timeout=20)
+        script = "def build_plot(data):\n    while True:\n        pass\n"
+        with self.assertRaisesRegex(RuntimeError, "exited"):
+            self.pool.render(script, self.data)
+        self.assertEqual(self.pool.stats()["restarts"], 1)
+
+    def test_render_plot_checks_script(self):
+        with self.assertRaisesRegex(ValueError, "Unsafe code detected"):
+            render_plot(self.env, "import os\ndef build_plot(data):\n    return os.getcwd()\n", self.data)
+
+    def test_render_plot_in_process(self):
+        self.env['ir.config_parameter'].sudo().set_param('chartly.plot_pool_size', 0)
+        self.assertPng(render_plot(self.env, PLOT_SCRIPT, self.data))
@@ -0,0 +1,72 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.openai import OpenAIClient
+from odoo.addons.chartly.core.utils import get_model_fields
+from odoo.addons.chartly.core.nl_to_sql import nl_to_sql
+from odoo.addons.chartly.core.filter_model_attributes import filter_attributes
+from odoo.addons.chartly.core.prompt_prefix import assemble_messages, get_prompt_cache_stats
+
+
+class RecordingClient(OpenAIClient):
+
+    def __init__(self, content="SELECT 1"):
+        super().__init__("test-key", "gpt-4.1")
+        self.content = content
+        self.requests = []
+
+    def chat_completion(self, messages, **kwargs):
+        self.requests.append((messages, kwargs))
+        return {"success": True, "content": self.content, "cost": 0.001}
+
+
+@tagged('unit', 'prompt_prefix')
+class TestPromptPrefix(TransactionCase):
+
+    def test_static_parts_come_first(self):
+        history = [{"role": "assistant", "content": "Hello"}]
+        messages = assemble_messages("Instructions\n", static=["# account_move: id, name", ""], history=history, variable="Query: x")
+        self.assertEqual(messages[0], {"role": "system", "content": "Instructions\n\n# account_move: id, name"})
+        self.assertEqual(messages[1:], history + [{"role": "user", "content": "Query: x"}])
+
+    def test_nl_to_sql_prefix_is_stable(self):
+        client = RecordingClient()
+        schema = "# account.journal: ['id', 'name']\n# account.move: ['id', 'partner_id']\n"
+        fields = {m: get_model_fields(m) for m in ("account.move", "res.partner")}
+        nl_to_sql(client, "Total invoiced per customer", ["res.partner", "account.move"], fields, schema=schema)
+        journals = {"account.journal": get_model_fields("account.journal")}
+        nl_to_sql(client, "Bank journals", ["account.journal"], journals, schema=schema)
+        (first, kwargs), (second, _) = client.requests
+        # The pruned fields of each question come after the shared prefix
+        self.assertEqual(first[:-1], second[:-1])
+        self.assertIn(schema.strip(), first[0]["content"])
+        self.assertNotIn("# res.partner:", first[0]["content"])
+        self.assertIn("# res.partner:", first[-1]["content"])
+        self.assertTrue(first[-1]["content"].endswith("Query: Total invoiced per customer"))
+        self.assertEqual(kwargs["stage"], "nl_to_sql")
+
+        openai = OpenAIClient("test-key", "gpt-4.1")
+        keys = {openai._build_request_data(m, 100, 0.3, None, None, stage="nl_to_sql")["prompt_cache_key"] for m in (first, second)}
+        self.assertEqual(len(keys), 1)
+
+    def test_filter_attributes_prefix_is_stable(self):
+        client = RecordingClient("name")
+        filter_attributes(client, "List all customers", ["id", "name"])
+        filter_attributes(client, "Top vendors", ["id", "name", "supplier_rank"])
+        (first, _), (second, _) = client.requests
+        self.assertEqual(first[0], second[0])
+        self.assertIn("Top vendors", second[-1]["content"])
+
+    def test_cached_tokens_are_recorded_per_stage(self):
+        client = OpenAIClient("test-key", "gpt-4.1")
+        before = get_prompt_cache_stats().get("test_stage", {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        for cached in (0, 1024):
+            usage = {"prompt_tokens": 2048, "completion_tokens": 10, "prompt_tokens_details": {"cached_tokens": cached}}
+            client._build_response({"content": "ok"}, "stop", usage, "gpt-4.1", stage="test_stage")
+        stats = get_prompt_cache_stats()["test_stage"]
+        self.assertEqual(stats["requests"] - before["requests"], 2)
+        self.assertEqual(stats["prompt_tokens"] - before["prompt_tokens"], 4096)
+        self.assertEqual(stats["cached_tokens"] - before["cached_tokens"], 1024)
+        self.assertGreater(stats["cached_ratio"], 0)
+
+        data = client._build_request_data([{"role": "system", "content": "Instructions"}], 100, 0.3, None, None, stage="nl_to_sql")
+        self.assertTrue(data["prompt_cache_key"].startswith("chartly-nl_to_sql-"))
@@ -0,0 +1,45 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.resources import ResourceRegistry, get_allowed_models, get_model_fields_map
+import os
+import tempfile
+
+
+@tagged('unit', 'resources')
+class TestResourceRegistry(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry = ResourceRegistry()
+        self.loads = 0
+        handle, self.path = tempfile.mkstemp(suffix=".txt")
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.write("first")
+
+    def write(self, content, mtime=None):
+        with open(self.path, "w") as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def loader(self, path):
+        self.loads += 1
+        with open(path, "r") as f:
+            return f.read()
+
+    def test_resource_loaded_once(self):
+        self.assertEqual(self.registry.get(self.path, self.loader), "first")
+        self.assertEqual(self.registry.get(self.path, self.loader), "first")
+        self.assertEqual(self.loads, 1)
+
+    def test_resource_reloaded_on_mtime_change(self):
+        self.registry.get(self.path, self.loader)
+        self.write("second", mtime=os.stat(self.path).st_mtime + 10)
+        self.assertEqual(self.registry.get(self.path, self.loader), "second")
+        self.assertEqual(self.loads, 2)
+
+    def test_indexed_structures(self):
+        self.assertIsInstance(get_allowed_models(), frozenset)
+        self.assertIn("account.move", get_allowed_models())
+        self.assertIsInstance(get_model_fields_map()["account_move"], tuple)
@@ -0,0 +1,30 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.result_set import ResultSet
+
+@tagged('unit', 'result_set')
+class TestResultSet(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.result = ResultSet(["name", "total"])
+        self.result.extend([("Customer A", 800), ("Customer B", 200), ("Customer C", 900)])
+
+    def test_columns(self):
+        self.assertEqual(len(self.result), 3)
+        self.assertEqual(self.result.column("total"), [800, 200, 900])
+
+    def test_rows_behave_like_dicts(self):
+        row = self.result[0]
+        self.assertEqual(row["name"], "Customer A")
+        self.assertEqual(list(row.keys()), ["name", "total"])
+        self.assertEqual(dict(self.result[-1]), {"name": "Customer C", "total": 900})
+        self.assertEqual([r["total"] for r in self.result], [800, 200, 900])
+
+    def test_slice_and_select(self):
+        top = self.result[:2]
+        self.assertIsInstance(top, ResultSet)
+        self.assertEqual(len(top), 2)
+        names = self.result.select(["name", "missing"])
+        self.assertEqual(names.columns, ["name"])
+        self.assertEqual(names.to_dicts()[1], {"name": "Customer B"})
@@ -0,0 +1,78 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.schema_snapshot import (
+    SCHEMA_VERSION_PARAM, get_schema_snapshot, entry_hash, rows_changed,
+)
+from odoo.addons.chartly.core.field_pruning import prune_fields, format_fields, round_rows
+
+@tagged('unit', 'schema_snapshot')
+class TestSchemaSnapshot(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Snapshot = self.env['chartly.schema.model']
+        self.version = self.Snapshot.refresh_snapshot()
+
+    def test_snapshot_has_types_and_foreign_keys(self):
+        snapshot = get_schema_snapshot(self.env)
+        self.assertEqual(snapshot.version, self.version)
+        move = snapshot.models["account.move"]
+        self.assertEqual(move["table"], "account_move")
+        self.assertIn(["amount_total", "numeric"], move["columns"])
+        self.assertEqual(move["edges"]["partner_id"], "res_partner")
+        self.assertIn("partner_id", snapshot.columns("account.move"))
+        # Only the foreign keys between the given models
+        self.assertEqual(snapshot.edges(["account.move.line", "account.move"])["account.move.line"]["move_id"], "account_move")
+        self.assertNotIn("partner_id", snapshot.edges(["account.move.line", "account.move"])["account.move.line"])
+
+    def test_refresh_only_rewrites_changed_models(self):
+        record = self.Snapshot.search([('model', '=', 'account.move')])
+        record.write({'schema_hash': 'outdated'})
+        untouched = self.Snapshot.search([('model', '=', 'account.journal')])
+        updated_at = untouched.updated_at
+        self.assertEqual(self.Snapshot.refresh_snapshot(), self.version)
+        self.assertNotEqual(record.schema_hash, 'outdated')
+        self.assertEqual(untouched.updated_at, updated_at)
+
+    def test_version_follows_structure(self):
+        self.env['ir.config_parameter'].sudo().set_param(SCHEMA_VERSION_PARAM, 'other')
+        self.assertEqual(get_schema_snapshot(self.env).version, 'other')
+        self.assertEqual(self.Snapshot.refresh_snapshot(), self.version)
+
+        entry = {"table": "t", "columns": [["id", "integer"]], "edges": {}, "rows": 10}
+        self.assertEqual(entry_hash(entry), entry_hash(dict(entry, rows=10000)))
+        self.assertNotEqual(entry_hash(entry), entry_hash(dict(entry, columns=[["id", "bigint"]])))
+        self.assertNotEqual(entry_hash(entry), entry_hash(dict(entry, edges={"partner_id": "res_partner"})))
+        self.assertFalse(rows_changed(100, 150))
+        self.assertTrue(rows_changed(100, 1000))
+
+    def test_row_estimates_reach_the_prompt(self):
+        record = self.Snapshot.search([('model', '=', 'account.move')])
+        # Far enough from the estimate of the database to be rewritten
+        record.write({'row_estimate': 10 ** 9})
+        self.Snapshot.refresh_snapshot()
+        self.assertLess(record.row_estimate, 10 ** 9)
+        snapshot = get_schema_snapshot(self.env)
+        rows = snapshot.row_estimates(["account.move"])
+        self.assertEqual(rows["account.move"], record.row_estimate)
+
+        fields = {"account.move": ["id", "amount_total"]}
+        line = format_fields(fields, snapshot.column_types(["account.move"]), {"account.move": 1234})
+        self.assertEqual(line, "# account.move (about 1,000 rows): ['id integer', 'amount_total numeric']\n")
+        self.assertEqual((round_rows(0), round_rows(7), round_rows(56789)), ("0", "7", "60,000"))
+
+    def test_registry_load_refreshes_outdated_snapshot(self):
+        # As after an upgrade of a dependency, which doesn't run init() of this module
+        record = self.Snapshot.search([('model', '=', 'account.move')])
+        record.write({'schema_hash': 'outdated'})
+        self.env['ir.config_parameter'].sudo().set_param(SCHEMA_VERSION_PARAM, 'other')
+        self.Snapshot._register_hook()
+        self.assertNotEqual(record.schema_hash, 'outdated')
+        self.assertEqual(get_schema_snapshot(self.env).version, self.version)
+
+    def test_pruning_uses_foreign_keys(self):
+        snapshot = get_schema_snapshot(self.env)
+        models = ["account.move.line", "account.move"]
+        fields = {m: snapshot.columns(m) for m in models}
+        pruned = prune_fields("zzz", fields, edges=snapshot.edges(models))
+        self.assertIn("move_id", pruned["account.move.line"])
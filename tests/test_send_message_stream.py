@@ -0,0 +1,23 @@
+import json
+from odoo.tests.common import HttpCase
+from odoo.tests import tagged
+
+@tagged('post_install', '-at_install', 'send_message_stream')
+class TestSendMessageStream(HttpCase):
+
+    def setUp(self):
+        super().setUp()
+        self.chat = self.env['chartly.chat'].create({'title': 'Stream'})
+        self.authenticate('admin', 'admin')
+
+    def test_only_json_bodies_are_accepted(self):
+        body = {'chat_id': self.chat.id, 'message_content': 'Hello'}
+        response = self.url_open('/chartly/send_message_stream', data=body)
+        self.assertEqual(response.status_code, 415)
+        response = self.url_open('/chartly/send_message_stream', data=json.dumps(body), headers={'Content-Type': 'text/plain'})
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(self.chat.messages)
+
+        response = self.url_open('/chartly/send_message_stream', data=json.dumps({}), headers={'Content-Type': 'application/json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Missing required parameters', response.text)
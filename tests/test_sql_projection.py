@@ -0,0 +1,58 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.sql_projection import get_output_columns, project_columns
+from odoo.addons.chartly.core.execute_query import execute_query, describe_query
+
+@tagged('unit', 'sql_projection')
+class TestSqlProjection(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.env['res.partner'].create({
+            'name': 'Projection Partner',
+            'email': 'projection@example.com'
+        })
+
+    def test_output_columns(self):
+        sql = "SELECT rp.id AS customer_id, rp.name AS customer_name, rp.email FROM res_partner rp"
+        self.assertEqual(get_output_columns(sql), ["customer_id", "customer_name", "email"])
+        self.assertIsNone(get_output_columns("SELECT * FROM res_partner"))
+
+    def test_unaliased_expressions(self):
+        sql = "SELECT partner_id, SUM(amount_total), COUNT(*) FROM account_move GROUP BY partner_id"
+        self.assertEqual(get_output_columns(sql), ["partner_id", "sum", "count"])
+        projected = project_columns(sql, ["partner_id", "sum"])
+        self.assertEqual(get_output_columns(projected), ["partner_id", "sum"])
+        self.assertIn("SUM(amount_total)", projected)
+
+        sql = "SELECT date_trunc('month', invoice_date), COUNT(*) FROM account_move GROUP BY 1"
+        self.assertEqual(get_output_columns(sql), ["date_trunc", "count"])
+        self.assertEqual(get_output_columns("SELECT name::text, (email) FROM res_partner"), ["name", "email"])
+        # Postgres names these "?column?"
+        self.assertIsNone(get_output_columns("SELECT 1 + 2, name FROM res_partner"))
+        self.assertIsNone(project_columns(sql, [""]))
+
+    def test_aggregates_are_not_dropped_without_group_by(self):
+        sql = "SELECT 'all' AS label, COUNT(*) AS total FROM res_partner WHERE name = 'Projection Partner'"
+        result = execute_query(self.env, project_columns(sql, ["label"]))
+        self.assertEqual(result["data"].to_dicts(), [{"label": "all"}])
+
+    def test_unused_columns_are_dropped(self):
+        sql = "SELECT rp.id AS customer_id, rp.name AS customer_name, rp.email FROM res_partner rp WHERE rp.name LIKE 'Projection%'"
+        projected = project_columns(sql, ["customer_name"])
+        self.assertEqual(get_output_columns(projected), ["customer_name"])
+        result = execute_query(self.env, projected)
+        self.assertEqual(result["data"].to_dicts(), [{"customer_name": "Projection Partner"}])
+
+    def test_ordered_alias_is_kept_through_subquery(self):
+        sql = "SELECT name, email FROM res_partner ORDER BY email LIMIT 5"
+        projected = project_columns(sql, ["name"])
+        self.assertIn("chartly_result", projected)
+        result = execute_query(self.env, projected)
+        self.assertEqual(list(result["data"][0].keys()), ["name"])
+
+    def test_star_query(self):
+        sql = "SELECT * FROM res_partner WHERE name = 'Projection Partner'"
+        self.assertIn("email", describe_query(self.env, sql)["columns"])
+        result = execute_query(self.env, project_columns(sql, ["name", "email"]))
+        self.assertEqual(result["data"].to_dicts(), [{"name": "Projection Partner", "email": "projection@example.com"}])
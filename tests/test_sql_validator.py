@@ -0,0 +1,66 @@
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core import sql_validator
+from odoo.addons.chartly.core.sql_validator import validate_query
+
+@tagged('unit', 'sql_validator')
+class TestSqlValidator(TransactionCase):
+
+    def test_select_over_allowed_tables(self):
+        sql = """
+        WITH totals AS (SELECT partner_id, SUM(amount_total) AS total FROM account_move GROUP BY partner_id)
+        SELECT rp.name, totals.total FROM totals JOIN public.res_partner rp ON rp.id = totals.partner_id
+        """
+        verdict = validate_query(sql)
+        self.assertTrue(verdict.formatted)
+        self.assertTrue(verdict.safe)
+        self.assertIsNone(verdict.reason)
+
+    def test_rejected_queries(self):
+        queries = [
+            "SELECT * INTO partner_copy FROM res_partner",
+            "SELECT * FROM res_partner FOR UPDATE",
+            "SELECT usename FROM pg_catalog.pg_user",
+            "SELECT name FROM res_partner UNION SELECT login FROM res_users",
+            "SELECT dblink_exec('dbname=x', 'DROP TABLE res_partner')",
+            "SELECT name FROM res_partner /* hidden */",
+        ]
+        for sql in queries:
+            with self.subTest(sql=sql):
+                verdict = validate_query(sql)
+                self.assertTrue(verdict.formatted)
+                self.assertFalse(verdict.safe)
+                self.assertTrue(verdict.reason)
+
+    def test_cte_cannot_shadow_forbidden_tables(self):
+        queries = [
+            "WITH res_users AS (SELECT * FROM res_users) SELECT login, password FROM res_users",
+            "WITH ir_config_parameter AS (SELECT * FROM ir_config_parameter) SELECT value FROM ir_config_parameter",
+            "WITH a AS (SELECT * FROM res_partner), b AS (SELECT * FROM c), c AS (SELECT * FROM res_users) SELECT * FROM b",
+            "WITH account_move AS (SELECT 1) SELECT * FROM account_move",
+            "SELECT * FROM (WITH x AS (SELECT id FROM res_partner) SELECT * FROM x) s JOIN x ON true",
+        ]
+        for sql in queries:
+            with self.subTest(sql=sql):
+                self.assertFalse(validate_query(sql).safe)
+
+    def test_scoped_ctes_and_case(self):
+        queries = [
+            "WITH RECURSIVE tree AS (SELECT id, parent_id FROM account_group UNION ALL SELECT g.id, g.parent_id FROM account_group g JOIN tree t ON g.parent_id = t.id) SELECT * FROM tree",
+            "WITH a AS (SELECT id FROM res_partner), b AS (SELECT * FROM a) SELECT * FROM b",
+            "SELECT name FROM RES_PARTNER",
+        ]
+        for sql in queries:
+            with self.subTest(sql=sql):
+                self.assertTrue(validate_query(sql).safe)
+
+    def test_malformed_query(self):
+        verdict = validate_query("SELECT name FROM")
+        self.assertFalse(verdict.formatted)
+        self.assertFalse(verdict.safe)
+
+    def test_verdict_is_memoized(self):
+        sql = "SELECT name FROM res_partner WHERE id = 42"
+        verdict = validate_query(sql)
+        self.assertIs(validate_query("  SELECT name\n FROM res_partner   WHERE id = 42 "), verdict)
+        self.assertLessEqual(len(sql_validator._verdicts), sql_validator.VERDICT_CACHE_SIZE)
@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.stage_scheduler import StageScheduler
+
+@tagged('unit', 'stage_scheduler')
+class TestStageScheduler(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_stages_get_their_inputs(self):
+        scheduler = StageScheduler(self.executor)
+        scheduler.add("sql", lambda question: f"SQL for {question}", inputs=("question",), inline=True)
+        scheduler.add("data", lambda sql: [1, 2, 3], inputs=("sql",), inline=True)
+        scheduler.add("script", lambda sql: f"plot of {sql}", inputs=("sql",))
+        results = scheduler.run(question="sales")
+        self.assertEqual(results["script"], "plot of SQL for sales")
+        self.assertEqual(results["data"], [1, 2, 3])
+        self.assertEqual(set(scheduler.timings), {"sql", "data", "script"})
+
+    def test_threaded_stages_overlap_inline_ones(self):
+        main_thread = threading.current_thread()
+        threads = {}
+
+        def stage(name, delay):
+            def run(**inputs):
+                threads[name] = threading.current_thread()
+                time.sleep(delay)
+                return name
+            return run
+
+        scheduler = StageScheduler(self.executor)
+        scheduler.add("sql", stage("sql", 0), inline=True)
+        scheduler.add("data", stage("data", 0.2), inputs=("sql",), inline=True)
+        scheduler.add("columns", stage("columns", 0.2), inputs=("sql",))
+        scheduler.add("script", stage("script", 0.2), inputs=("sql",))
+        started = time.monotonic()
+        scheduler.run()
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertIs(threads["data"], main_thread)
+        self.assertIsNot(threads["script"], main_thread)
+        data_start, _ = scheduler.timings["data"]
+        script_start, _ = scheduler.timings["script"]
+        self.assertLess(abs(data_start - script_start), 0.1)
+
+    def test_errors_keep_partial_results(self):
+        def fail(sql):
+            raise ValueError("No data")
+
+        scheduler = StageScheduler(self.executor)
+        scheduler.add("sql", lambda: {"cost": 0.01}, inline=True)
+        scheduler.add("data", fail, inputs=("sql",))
+        with self.assertRaisesRegex(ValueError, "No data"):
+            scheduler.run()
+        self.assertEqual(scheduler.results["sql"], {"cost": 0.01})
+
+    def test_threaded_results_are_kept_when_an_inline_stage_fails(self):
+        def fail(sql):
+            time.sleep(0.1)
+            raise ValueError("Query timeout")
+
+        scheduler = StageScheduler(self.executor)
+        scheduler.add("sql", lambda: {"cost": 0.01}, inline=True)
+        scheduler.add("chart", lambda sql: {"cost": 0.02}, inputs=("sql",))
+        scheduler.add("data", fail, inputs=("sql",), inline=True)
+        with self.assertRaisesRegex(ValueError, "Query timeout"):
+            scheduler.run()
+        self.assertEqual(scheduler.results["chart"], {"cost": 0.02})
+
+    def test_unknown_inputs(self):
+        scheduler = StageScheduler(self.executor)
+        scheduler.add("data", lambda sql: None, inputs=("sql",))
+        with self.assertRaisesRegex(ValueError, "unknown values sql"):
+            scheduler.run()
+        with self.assertRaisesRegex(ValueError, "already defined"):
+            scheduler.add("data", lambda: None)
@@ -0,0 +1,62 @@
+from unittest.mock import patch
+from odoo.tests.common import TransactionCase
+from odoo.tests import tagged
+from odoo.addons.chartly.core.translation_cache import cached_translation, normalize_query
+
+
+class FakeClient:
+    model = "gpt-4.1"
+
+
+@tagged('unit', 'translation_cache')
+class TestTranslationCache(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = FakeClient()
+        self.calls = 0
+
+    def translate(self):
+        self.calls += 1
+        return {"models": ["account.move"], "cost": 0.002}
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  Unpaid   invoices by Customer? "), "unpaid invoices by customer")
+
+    def test_repeated_query_hits_cache(self):
+        first = cached_translation(self.env, "nl_to_model", self.client, "Unpaid invoices", "v1", self.translate)
+        second = cached_translation(self.env, "nl_to_model", self.client, "unpaid  invoices?", "v1", self.translate)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first["cost"], 0.002)
+        self.assertEqual(second["cost"], 0)
+        self.assertEqual(second["models"], ["account.move"])
+
+        stats = self.env["chartly.translation.cache"].get_stats()
+        self.assertEqual(stats["stages"]["nl_to_model"]["hits"], 1)
+
+    def test_version_change_misses_cache(self):
+        cached_translation(self.env, "nl_to_model", self.client, "Unpaid invoices", "v1", self.translate)
+        cached_translation(self.env, "nl_to_model", self.client, "Unpaid invoices", "v2", self.translate)
+        self.assertEqual(self.calls, 2)
+
+    def test_lru_eviction(self):
+        self.env["ir.config_parameter"].sudo().set_param("chartly.translation_cache_size", 2)
+        for query in ["q1", "q2", "q3"]:
+            cached_translation(self.env, "nl_to_model", self.client, query, "v1", self.translate)
+        self.assertEqual(self.env["chartly.translation.cache"].search_count([]), 2)
+
+    def test_store_upserts_existing_key(self):
+        Cache = self.env["chartly.translation.cache"]
+        Cache.store("key", "nl_to_model", {"models": ["account.move"]})
+        Cache.store("key", "nl_to_model", {"models": ["res.partner"]})
+        self.assertEqual(Cache.search_count([("key", "=", "key")]), 1)
+        self.assertEqual(Cache.lookup("key"), {"models": ["res.partner"]})
+        self.assertEqual(Cache.search([("key", "=", "key")]).hit_count, 1)
+
+    def test_cache_failures_do_not_fail_translation(self):
+        Cache = type(self.env["chartly.translation.cache"])
+        with patch.object(Cache, "lookup", side_effect=RuntimeError("cache down")), \
+                patch.object(Cache, "store", side_effect=RuntimeError("cache down")):
+            result = cached_translation(self.env, "nl_to_model", self.client, "Unpaid invoices", "v1", self.translate)
+        self.assertEqual(result["models"], ["account.move"])
+        self.assertEqual(self.calls, 1)
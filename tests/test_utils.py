@@ -1,6 +1,6 @@
 from odoo.tests.common import TransactionCase
 from odoo.tests import tagged
-from odoo.addons.chartly.core.utils import extract_script_as_fct
+from odoo.addons.chartly.core.utils import extract_script_as_fct, check_code, compile_script, get_script_cache_stats
 
 @tagged('unit', 'utils')
 class TestSafeDomainEval(TransactionCase):
@@ -12,4 +12,115 @@ def calculate(a, b):
         """
         func = extract_script_as_fct(script, "calculate")
         result = func(2, 3)
-        self.assertEqual(result, 5)
\ No newline at end of file
+        self.assertEqual(result, 5)
+
+    def test_plot_script_is_allowed(self):
+        script = """
+import matplotlib.pyplot as plt
+import base64
+from io import BytesIO
+
+def build_plot(data):
+    fig, ax = plt.subplots()
+    ax.bar([str(v) for v in data.column("name")], data.column("total"))
+    plt.tight_layout()
+    buffer = BytesIO()
+    plt.savefig(buffer, format="png")
+    plt.close(fig)
+    return base64.b64encode(buffer.getvalue()).decode()
+        """
+        verdict = check_code(script)
+        self.assertTrue(verdict.valid)
+        self.assertTrue(verdict.safe)
+        self.assertIs(check_code(script), verdict)
+
+    def test_common_plot_code_is_allowed(self):
+        script = """
+import matplotlib.pyplot as plt
+import matplotlib.ticker as mticker
+import numpy as np
+import base64
+from io import BytesIO
+from collections import defaultdict
+
+def build_plot(data):
+    totals = defaultdict(float)
+    for row in data:
+        totals[str(row["month"])] += row["total"] or 0
+    labels = sorted(totals.keys())
+    values = np.array([totals[label] for label in labels])
+    fig, ax = plt.subplots(figsize=(10, 6))
+    bars = ax.bar(labels, values, color="steelblue")
+    ax.bar_label(bars, fmt="%.0f")
+    ax.set_title("Total per month")
+    ax.yaxis.set_major_formatter(mticker.StrMethodFormatter("{x:,.0f}"))
+    fig.autofmt_xdate()
+    plt.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=100)
+    plt.close(fig)
+    buffer.seek(0)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+"""
+        verdict = check_code(script)
+        self.assertTrue(verdict.safe, verdict.reason)
+
+    def test_unsafe_scripts_are_rejected(self):
+        scripts = [
+            "import os",
+            "from subprocess import run",
+            "from . import models",
+            "open('/etc/passwd')",
+            "__import__('os')",
+            "getattr(plt, 'savefig')",
+            "x = ().__class__.__bases__",
+            "import matplotlib.pyplot as plt\nplt.os.system('ls')",
+            "import io\nio.open('/etc/passwd')",
+            "from io import open as o\no('/etc/passwd')",
+            "import matplotlib.pyplot as plt\nplt.os.remove('/tmp/x')",
+            "import matplotlib.pyplot as plt\nkey = plt.os.environ['HOME']",
+            "import numpy as np\nnp.savetxt('/tmp/x', [1])",
+            "import numpy as np\nnp.load('/tmp/x.npy')",
+            "import numpy as np\nnp.array([1]).tofile('/tmp/x')",
+            "import numpy\nnumpy.ctypeslib.ctypes.CDLL('libc.so.6')",
+            "from numpy import ctypeslib",
+            "import matplotlib.pyplot as plt\nplt.savefig('/tmp/x.png')",
+            "import matplotlib.pyplot as plt\nsave = plt.savefig",
+            "read = open",
+            "import numpy as np\nnp.array([1]).dump('/tmp/pwn')",
+            "import numpy as np\nnp.lib.format.open_memmap('/tmp/x', mode='w+', shape=(1,))",
+            "from matplotlib.backends.backend_pdf import PdfPages\nPdfPages('/tmp/x.pdf')",
+            "import matplotlib.pyplot as plt\nfrom io import BytesIO\nbuf = BytesIO()\nbuf = '/tmp/evil.png'\nplt.savefig(buf)",
+            "import matplotlib.pyplot as plt\nBytesIO = lambda: '/tmp/evil.png'\nbuf = BytesIO()\nplt.savefig(buf)",
+            "import matplotlib.pyplot as plt\nfrom io import BytesIO\ndef build_plot(buf=BytesIO()):\n    plt.savefig(buf)",
+        ]
+        for script in scripts:
+            with self.subTest(script=script):
+                verdict = check_code(script)
+                self.assertTrue(verdict.valid)
+                self.assertFalse(verdict.safe)
+                with self.assertRaises(ValueError):
+                    extract_script_as_fct(script)
+
+    def test_invalid_script_is_rejected(self):
+        self.assertFalse(check_code("def build_plot(:").valid)
+        with self.assertRaisesRegex(ValueError, "Invalid Python syntax"):
+            extract_script_as_fct("def build_plot(:")
+
+    def test_compiled_script_is_reused(self):
+        script = "def build_plot(data):\n    return len(data)\n"
+        before = get_script_cache_stats()
+        compiled = compile_script(f"```python\n{script}```")
+        self.assertIs(compile_script(script), compiled)
+        after = get_script_cache_stats()
+        self.assertEqual(after["hits"], before["hits"] + 1)
+        self.assertEqual(after["misses"], before["misses"] + 1)
+        # Each extraction still gets its own namespace
+        self.assertIsNot(extract_script_as_fct(script), extract_script_as_fct(script))
+        self.assertEqual(extract_script_as_fct(script)([1, 2]), 2)
+
+    def test_unsafe_script_is_not_cached(self):
+        with self.assertRaises(ValueError):
+            compile_script("import subprocess")
+        with self.assertRaises(ValueError):
+            compile_script("import subprocess")